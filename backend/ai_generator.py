@@ -1,6 +1,35 @@
-from typing import Any, Dict, List, Optional
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import anthropic
+import httpx
+from semantic_cache import SemanticCache
+
+
+@lru_cache(maxsize=4)
+def get_client(api_key: str, base_url: Optional[str] = None) -> anthropic.Anthropic:
+    """Return a shared client per API endpoint so its connection pool is reused"""
+    return anthropic.Anthropic(
+        api_key=api_key,
+        base_url=base_url,
+        # Every call made through this client retries via
+        # AIGenerator._call_with_retry, so the SDK's own retries are off
+        max_retries=0,
+        http_client=anthropic.DefaultHttpxClient(
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+        ),
+    )
+
+
+class FallbackResponse(str):
+    """Apology text returned in place of an answer when generation fails
+
+    It displays like any answer, but callers should not cache it.
+    """
 
 
 class AIGenerator:
@@ -42,9 +71,38 @@ All responses must be:
 Provide only the direct answer to what was asked.
 """
 
-    def __init__(self, api_key: str, model: str):
-        self.client = anthropic.Anthropic(api_key=api_key)
+    # Static prompt block marked as a cache breakpoint so Anthropic reuses the prefix
+    SYSTEM_BLOCK = {
+        "type": "text",
+        "text": SYSTEM_PROMPT,
+        "cache_control": {"type": "ephemeral"},
+    }
+
+    # Shared, never mutated tool_choice value for tool-enabled calls
+    _TOOL_CHOICE_AUTO = {"type": "auto"}
+
+    # Runs one round's tool calls concurrently; built once and shared
+    _TOOL_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="tool-call")
+
+    # Retry policy for rate limits, connection failures and transient server errors
+    MAX_ATTEMPTS = 4
+    MAX_BACKOFF_SECONDS = 30
+
+    # Rough characters-per-token ratio used to budget conversation history
+    CHARS_PER_TOKEN = 4
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        response_cache: Optional[SemanticCache] = None,
+        max_history_tokens: int = 4000,
+        base_url: Optional[str] = None,
+    ):
+        self.client = get_client(api_key, base_url)
         self.model = model
+        self.response_cache = response_cache
+        self.max_history_tokens = max_history_tokens
 
         # Pre-build base API parameters
         self.base_params = {"model": self.model, "temperature": 0, "max_tokens": 800}
@@ -69,34 +127,270 @@ Provide only the direct answer to what was asked.
             Generated response as string
         """
 
-        # Build system content efficiently - avoid string ops when possible
-        system_content = (
-            f"{self.SYSTEM_PROMPT}\n\nPrevious conversation:\n{conversation_history}"
-            if conversation_history
-            else self.SYSTEM_PROMPT
-        )
+        # Serve semantically equivalent repeat questions without an API call
+        if self.response_cache:
+            cached = self.response_cache.lookup(query, conversation_history, tools)
+            if cached is not None:
+                return cached
 
-        # Prepare API call parameters efficiently
-        api_params = {
-            **self.base_params,
-            "messages": [{"role": "user", "content": query}],
-            "system": system_content,
-        }
-
-        # Add tools if available
-        if tools:
-            api_params["tools"] = tools
-            api_params["tool_choice"] = {"type": "auto"}
+        api_params = self._build_request(query, conversation_history, tools)
 
         # Get response from Claude
-        response = self.client.messages.create(**api_params)
+        response = self._create_with_retry(**api_params)
 
         # Handle tool execution if needed
         if response.stop_reason == "tool_use" and tool_manager:
             return self._handle_tool_execution(response, api_params, tool_manager)
 
         # Return direct response
-        return response.content[0].text
+        text = response.content[0].text
+        if self.response_cache:
+            self.response_cache.store(query, text, conversation_history, tools)
+        return text
+
+    def generate_responses_batch(
+        self,
+        queries: List[str],
+        conversation_history: Optional[str] = None,
+        tools: Optional[List] = None,
+        tool_manager=None,
+        poll_interval: float = 1.0,
+        max_poll_interval: float = 30.0,
+    ) -> List[str]:
+        """
+        Answer several independent queries through the Message Batches API.
+
+        Batched requests are billed at a discount but may take minutes to
+        finish, so this is meant for latency-insensitive callers.
+
+        Args:
+            queries: The user questions to answer
+            conversation_history: Previous messages for context, shared by all queries
+            tools: Available tools the AI can use
+            tool_manager: Manager to execute tools
+            poll_interval: Initial delay between batch status checks in seconds
+            max_poll_interval: Upper bound for the exponential polling backoff
+
+        Returns:
+            Generated responses, in the same order as the queries
+        """
+        responses: List[Optional[str]] = [None] * len(queries)
+
+        # Build one request per query not already answered by the cache
+        params_by_id: Dict[str, Dict[str, Any]] = {}
+        index_by_id: Dict[str, int] = {}
+        for index, query in enumerate(queries):
+            if self.response_cache:
+                responses[index] = self.response_cache.lookup(
+                    query, conversation_history, tools
+                )
+                if responses[index] is not None:
+                    continue
+
+            custom_id = f"query-{index}"
+            params_by_id[custom_id] = self._build_request(
+                query, conversation_history, tools
+            )
+            index_by_id[custom_id] = index
+
+        if not params_by_id:
+            return responses
+
+        batch = self._call_with_retry(
+            self.client.messages.batches.create,
+            requests=[
+                {"custom_id": custom_id, "params": params}
+                for custom_id, params in params_by_id.items()
+            ],
+        )
+
+        # Poll with exponential backoff until every request has finished
+        delay = poll_interval
+        while batch.processing_status != "ended":
+            time.sleep(delay)
+            delay = min(delay * 2, max_poll_interval)
+            batch = self._call_with_retry(
+                self.client.messages.batches.retrieve, batch.id
+            )
+
+        results = self._call_with_retry(self.client.messages.batches.results, batch.id)
+        for entry in results:
+            index = index_by_id[entry.custom_id]
+            if entry.result.type != "succeeded":
+                responses[index] = FallbackResponse(
+                    "I encountered an error while processing your request: "
+                    f"batch request {entry.result.type}"
+                )
+                continue
+
+            message = entry.result.message
+            if message.stop_reason == "tool_use" and tool_manager:
+                # Tool use needs a second turn, which is done synchronously; a
+                # failure there only loses this entry. Like the sequential path,
+                # tool answers are not cached since the cache keeps no sources
+                try:
+                    responses[index] = self._handle_tool_execution(
+                        message, params_by_id[entry.custom_id], tool_manager
+                    )
+                except Exception as e:
+                    responses[index] = FallbackResponse(
+                        f"I encountered an error while processing your request: {str(e)}"
+                    )
+                continue
+
+            responses[index] = message.content[0].text
+            if self.response_cache:
+                self.response_cache.store(
+                    queries[index], responses[index], conversation_history, tools
+                )
+
+        return responses
+
+    def generate_response_stream(
+        self,
+        query: str,
+        conversation_history: Optional[str] = None,
+        tools: Optional[List] = None,
+        tool_manager=None,
+    ) -> Iterator[str]:
+        """
+        Generate an AI response as text chunks while it is being produced.
+
+        A tool-enabled first call is not streamed, because its full content is
+        needed to dispatch tool_use blocks; the final answer always is.
+
+        Args:
+            query: The user's question or request
+            conversation_history: Previous messages for context
+            tools: Available tools the AI can use
+            tool_manager: Manager to execute tools
+
+        Yields:
+            Response text chunks in order
+        """
+        if self.response_cache:
+            cached = self.response_cache.lookup(query, conversation_history, tools)
+            if cached is not None:
+                yield cached
+                return
+
+        api_params = self._build_request(query, conversation_history, tools)
+
+        if tools:
+            response = self._create_with_retry(**api_params)
+            if response.stop_reason == "tool_use" and tool_manager:
+                yield from self._stream_text(
+                    self._build_tool_followup(response, api_params, tool_manager)
+                )
+                return
+            text = response.content[0].text
+            yield text
+        else:
+            chunks = []
+            for chunk in self._stream_text(api_params):
+                chunks.append(chunk)
+                yield chunk
+            text = "".join(chunks)
+
+        if self.response_cache:
+            self.response_cache.store(query, text, conversation_history, tools)
+
+    def _stream_text(self, api_params: Dict[str, Any]) -> Iterator[str]:
+        """Stream response text chunks for a single API call"""
+        # The request is sent when the stream is entered, so only opening it is
+        # retried; a stream that fails midway would repeat chunks already yielded
+        with ExitStack() as stack:
+            stream = self._call_with_retry(
+                lambda: stack.enter_context(self.client.messages.stream(**api_params))
+            )
+            yield from stream.text_stream
+
+    def _build_request(
+        self,
+        query: str,
+        conversation_history: Optional[str],
+        tools: Optional[List[Dict[str, Any]]],
+    ) -> Dict[str, Any]:
+        """Build API parameters for the first call answering a query"""
+        # System content keeps the static prompt as a cacheable prefix
+        api_params = dict(self.base_params)
+        api_params["messages"] = [{"role": "user", "content": query}]
+        api_params["system"] = self._build_system(conversation_history)
+
+        # Add tools if available
+        if tools:
+            api_params["tools"] = self._build_tools(tools)
+            api_params["tool_choice"] = self._TOOL_CHOICE_AUTO
+        return api_params
+
+    def _create_with_retry(self, **api_params):
+        """Call messages.create, retrying transient failures with backoff"""
+        return self._call_with_retry(self.client.messages.create, **api_params)
+
+    def _call_with_retry(self, call, *args, **kwargs):
+        """Make an API call, retrying transient failures with backoff"""
+        for attempt in range(self.MAX_ATTEMPTS):
+            try:
+                return call(*args, **kwargs)
+            except (anthropic.APIConnectionError, anthropic.APIStatusError) as e:
+                if not self._is_retryable(e) or attempt == self.MAX_ATTEMPTS - 1:
+                    raise
+                time.sleep(self._retry_delay(e, attempt))
+
+    @staticmethod
+    def _is_retryable(error: anthropic.APIError) -> bool:
+        """Whether an error is transient: a dropped connection, timeout, 429 or 5xx"""
+        # APITimeoutError is a connection error; the SDK retried both before
+        # its own retries were switched off
+        if isinstance(error, anthropic.APIConnectionError):
+            return True
+        return isinstance(error, anthropic.RateLimitError) or error.status_code >= 500
+
+    def _retry_delay(self, error: anthropic.APIError, attempt: int) -> float:
+        """Seconds to wait before the next attempt, honouring a capped Retry-After"""
+        retry_after = None
+        if isinstance(error, anthropic.APIStatusError):
+            retry_after = error.response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return min(float(retry_after), self.MAX_BACKOFF_SECONDS)
+            except ValueError:
+                pass
+        return min(2**attempt, self.MAX_BACKOFF_SECONDS) + random.random()
+
+    def _build_system(
+        self, conversation_history: Optional[str]
+    ) -> List[Dict[str, Any]]:
+        """Build system blocks, keeping per-session history after the cached prefix"""
+        if not conversation_history:
+            return [self.SYSTEM_BLOCK]
+        history = self._trim_history(conversation_history)
+        return [
+            self.SYSTEM_BLOCK,
+            {"type": "text", "text": f"Previous conversation:\n{history}"},
+        ]
+
+    def _trim_history(self, conversation_history: str) -> str:
+        """Drop the oldest history lines until it fits the token budget"""
+        # A local estimate avoids a count_tokens round trip on every request
+        max_chars = self.max_history_tokens * self.CHARS_PER_TOKEN
+        if len(conversation_history) <= max_chars:
+            return conversation_history
+
+        lines = conversation_history.split("\n")
+        length = len(conversation_history)
+        start = 0
+        while length > max_chars and start < len(lines) - 1:
+            length -= len(lines[start]) + 1
+            start += 1
+
+        # A single oversized line keeps only its most recent text
+        return "\n".join(lines[start:])[-max_chars:]
+
+    @staticmethod
+    def _build_tools(tools: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Copy tool definitions, marking the last one as a cache breakpoint"""
+        return [*tools[:-1], {**tools[-1], "cache_control": {"type": "ephemeral"}}]
 
     def _handle_tool_execution(
         self, initial_response, base_params: Dict[str, Any], tool_manager
@@ -112,8 +406,20 @@ Provide only the direct answer to what was asked.
         Returns:
             Final response text after tool execution
         """
-        # Start with existing messages
-        messages = base_params["messages"].copy()
+        final_params = self._build_tool_followup(
+            initial_response, base_params, tool_manager
+        )
+
+        # Get final response
+        final_response = self._create_with_retry(**final_params)
+        return final_response.content[0].text
+
+    def _build_tool_followup(
+        self, initial_response, base_params: Dict[str, Any], tool_manager
+    ) -> Dict[str, Any]:
+        """Execute requested tools and build the follow-up call without tools"""
+        # Extend the first call's messages in place; its params are not reused
+        messages = base_params["messages"]
 
         # Add AI's tool use response
         messages.append({"role": "assistant", "content": initial_response.content})
@@ -127,11 +433,7 @@ Provide only the direct answer to what was asked.
                 )
 
                 tool_results.append(
-                    {
-                        "type": "tool_result",
-                        "tool_use_id": content_block.id,
-                        "content": tool_result,
-                    }
+                    self._tool_result_block(content_block.id, tool_result)
                 )
 
         # Add tool results as single message
@@ -139,15 +441,10 @@ Provide only the direct answer to what was asked.
             messages.append({"role": "user", "content": tool_results})
 
         # Prepare final API call without tools
-        final_params = {
-            **self.base_params,
-            "messages": messages,
-            "system": base_params["system"],
-        }
-
-        # Get final response
-        final_response = self.client.messages.create(**final_params)
-        return final_response.content[0].text
+        final_params = dict(self.base_params)
+        final_params["messages"] = messages
+        final_params["system"] = base_params["system"]
+        return final_params
 
     def generate_response_sequential(
         self,
@@ -174,40 +471,52 @@ Provide only the direct answer to what was asked.
         if not tools or not tool_manager:
             return self.generate_response(query, conversation_history)
 
-        # Build system content efficiently - avoid string ops when possible
-        system_content = (
-            f"{self.SYSTEM_PROMPT}\n\nPrevious conversation:\n{conversation_history}"
-            if conversation_history
-            else self.SYSTEM_PROMPT
-        )
+        # Serve semantically equivalent repeat questions without an API call
+        if self.response_cache:
+            cached = self.response_cache.lookup(query, conversation_history, tools)
+            if cached is not None:
+                return cached
+
+        # Build system content with the static prompt as a cacheable prefix
+        system_content = self._build_system(conversation_history)
+
+        # Tool definitions are static too, so they join the cached prefix
+        cached_tools = self._build_tools(tools)
 
         # Initialize conversation state
         messages = [{"role": "user", "content": query}]
         round_count = 0
 
+        # Build the API call once with tools always available; each round only
+        # appends to the messages list it references
+        api_params = dict(
+            self.base_params,
+            messages=messages,
+            system=system_content,
+            tools=cached_tools,
+            tool_choice=self._TOOL_CHOICE_AUTO,
+        )
+
         # Continuous conversation loop
         while True:
-            # Prepare API call with tools always available
-            api_params = {
-                **self.base_params,
-                "messages": messages,
-                "system": system_content,
-                "tools": tools,
-                "tool_choice": {"type": "auto"},
-            }
-
             try:
                 # Get response from Claude
-                response = self.client.messages.create(**api_params)
+                response = self._create_with_retry(**api_params)
 
-                # Check if Claude wants to use tools
-                has_tool_use = any(
-                    block.type == "tool_use" for block in response.content
-                )
+                # Check if Claude wants to use tools, scanning the content once
+                tool_blocks = [
+                    block for block in response.content if block.type == "tool_use"
+                ]
 
-                if not has_tool_use:
+                if not tool_blocks:
                     # Natural termination - Claude gave final answer
-                    return response.content[0].text
+                    text = response.content[0].text
+                    # Only cache direct answers; tool answers carry sources
+                    if self.response_cache and round_count == 0:
+                        self.response_cache.store(
+                            query, text, conversation_history, tools
+                        )
+                    return text
 
                 # Claude wants to use tools - check if we've hit the round limit
                 round_count += 1
@@ -219,7 +528,7 @@ Provide only the direct answer to what was asked.
 
                 # Execute tools and continue conversation
                 tool_execution_success = self._execute_tools_and_update_messages(
-                    response, messages, tool_manager
+                    response, tool_blocks, messages, tool_manager
                 )
 
                 if not tool_execution_success:
@@ -227,10 +536,12 @@ Provide only the direct answer to what was asked.
 
             except Exception as e:
                 # API error - return graceful fallback
-                return f"I encountered an error while processing your request: {str(e)}"
+                return FallbackResponse(
+                    f"I encountered an error while processing your request: {str(e)}"
+                )
 
     def _execute_tools_and_update_messages(
-        self, response, messages: List, tool_manager
+        self, response, tool_blocks: List, messages: List, tool_manager
     ) -> bool:
         """
         Execute tools and update message history for next round.
@@ -241,31 +552,34 @@ Provide only the direct answer to what was asked.
         # Add AI's response to messages
         messages.append({"role": "assistant", "content": response.content})
 
-        # Execute all tool calls
-        tool_results = []
-        for content_block in response.content:
-            if content_block.type == "tool_use":
-                try:
-                    tool_result = tool_manager.execute_tool(
-                        content_block.name, **content_block.input
-                    )
-                    tool_results.append(
-                        {
-                            "type": "tool_result",
-                            "tool_use_id": content_block.id,
-                            "content": tool_result,
-                        }
-                    )
-                except Exception as e:
-                    # Tool execution failed
-                    tool_results.append(
-                        {
-                            "type": "tool_result",
-                            "tool_use_id": content_block.id,
-                            "content": f"Tool execution failed: {str(e)}",
-                        }
-                    )
-                    return False
+        # Tool calls are I/O-bound vector store queries, so different tools run
+        # concurrently; calls to the same tool stay serial and in order, since
+        # a tool keeps only its latest call's sources
+        calls_by_tool: Dict[str, List[int]] = {}
+        for index, block in enumerate(tool_blocks):
+            calls_by_tool.setdefault(block.name, []).append(index)
+
+        def run_calls(indexes: List[int]) -> List[Tuple[str, bool]]:
+            return [self._run_tool(tool_blocks[i], tool_manager) for i in indexes]
+
+        groups = list(calls_by_tool.values())
+        if len(groups) > 1:
+            group_outcomes = self._TOOL_EXECUTOR.map(run_calls, groups)
+        else:
+            group_outcomes = map(run_calls, groups)
+
+        outcome_by_index = {}
+        for indexes, results in zip(groups, group_outcomes):
+            outcome_by_index.update(zip(indexes, results))
+        outcomes = [outcome_by_index[i] for i in range(len(tool_blocks))]
+
+        # Results line up with the tool_use blocks they answer
+        tool_results = [
+            self._tool_result_block(block.id, content)
+            for block, (content, _) in zip(tool_blocks, outcomes)
+        ]
+        if not all(succeeded for _, succeeded in outcomes):
+            return False
 
         # Add tool results to conversation
         if tool_results:
@@ -273,19 +587,45 @@ Provide only the direct answer to what was asked.
 
         return True
 
-    def _handle_tool_failure(self, messages: List, system_content: str) -> str:
+    @staticmethod
+    def _tool_result_block(tool_use_id: str, content: Any) -> Dict[str, Any]:
+        """Build a tool_result block whose content is always a flat string"""
+        # A plain string encodes as one JSON value instead of nested blocks
+        if not isinstance(content, str):
+            content = str(content)
+        return {"type": "tool_result", "tool_use_id": tool_use_id, "content": content}
+
+    @staticmethod
+    def _run_tool(content_block, tool_manager) -> Tuple[str, bool]:
+        """Execute one tool call, returning its result text and whether it succeeded"""
+        try:
+            return (
+                tool_manager.execute_tool(content_block.name, **content_block.input),
+                True,
+            )
+        except Exception as e:
+            # Tool execution failed
+            return f"Tool execution failed: {str(e)}", False
+
+    def _handle_tool_failure(
+        self, messages: List, system_content: List[Dict[str, Any]]
+    ) -> str:
         """Handle tool execution failures gracefully"""
         try:
             # Try to get a response without tools as fallback
-            fallback_params = {
-                **self.base_params,
-                "messages": messages[:-1],  # Remove failed tool result
-                "system": system_content,
-            }
-            fallback_response = self.client.messages.create(**fallback_params)
-            return fallback_response.content[0].text
+            # Drop the unanswered tool_use turn in place; the loop is over, so
+            # the list is not needed afterwards and no copy is made
+            messages.pop()
+            fallback_params = dict(self.base_params)
+            fallback_params["messages"] = messages
+            fallback_params["system"] = system_content
+            fallback_response = self._create_with_retry(**fallback_params)
+            # Answered without the failed tool's data, so still a fallback
+            return FallbackResponse(fallback_response.content[0].text)
         except:
-            return "I encountered an error while processing your request. Please try again."
+            return FallbackResponse(
+                "I encountered an error while processing your request. Please try again."
+            )
 
     def _handle_forced_termination(self, response, reason: str) -> str:
         """Handle cases where loop terminates due to limits"""
@@ -294,9 +634,11 @@ Provide only the direct answer to what was asked.
             text_blocks = [block for block in response.content if block.type == "text"]
             if text_blocks:
                 return text_blocks[0].text
-            return "I've reached the maximum number of tool usage rounds. Please refine your query."
+            return FallbackResponse(
+                "I've reached the maximum number of tool usage rounds. Please refine your query."
+            )
 
         # Default case - return best available response
-        return (
-            response.content[0].text if response.content else "No response available."
-        )
+        if response.content:
+            return response.content[0].text
+        return FallbackResponse("No response available.")
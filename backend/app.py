@@ -6,7 +6,7 @@ import os
 from typing import List, Optional
 
 from config import config
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.staticfiles import StaticFiles
@@ -33,6 +33,12 @@ app.add_middleware(
 rag_system = RAGSystem(config)
 
 
+async def get_rag_system() -> RAGSystem:
+    """Endpoint dependency for the shared RAG system (tests override it)"""
+    # Async so FastAPI resolves it inline rather than in its threadpool
+    return rag_system
+
+
 # Pydantic models for request/response
 class QueryRequest(BaseModel):
     """Request model for course queries"""
@@ -73,7 +79,9 @@ class CourseStats(BaseModel):
 
 
 @app.post("/api/query", response_model=QueryResponse)
-async def query_documents(request: QueryRequest):
+async def query_documents(
+    request: QueryRequest, rag_system: RAGSystem = Depends(get_rag_system)
+):
     """Process a query and return response with sources"""
     try:
         # Create session if not provided
@@ -81,8 +89,8 @@ async def query_documents(request: QueryRequest):
         if not session_id:
             session_id = rag_system.session_manager.create_session()
 
-        # Process query using RAG system
-        answer, sources = rag_system.query(request.query, session_id)
+        # Process query using RAG system, off the event loop
+        answer, sources = await rag_system.aquery(request.query, session_id)
 
         return QueryResponse(answer=answer, sources=sources, session_id=session_id)
     except Exception as e:
@@ -90,7 +98,7 @@ async def query_documents(request: QueryRequest):
 
 
 @app.get("/api/courses", response_model=CourseStats)
-async def get_course_stats():
+async def get_course_stats(rag_system: RAGSystem = Depends(get_rag_system)):
     """Get course analytics and statistics"""
     try:
         analytics = rag_system.get_course_analytics()
@@ -103,7 +111,9 @@ async def get_course_stats():
 
 
 @app.post("/api/new-chat")
-async def new_chat(request: NewChatRequest):
+async def new_chat(
+    request: NewChatRequest, rag_system: RAGSystem = Depends(get_rag_system)
+):
     """Clear session history and start a new chat"""
     try:
         if request.session_id:
@@ -23,6 +23,13 @@ class Config:
     CHUNK_OVERLAP: int = 100  # Characters to overlap between chunks
     MAX_RESULTS: int = 5  # Maximum search results to return
     MAX_HISTORY: int = 2  # Number of conversation messages to remember
+    MAX_QUERY_LENGTH: int = 2000  # Longer queries are rejected before calling Claude
+
+    # Response cache settings
+    SEMANTIC_CACHE_THRESHOLD: float = 0.92  # Cosine similarity for a cache hit
+    SEMANTIC_CACHE_SIZE: int = 1000  # Maximum cached responses
+    RESPONSE_CACHE_TTL: int = 3600  # Seconds an exact-repeat answer stays valid
+    RESPONSE_CACHE_SIZE: int = 500  # Maximum exact-repeat answers kept
 
     # Database paths
     CHROMA_PATH: str = "./chroma_db"  # ChromaDB storage location
@@ -1,13 +1,33 @@
+import asyncio
 import os
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple, Union
 
-from ai_generator import AIGenerator
+from ai_generator import AIGenerator, FallbackResponse
 from document_processor import DocumentProcessor
 from models import Course, CourseChunk, Lesson
-from search_tools import CourseOutlineTool, CourseSearchTool, ToolManager
+from rag_system_cache import ResponseCache
+from search_tools import (
+    CourseOutlineTool,
+    CourseSearchTool,
+    RequestToolManager,
+    ToolManager,
+)
+from semantic_cache import SemanticCache
 from session_manager import SessionManager
 from vector_store import VectorStore
 
+# Replies for trivial messages that don't need a Claude call
+CANNED_RESPONSES = {
+    "hi": "Hello! Ask me anything about the course materials.",
+    "hello": "Hello! Ask me anything about the course materials.",
+    "hey": "Hello! Ask me anything about the course materials.",
+    "thanks": "You're welcome! Let me know if you have other questions.",
+    "thank you": "You're welcome! Let me know if you have other questions.",
+}
+
+# Prepended to every user query sent to Claude
+QUERY_PROMPT_PREFIX = "Answer this question about course materials: "
+
 
 class RAGSystem:
     """Main orchestrator for the Retrieval-Augmented Generation system"""
@@ -22,11 +42,27 @@ class RAGSystem:
         self.vector_store = VectorStore(
             config.CHROMA_PATH, config.EMBEDDING_MODEL, config.MAX_RESULTS
         )
+        self.semantic_cache = SemanticCache(
+            self.vector_store.embedding_function,
+            threshold=config.SEMANTIC_CACHE_THRESHOLD,
+            max_size=config.SEMANTIC_CACHE_SIZE,
+            prompt_prefix=QUERY_PROMPT_PREFIX,
+        )
         self.ai_generator = AIGenerator(
-            config.ANTHROPIC_API_KEY, config.ANTHROPIC_MODEL
+            config.ANTHROPIC_API_KEY,
+            config.ANTHROPIC_MODEL,
+            response_cache=self.semantic_cache,
         )
         self.session_manager = SessionManager(config.MAX_HISTORY)
 
+        # Exact repeats are answered from here; dropped along with the semantic
+        # cache when course data changes
+        self.response_cache = ResponseCache(
+            ttl_seconds=config.RESPONSE_CACHE_TTL,
+            max_size=config.RESPONSE_CACHE_SIZE,
+        )
+        self._cache_generation = None
+
         # Initialize search tools
         self.tool_manager = ToolManager()
         self.search_tool = CourseSearchTool(self.vector_store)
@@ -132,28 +168,81 @@ class RAGSystem:
         Returns:
             Tuple of (response, sources list - empty for tool-based approach)
         """
-        # Create prompt for the AI with clear instructions
-        prompt = f"""Answer this question about course materials: {query}"""
+        return self._answer(query, session_id, self.tool_manager)
+
+    async def aquery(
+        self, query: str, session_id: Optional[str] = None
+    ) -> Tuple[str, List[str]]:
+        """
+        Process a query without blocking the event loop.
+
+        Each call runs in a worker thread and records sources on its own view
+        of the shared tools, so concurrent calls overlap their Claude and
+        vector store round trips while keeping their sources apart.
+
+        Args:
+            query: User's question
+            session_id: Optional session ID for conversation context
+
+        Returns:
+            Tuple of (response, sources list)
+        """
+        return await asyncio.to_thread(
+            self._answer, query, session_id, self.tool_manager.for_request()
+        )
+
+    def _answer(
+        self,
+        query: str,
+        session_id: Optional[str],
+        tool_manager: Union[ToolManager, RequestToolManager],
+    ) -> Tuple[str, List[str]]:
+        """Answer a query, using and then resetting the given tools' sources"""
+        # Answer degenerate inputs directly without a Claude call
+        direct_response = self._direct_response(query)
+        if direct_response is not None:
+            return direct_response, []
 
         # Get conversation history if session exists
         history = None
         if session_id:
             history = self.session_manager.get_conversation_history(session_id)
 
+        # Answers built from replaced course data are stale
+        if self.vector_store.generation != self._cache_generation:
+            self.response_cache.clear()
+            self.semantic_cache.clear()
+            self._cache_generation = self.vector_store.generation
+
+        # Serve an exact repeat without calling Claude
+        cached = self.response_cache.get(query, history)
+        if cached is not None:
+            response, sources = cached
+            if session_id:
+                self.session_manager.add_exchange(session_id, query, response)
+            return response, sources
+
+        # Create prompt for the AI with clear instructions
+        prompt = QUERY_PROMPT_PREFIX + query
+
         # Generate response using AI with sequential tools
         response = self.ai_generator.generate_response_sequential(
             query=prompt,
             conversation_history=history,
-            tools=self.tool_manager.get_tool_definitions(),
-            tool_manager=self.tool_manager,
+            tools=tool_manager.get_tool_definitions(),
+            tool_manager=tool_manager,
             max_rounds=2,
         )
 
         # Get sources from the search tool
-        sources = self.tool_manager.get_last_sources()
+        sources = tool_manager.get_last_sources()
 
         # Reset sources after retrieving them
-        self.tool_manager.reset_sources()
+        tool_manager.reset_sources()
+
+        # A failed generation must not be served back for the whole TTL
+        if not isinstance(response, FallbackResponse):
+            self.response_cache.set(query, response, sources, history)
 
         # Update conversation history
         if session_id:
@@ -162,6 +251,18 @@ class RAGSystem:
         # Return response with sources from tool searches
         return response, sources
 
+    def _direct_response(self, query: str) -> Optional[str]:
+        """Return a fixed reply for empty, oversized or trivial queries"""
+        stripped = query.strip()
+        if not stripped:
+            return "Please enter a question."
+        if len(stripped) > self.config.MAX_QUERY_LENGTH:
+            return (
+                f"Your question is too long. Please keep it under "
+                f"{self.config.MAX_QUERY_LENGTH} characters."
+            )
+        return CANNED_RESPONSES.get(stripped.lower().rstrip("!.?"))
+
     def get_course_analytics(self) -> Dict:
         """Get analytics about the course catalog"""
         return {
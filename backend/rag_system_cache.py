@@ -0,0 +1,65 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+
+class ResponseCache:
+    """Serves stored answers and sources for exact repeat queries"""
+
+    def __init__(self, ttl_seconds: float = 3600, max_size: int = 500):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+
+        # key -> (stored_at, response, sources), least recently used first
+        self._entries: "OrderedDict[str, Tuple[float, str, List]]" = OrderedDict()
+        # RAGSystem.aquery reads and writes from worker threads
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(query: str, conversation_history: Optional[str] = None) -> str:
+        """Hash the normalized query with the history that shapes its answer"""
+        normalized = " ".join(query.lower().split())
+        payload = f"{normalized}\0{conversation_history or ''}"
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(
+        self, query: str, conversation_history: Optional[str] = None
+    ) -> Optional[Tuple[str, List]]:
+        """Return the cached (response, sources) for a query, if still fresh"""
+        key = self.key(query, conversation_history)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            stored_at, response, sources = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+        # Hand out a copy so callers can't edit the cached sources
+        return response, list(sources)
+
+    def set(
+        self,
+        query: str,
+        response: str,
+        sources: List,
+        conversation_history: Optional[str] = None,
+    ):
+        """Cache an answer, evicting the least recently used entry when full"""
+        key = self.key(query, conversation_history)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), response, list(sources))
+            self._entries.move_to_end(key)
+
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all cached answers"""
+        with self._lock:
+            self._entries.clear()
@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Optional, Protocol
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Protocol, Tuple, runtime_checkable
 
 from vector_store import SearchResults, VectorStore
 
@@ -18,6 +19,17 @@ class Tool(ABC):
         pass
 
 
+@runtime_checkable
+class SourceProvider(Protocol):
+    """Tool that records UI sources from its last execution"""
+
+    last_sources: list
+
+    def execute_with_sources(self, **kwargs) -> Tuple[str, list]:
+        """Execute without touching last_sources, returning the sources instead"""
+        ...
+
+
 class CourseSearchTool(Tool):
     """Tool for searching course content with semantic course name matching"""
 
@@ -67,7 +79,18 @@ class CourseSearchTool(Tool):
         Returns:
             Formatted search results or error message
         """
+        result, sources = self.execute_with_sources(query, course_name, lesson_number)
+        if sources:
+            self.last_sources = sources
+        return result
 
+    def execute_with_sources(
+        self,
+        query: str,
+        course_name: Optional[str] = None,
+        lesson_number: Optional[int] = None,
+    ) -> Tuple[str, List[Dict[str, Optional[str]]]]:
+        """Run a search, returning its result text and UI sources"""
         # Use the vector store's unified search interface
         results = self.store.search(
             query=query, course_name=course_name, lesson_number=lesson_number
@@ -75,7 +98,7 @@ class CourseSearchTool(Tool):
 
         # Handle errors
         if results.error:
-            return results.error
+            return results.error, []
 
         # Handle empty results
         if results.is_empty():
@@ -84,20 +107,38 @@ class CourseSearchTool(Tool):
                 filter_info += f" in course '{course_name}'"
             if lesson_number:
                 filter_info += f" in lesson {lesson_number}"
-            return f"No relevant content found{filter_info}."
+            return f"No relevant content found{filter_info}.", []
 
         # Format and return results
         return self._format_results(results)
 
-    def _format_results(self, results: SearchResults) -> str:
-        """Format search results with course and lesson context"""
+    def _format_results(
+        self, results: SearchResults
+    ) -> Tuple[str, List[Dict[str, Optional[str]]]]:
+        """Format search results with course and lesson context, plus sources"""
         formatted = []
         sources = []  # Track sources for the UI
 
-        for doc, meta in zip(results.documents, results.metadata):
-            course_title = meta.get("course_title", "unknown")
-            lesson_num = meta.get("lesson_number")
-
+        # Read each row's metadata once
+        rows = [
+            (doc, meta.get("course_title", "unknown"), meta.get("lesson_number"))
+            for doc, meta in zip(results.documents, results.metadata)
+        ]
+
+        # Fetch every lesson link in one store call instead of one per result
+        link_pairs = [
+            (course_title, lesson_num)
+            for _, course_title, lesson_num in rows
+            if lesson_num is not None and course_title != "unknown"
+        ]
+        lesson_links = {}
+        if link_pairs:
+            try:
+                lesson_links = self.store.get_lesson_links_batch(link_pairs)
+            except Exception as e:
+                print(f"Error getting lesson links: {e}")
+
+        for doc, course_title, lesson_num in rows:
             # Build context header
             header = f"[{course_title}"
             if lesson_num is not None:
@@ -109,17 +150,8 @@ class CourseSearchTool(Tool):
             if lesson_num is not None:
                 source_text += f" - Lesson {lesson_num}"
 
-            # Try to get lesson link if we have lesson number
-            lesson_link = None
-            if lesson_num is not None and course_title != "unknown":
-                try:
-                    lesson_link = self.store.get_lesson_link(course_title, lesson_num)
-                except Exception as e:
-                    print(
-                        f"Error getting lesson link for {course_title} lesson {lesson_num}: {e}"
-                    )
-
             # Create source object with text and optional link
+            lesson_link = lesson_links.get((course_title, lesson_num))
             if lesson_link:
                 source_obj = {"text": source_text, "link": lesson_link}
             else:
@@ -128,10 +160,11 @@ class CourseSearchTool(Tool):
             sources.append(source_obj)
             formatted.append(f"{header}\n{doc}")
 
-        # Store sources for retrieval
-        self.last_sources = sources
+        return "\n\n".join(formatted), sources
 
-        return "\n\n".join(formatted)
+
+class _OutlineMiss(Exception):
+    """Raised for an outline that could not be built, so it is never memoized"""
 
 
 class CourseOutlineTool(Tool):
@@ -141,6 +174,12 @@ class CourseOutlineTool(Tool):
         self.store = vector_store
         self.last_sources = []  # Track sources from last search
 
+        # Course metadata only changes on ingest, so memoize outlines per title
+        # until the store's generation moves on
+        self._title_index: Optional[Dict[str, Dict[str, Any]]] = None
+        self._cached_outline = lru_cache(maxsize=256)(self._build_outline)
+        self._generation = None
+
     def get_tool_definition(self) -> Dict[str, Any]:
         """Return Anthropic tool definition for this tool"""
         return {
@@ -168,32 +207,75 @@ class CourseOutlineTool(Tool):
         Returns:
             Formatted course outline or error message
         """
+        outline, sources = self.execute_with_sources(course_title)
+        if sources:
+            self.last_sources = sources
+        return outline
+
+    def execute_with_sources(
+        self, course_title: str
+    ) -> Tuple[str, List[Dict[str, Optional[str]]]]:
+        """Look up an outline, returning its text and UI source"""
+        # Drop outlines built from data the store has since replaced
+        if self.store.generation != self._generation:
+            self.invalidate_cache()
+            self._generation = self.store.generation
 
-        # Use the vector store's course name resolution for fuzzy matching
-        resolved_title = self.store._resolve_course_name(course_title)
-        if not resolved_title:
-            return f"No course found matching '{course_title}'. Please check the course title and try again."
-
-        # Get course metadata using the resolved title
         try:
-            all_courses = self.store.get_all_courses_metadata()
-            course_data = None
-            for course in all_courses:
-                if course.get("title") == resolved_title:
-                    course_data = course
-                    break
+            outline, source_obj = self._cached_outline(course_title)
+        except _OutlineMiss as e:
+            # The store swallows its own errors, so a miss may be transient
+            return str(e), []
+        except Exception as e:
+            return f"Error retrieving course outline: {str(e)}", []
 
-            if not course_data:
-                return f"Course metadata not found for '{resolved_title}'"
+        # Source for the UI, handed out fresh even when the outline is cached
+        return outline, [source_obj] if source_obj else []
 
-            # Format the course outline
-            return self._format_course_outline(course_data)
+    def invalidate_cache(self):
+        """Drop memoized outlines after course data changes"""
+        self._cached_outline.cache_clear()
+        self._title_index = None
 
-        except Exception as e:
-            return f"Error retrieving course outline: {str(e)}"
+    def _build_outline(
+        self, course_title: str
+    ) -> Tuple[str, Optional[Dict[str, Optional[str]]]]:
+        """Resolve a course title and format its outline with its source"""
+
+        # Use the vector store's course name resolution for fuzzy matching
+        resolved_title = self.store._resolve_course_name(course_title)
+        if not resolved_title:
+            raise _OutlineMiss(
+                f"No course found matching '{course_title}'. Please check the course title and try again."
+            )
+
+        # Get course metadata using the resolved title, re-reading the index on
+        # a miss since it may predate the course or come from a partial read
+        index = self._title_index
+        if not index or resolved_title not in index:
+            index = self._load_title_index()
+        course_data = index.get(resolved_title)
+        if not course_data:
+            raise _OutlineMiss(f"Course metadata not found for '{resolved_title}'")
+
+        # Format the course outline
+        return self._format_course_outline(course_data)
+
+    def _load_title_index(self) -> Dict[str, Dict[str, Any]]:
+        """Read the title -> course metadata index from the store"""
+        index = {
+            course.get("title"): course
+            for course in self.store.get_all_courses_metadata()
+        }
+        # An empty read may be a swallowed store error, so only keep real data
+        if index:
+            self._title_index = index
+        return index
 
-    def _format_course_outline(self, course_data: Dict[str, Any]) -> str:
-        """Format course data into a structured outline"""
+    def _format_course_outline(
+        self, course_data: Dict[str, Any]
+    ) -> Tuple[str, Dict[str, Optional[str]]]:
+        """Format course data into a structured outline and its UI source"""
 
         # Start with course info
         outline_parts = []
@@ -216,7 +298,7 @@ class CourseOutlineTool(Tool):
         else:
             outline_parts.append("\n**Lessons:** No lessons found")
 
-        # Track source for the UI
+        # Build source for the UI
         source_text = course_data.get("title", "Unknown Course")
         course_link = course_data.get("course_link")
         if course_link:
@@ -224,9 +306,7 @@ class CourseOutlineTool(Tool):
         else:
             source_obj = {"text": source_text, "link": None}
 
-        self.last_sources = [source_obj]
-
-        return "\n".join(outline_parts)
+        return "\n".join(outline_parts), source_obj
 
 
 class ToolManager:
@@ -234,6 +314,12 @@ class ToolManager:
 
     def __init__(self):
         self.tools = {}
+        # Definitions are static, so build them once at registration and share
+        # the same list with every request (it is never mutated downstream)
+        self._definitions: Dict[str, Dict[str, Any]] = {}
+        self._definitions_cache: list = []
+        # Tools that track sources, resolved once instead of probed per request
+        self._source_tools: List[SourceProvider] = []
 
     def register_tool(self, tool: Tool):
         """Register any tool that implements the Tool interface"""
@@ -242,28 +328,76 @@ class ToolManager:
         if not tool_name:
             raise ValueError("Tool must have a 'name' in its definition")
         self.tools[tool_name] = tool
+        self._definitions[tool_name] = tool_def
+        self._definitions_cache = list(self._definitions.values())
+        self._source_tools = [
+            tool for tool in self.tools.values() if isinstance(tool, SourceProvider)
+        ]
 
     def get_tool_definitions(self) -> list:
         """Get all tool definitions for Anthropic tool calling"""
-        return [tool.get_tool_definition() for tool in self.tools.values()]
+        return self._definitions_cache
+
+    def for_request(self) -> "RequestToolManager":
+        """View of these tools that keeps one request's sources to itself"""
+        return RequestToolManager(self)
 
     def execute_tool(self, tool_name: str, **kwargs) -> str:
         """Execute a tool by name with given parameters"""
-        if tool_name not in self.tools:
+        tool = self.tools.get(tool_name)
+        if tool is None:
             return f"Tool '{tool_name}' not found"
 
-        return self.tools[tool_name].execute(**kwargs)
+        return tool.execute(**kwargs)
 
     def get_last_sources(self) -> list:
         """Get sources from the last search operation"""
-        # Check all tools for last_sources attribute
-        for tool in self.tools.values():
-            if hasattr(tool, "last_sources") and tool.last_sources:
+        for tool in self._source_tools:
+            if tool.last_sources:
                 return tool.last_sources
         return []
 
     def reset_sources(self):
         """Reset sources from all tools that track sources"""
-        for tool in self.tools.values():
-            if hasattr(tool, "last_sources"):
-                tool.last_sources = []
+        for tool in self._source_tools:
+            tool.last_sources = []
+
+
+class RequestToolManager:
+    """One request's view of a ToolManager: shared tools, private sources
+
+    The tools (and their caches) are shared with every other request, while
+    the sources each call reports are kept here instead of on the tool, so
+    concurrent requests never see each other's sources.
+    """
+
+    def __init__(self, manager: ToolManager):
+        self.manager = manager
+        self._sources: Dict[str, list] = {}
+
+    def get_tool_definitions(self) -> list:
+        """Get all tool definitions for Anthropic tool calling"""
+        return self.manager.get_tool_definitions()
+
+    def execute_tool(self, tool_name: str, **kwargs) -> str:
+        """Execute a tool by name, recording its sources for this request"""
+        tool = self.manager.tools.get(tool_name)
+        if not isinstance(tool, SourceProvider):
+            return self.manager.execute_tool(tool_name, **kwargs)
+
+        result, sources = tool.execute_with_sources(**kwargs)
+        if sources:
+            self._sources[tool_name] = sources
+        return result
+
+    def get_last_sources(self) -> list:
+        """Get sources from this request's last search, in registration order"""
+        for tool_name in self.manager.tools:
+            sources = self._sources.get(tool_name)
+            if sources:
+                return sources
+        return []
+
+    def reset_sources(self):
+        """Forget this request's sources"""
+        self._sources.clear()
@@ -0,0 +1,106 @@
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class SemanticCache:
+    """Serves stored AI responses for semantically similar repeat queries"""
+
+    def __init__(
+        self,
+        embedding_function: Callable[[List[str]], Sequence[Sequence[float]]],
+        threshold: float = 0.92,
+        max_size: int = 1000,
+        prompt_prefix: str = "",
+    ):
+        self.embedding_function = embedding_function
+        self.threshold = threshold
+        self.max_size = max_size
+        # Instructions shared by every prompt would inflate the similarity
+        # of unrelated questions, so only the text after them is embedded
+        self.prompt_prefix = prompt_prefix
+
+        # Ring buffer of L2-normalized rows, so a dot product gives cosine
+        # similarity; allocated at full size once the embedding width is known
+        self._embeddings: Optional[np.ndarray] = None
+        # Parallel to the filled embedding rows: (context_key, response)
+        self._entries: List[Tuple[int, str]] = []
+        # Slot the next store writes to, which holds the oldest entry when full
+        self._next = 0
+
+        # Rows and entries must change together when queries run concurrently
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def context_key(
+        conversation_history: Optional[str], tools: Optional[List[Dict[str, Any]]]
+    ) -> int:
+        """Hash everything besides the query that shapes the response"""
+        tool_names = tuple(tool["name"] for tool in tools or [])
+        return hash((conversation_history, tool_names))
+
+    def lookup(
+        self,
+        query: str,
+        conversation_history: Optional[str] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+    ) -> Optional[str]:
+        """Return a cached response for a similar query in the same context"""
+        vector = self._embed(query)
+        context_key = self.context_key(conversation_history, tools)
+
+        # Score and read entries under one lock so rows can't shift in between
+        with self._lock:
+            if not self._entries:
+                return None
+            scores = self._embeddings[: len(self._entries)] @ vector
+
+            # Best match first; near-duplicates under other contexts don't count
+            for index in np.argsort(scores)[::-1]:
+                if scores[index] <= self.threshold:
+                    break
+                entry_key, response = self._entries[index]
+                if entry_key == context_key:
+                    return response
+        return None
+
+    def store(
+        self,
+        query: str,
+        response: str,
+        conversation_history: Optional[str] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+    ):
+        """Cache a response, evicting the oldest entry when full"""
+        row = self._embed(query)
+        entry = (self.context_key(conversation_history, tools), response)
+        with self._lock:
+            if self._embeddings is None:
+                self._embeddings = np.empty(
+                    (self.max_size, row.shape[0]), dtype=np.float32
+                )
+
+            # Overwrite in place instead of copying the matrix on every insert
+            self._embeddings[self._next] = row
+            if len(self._entries) < self.max_size:
+                self._entries.append(entry)
+            else:
+                self._entries[self._next] = entry
+            self._next = (self._next + 1) % self.max_size
+
+    def clear(self):
+        """Drop all cached responses"""
+        with self._lock:
+            self._embeddings = None
+            self._entries = []
+            self._next = 0
+
+    def _embed(self, query: str) -> np.ndarray:
+        """Embed and L2-normalize a query"""
+        text = query.removeprefix(self.prompt_prefix)
+        vector = np.asarray(self.embedding_function([text])[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector = vector / norm
+        return vector
@@ -1,194 +1,503 @@
 """Shared test fixtures and configurations for RAG system tests"""
 
+import copy
+import functools
 import os
 import sys
-from unittest.mock import MagicMock, Mock, patch
+from dataclasses import dataclass
+from types import MappingProxyType, SimpleNamespace
+from typing import List, Optional
+from unittest.mock import AsyncMock, Mock, patch, seal
 
 import pytest
+from pydantic import BaseModel
 
-# Add backend directory to Python path
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
-
-from ai_generator import AIGenerator
-from config import Config
+# Backend modules that pull in anthropic/chromadb are imported inside the
+# fixtures that use them, so tests that never touch them skip that cost
 from models import Course, CourseChunk, Lesson
-from rag_system import RAGSystem
-from search_tools import CourseSearchTool, ToolManager
-from vector_store import SearchResults
 
 
-@pytest.fixture
-def sample_courses():
-    """Sample course data for testing"""
-    return [
-        Course(
-            title="Introduction to MCP",
-            course_link="https://example.com/mcp-intro",
-            instructor="John Doe",
-            lessons=[
-                Lesson(
-                    lesson_number=1,
-                    title="What is MCP?",
-                    lesson_link="https://example.com/mcp-intro/lesson1",
-                ),
-                Lesson(
-                    lesson_number=2,
-                    title="MCP Architecture",
-                    lesson_link="https://example.com/mcp-intro/lesson2",
-                ),
+# Pydantic models for the test app (same as production), defined once per
+# process so their schemas are not rebuilt by every test_app call
+class QueryRequest(BaseModel):
+    query: str
+    session_id: Optional[str] = None
+
+
+class NewChatRequest(BaseModel):
+    session_id: Optional[str] = None
+
+
+class SourceItem(BaseModel):
+    text: str
+    link: Optional[str] = None
+
+
+class QueryResponse(BaseModel):
+    answer: str
+    sources: List[SourceItem]
+    session_id: str
+
+
+class CourseStats(BaseModel):
+    total_courses: int
+    course_titles: List[str]
+
+
+def pytest_xdist_auto_num_workers(config):
+    """Size `-n auto`, leaving two cores to the runner itself on CI"""
+    if os.environ.get("CI"):
+        return max(1, (os.cpu_count() or 1) - 2)
+    return None  # xdist's own default
+
+
+@pytest.fixture(autouse=True)
+def clear_anthropic_client_cache():
+    """Keep the shared Anthropic client from leaking mocks between tests"""
+    # Nothing to clear until some test has imported the generator
+    ai_generator = sys.modules.get("ai_generator")
+    if ai_generator is not None:
+        ai_generator.get_client.cache_clear()
+    yield
+    ai_generator = sys.modules.get("ai_generator")
+    if ai_generator is not None:
+        ai_generator.get_client.cache_clear()
+
+
+# Canonical sample data, built once at import; fixtures hand out these same
+# tuples instead of rebuilding or copying them, so treat them as read-only
+_COURSES_TEMPLATE = (
+    Course(
+        title="Introduction to MCP",
+        course_link="https://example.com/mcp-intro",
+        instructor="John Doe",
+        lessons=[
+            Lesson(
+                lesson_number=1,
+                title="What is MCP?",
+                lesson_link="https://example.com/mcp-intro/lesson1",
+            ),
+            Lesson(
+                lesson_number=2,
+                title="MCP Architecture",
+                lesson_link="https://example.com/mcp-intro/lesson2",
+            ),
+        ],
+    ),
+    Course(
+        title="Advanced Python",
+        course_link="https://example.com/python-advanced",
+        instructor="Jane Smith",
+        lessons=[
+            Lesson(
+                lesson_number=1,
+                title="Decorators",
+                lesson_link="https://example.com/python/lesson1",
+            ),
+            Lesson(
+                lesson_number=2,
+                title="Metaclasses",
+                lesson_link="https://example.com/python/lesson2",
+            ),
+        ],
+    ),
+)
+
+_COURSE_CHUNKS_TEMPLATE = (
+    CourseChunk(
+        content="MCP (Model Context Protocol) is a standardized way for applications to provide context to AI models.",
+        course_title="Introduction to MCP",
+        lesson_number=1,
+        chunk_index=0,
+    ),
+    CourseChunk(
+        content="The MCP architecture consists of three main components: hosts, clients, and servers.",
+        course_title="Introduction to MCP",
+        lesson_number=2,
+        chunk_index=1,
+    ),
+    CourseChunk(
+        content="Python decorators are a powerful feature that allows you to modify functions or classes.",
+        course_title="Advanced Python",
+        lesson_number=1,
+        chunk_index=0,
+    ),
+)
+
+
+@functools.lru_cache(maxsize=None)
+def _make_results(key: str):
+    """Canonical SearchResults payloads, built once per process and shared
+
+    SearchResults is a plain mutable dataclass, so callers must not modify
+    the returned instances.
+    """
+    from vector_store import SearchResults
+
+    if key == "default":
+        return SearchResults(
+            documents=[
+                "MCP (Model Context Protocol) is a standardized way for applications to provide context to AI models."
+            ],
+            metadata=[{"course_title": "Introduction to MCP", "lesson_number": 1}],
+            distances=[0.2],
+            error=None,
+        )
+    if key == "success":
+        return SearchResults(
+            documents=[
+                "MCP (Model Context Protocol) is a standardized way for applications to provide context to AI models.",
+                "The MCP architecture consists of three main components: hosts, clients, and servers.",
             ],
-        ),
-        Course(
-            title="Advanced Python",
-            course_link="https://example.com/python-advanced",
-            instructor="Jane Smith",
-            lessons=[
-                Lesson(
-                    lesson_number=1,
-                    title="Decorators",
-                    lesson_link="https://example.com/python/lesson1",
-                ),
-                Lesson(
-                    lesson_number=2,
-                    title="Metaclasses",
-                    lesson_link="https://example.com/python/lesson2",
-                ),
+            metadata=[
+                {"course_title": "Introduction to MCP", "lesson_number": 1},
+                {"course_title": "Introduction to MCP", "lesson_number": 2},
             ],
-        ),
-    ]
+            distances=[0.2, 0.3],
+            error=None,
+        )
+    if key == "empty":
+        return SearchResults(documents=[], metadata=[], distances=[], error=None)
+    if key == "error":
+        return SearchResults(
+            documents=[], metadata=[], distances=[], error="Database connection failed"
+        )
+    raise KeyError(f"Unknown search results payload: {key}")
+
+
+# Static API payloads, built once at import like the sample data above and
+# wrapped read-only; pass dict(payload) wherever a real dict is needed
+_SAMPLE_QUERY_REQUEST = MappingProxyType(
+    {"query": "What is MCP?", "session_id": "test_session_123"}
+)
+_SAMPLE_QUERY_RESPONSE = MappingProxyType(
+    {
+        "answer": "MCP stands for Model Context Protocol.",
+        "sources": [
+            {
+                "text": "Introduction to MCP - Lesson 1",
+                "link": "https://example.com/lesson1",
+            }
+        ],
+        "session_id": "test_session_123",
+    }
+)
+_SAMPLE_COURSE_ANALYTICS = MappingProxyType(
+    {
+        "total_courses": 3,
+        "course_titles": ["Introduction to MCP", "Advanced Python", "API Design"],
+    }
+)
+
+# Tool definitions the stubbed RAG tool manager hands out, in registration
+# order; one shared tuple so tests can check it is passed through by identity
+_CANONICAL_TOOL_DEFS = (
+    MappingProxyType({"name": "search_course_content"}),
+    MappingProxyType({"name": "get_course_outline"}),
+)
+
+# Anthropic content blocks for the mocked client responses; plain namespaces
+# are far cheaper than Mock and carry no call tracking we'd need
+_END_TURN_CONTENT = (
+    SimpleNamespace(type="text", text="This is a sample response about MCP."),
+)
+_TOOL_USE_BLOCK = SimpleNamespace(
+    type="tool_use",
+    name="search_course_content",
+    id="tool_123",
+    input={"query": "What is MCP?"},
+)
+_FINAL_CONTENT = (
+    SimpleNamespace(
+        type="text",
+        text="Based on the course content, MCP stands for Model Context Protocol.",
+    ),
+)
+
+# Two-step tool-use exchange: the model asks for a search, then answers
+_INITIAL_RESP = SimpleNamespace(stop_reason="tool_use", content=[_TOOL_USE_BLOCK])
+_FINAL_RESP = SimpleNamespace(stop_reason="end_turn", content=list(_FINAL_CONTENT))
+
+
+def _tool_use_side_effect():
+    """Fresh iterator over the tool-use exchange (side_effect consumes it)"""
+    return iter([_INITIAL_RESP, _FINAL_RESP])
+
+
+@pytest.fixture(scope="session")
+def sample_courses():
+    """Sample course data for testing (shared across the session; do not mutate)"""
+    return _COURSES_TEMPLATE
 
 
 @pytest.fixture
+def sample_courses_mutable():
+    """Independent copy of the sample courses for tests that modify them"""
+    return list(copy.deepcopy(_COURSES_TEMPLATE))
+
+
+@pytest.fixture(scope="session")
 def sample_course_chunks():
-    """Sample course chunks for testing"""
-    return [
-        CourseChunk(
-            content="MCP (Model Context Protocol) is a standardized way for applications to provide context to AI models.",
-            course_title="Introduction to MCP",
-            lesson_number=1,
-            chunk_index=0,
-        ),
-        CourseChunk(
-            content="The MCP architecture consists of three main components: hosts, clients, and servers.",
-            course_title="Introduction to MCP",
-            lesson_number=2,
-            chunk_index=1,
-        ),
-        CourseChunk(
-            content="Python decorators are a powerful feature that allows you to modify functions or classes.",
-            course_title="Advanced Python",
-            lesson_number=1,
-            chunk_index=0,
-        ),
-    ]
+    """Sample course chunks for testing (shared across the session; do not mutate)"""
+    return _COURSE_CHUNKS_TEMPLATE
+
+
+def _default_lesson_links(pairs):
+    """Default get_lesson_links_batch stub: one link for every lesson"""
+    return {pair: "https://example.com/mcp-intro/lesson1" for pair in pairs}
+
+
+@pytest.fixture(scope="session")
+def _session_vector_store():
+    """Mock VectorStore built once per session; mock_vector_store resets it"""
+    from vector_store import VectorStore
+
+    # spec= rejects attributes the real store doesn't have
+    return Mock(spec=VectorStore)
 
 
 @pytest.fixture
-def mock_vector_store():
-    """Mock VectorStore for testing"""
-    mock_store = Mock()
+def mock_vector_store(_session_vector_store):
+    """Mock VectorStore for testing, reset before each test"""
+    mock_store = _session_vector_store
+
+    # Drop return values, side effects and calls left by the previous test
+    mock_store.reset_mock(return_value=True, side_effect=True)
 
     # Default successful search results
-    mock_store.search.return_value = SearchResults(
-        documents=[
-            "MCP (Model Context Protocol) is a standardized way for applications to provide context to AI models."
-        ],
-        metadata=[{"course_title": "Introduction to MCP", "lesson_number": 1}],
-        distances=[0.2],
-        error=None,
-    )
+    mock_store.search.return_value = _make_results("default")
 
     # Default course name resolution
     mock_store._resolve_course_name.return_value = "Introduction to MCP"
 
     # Default lesson link retrieval
     mock_store.get_lesson_link.return_value = "https://example.com/mcp-intro/lesson1"
+    mock_store.get_lesson_links_batch.side_effect = _default_lesson_links
+
+    # Write counter checked by tools that cache store data
+    mock_store.generation = 0
 
     return mock_store
 
 
+@pytest.fixture(scope="session")
+def _session_course_search_tool(_session_vector_store):
+    """CourseSearchTool built once per session over the shared mock store"""
+    from search_tools import CourseSearchTool
+
+    return CourseSearchTool(_session_vector_store)
+
+
 @pytest.fixture
-def course_search_tool(mock_vector_store):
+def course_search_tool(mock_vector_store, _session_course_search_tool):
     """CourseSearchTool instance with mocked vector store"""
-    return CourseSearchTool(mock_vector_store)
+    # Sources are the only state the tool keeps between executions
+    _session_course_search_tool.last_sources = []
+    return _session_course_search_tool
+
+
+@pytest.fixture(scope="session")
+def _anthropic_class():
+    """The real Anthropic client class, resolved before any patch replaces it"""
+    from anthropic import Anthropic
+
+    return Anthropic
+
+
+def _spec_client(anthropic_class):
+    """Anthropic client mock limited to the SDK's real attributes"""
+    from anthropic.resources.messages import Messages
+
+    client = Mock(spec=anthropic_class)
+    client.messages = Mock(spec=Messages)
+
+    # Materialize the resource methods AIGenerator calls, then seal the tree so
+    # a mistyped path raises instead of quietly growing new child mocks
+    client.messages.create
+    client.messages.stream
+    for method in ("create", "retrieve", "results"):
+        getattr(client.messages.batches, method)
+    seal(client)
+    return client
+
+
+@pytest.fixture(scope="session")
+def _session_anthropic_client(_anthropic_class):
+    """Anthropic client mock built once per session; reset per test"""
+    return _spec_client(_anthropic_class)
+
+
+@pytest.fixture(scope="session")
+def _session_anthropic_client_with_tool_use(_anthropic_class):
+    """Tool-use Anthropic client mock built once per session; reset per test"""
+    return _spec_client(_anthropic_class)
 
 
 @pytest.fixture
-def mock_anthropic_client():
+def mock_anthropic_client(_session_anthropic_client):
     """Mock Anthropic client for testing"""
-    mock_client = Mock()
+    mock_client = _session_anthropic_client
+
+    # Drop return values, side effects and calls left by the previous test
+    mock_client.reset_mock(return_value=True, side_effect=True)
 
     # Mock successful response without tool use
     mock_response = Mock()
     mock_response.stop_reason = "end_turn"
-    mock_response.content = [Mock(text="This is a sample response about MCP.")]
+    mock_response.content = list(_END_TURN_CONTENT)
+    seal(mock_response)
     mock_client.messages.create.return_value = mock_response
 
     return mock_client
 
 
 @pytest.fixture
-def mock_anthropic_client_with_tool_use():
+def mock_anthropic_client_with_tool_use(_session_anthropic_client_with_tool_use):
     """Mock Anthropic client that simulates tool use"""
-    mock_client = Mock()
+    mock_client = _session_anthropic_client_with_tool_use
 
-    # Mock initial response with tool use
-    initial_response = Mock()
-    initial_response.stop_reason = "tool_use"
+    # Drop return values, side effects and calls left by the previous test
+    mock_client.reset_mock(return_value=True, side_effect=True)
 
-    # Mock tool use content
-    tool_use_block = Mock()
-    tool_use_block.type = "tool_use"
-    tool_use_block.name = "search_course_content"
-    tool_use_block.id = "tool_123"
-    tool_use_block.input = {"query": "What is MCP?"}
+    # Return the tool-use response first, then the final answer
+    mock_client.messages.create.side_effect = _tool_use_side_effect()
 
-    initial_response.content = [tool_use_block]
+    return mock_client
 
-    # Mock final response after tool execution
-    final_response = Mock()
-    final_response.stop_reason = "end_turn"
-    final_response.content = [
-        Mock(text="Based on the course content, MCP stands for Model Context Protocol.")
-    ]
 
-    # Configure client to return initial response first, then final response
-    mock_client.messages.create.side_effect = [initial_response, final_response]
+@pytest.fixture(scope="session")
+def _ai_generator_module(_anthropic_class):
+    """The ai_generator module, imported once at session setup
 
-    return mock_client
+    Loading it (and the anthropic SDK behind it) here keeps that one-time cost
+    out of whichever per-test fixture happens to need it first. Every xdist
+    worker collects the whole suite, and test_ai_generator imports the module
+    at collection time, so each worker has already paid this cost before its
+    first test runs. No separate autouse warm-up is needed.
+    """
+    import ai_generator
+
+    return ai_generator
+
+
+@pytest.fixture(scope="session")
+def _patched_anthropic(_ai_generator_module):
+    """Anthropic client class, patched once for the whole session"""
+    patcher = patch.object(_ai_generator_module.anthropic, "Anthropic")
+    yield patcher.start()
+    patcher.stop()
 
 
 @pytest.fixture
-def ai_generator_with_mock_client(mock_anthropic_client):
-    """AIGenerator with mocked Anthropic client"""
-    with patch("ai_generator.anthropic.Anthropic") as mock_anthropic_class:
-        mock_anthropic_class.return_value = mock_anthropic_client
-        generator = AIGenerator(api_key="test-key", model="claude-sonnet-4-20250514")
-        generator.client = mock_anthropic_client  # Ensure we use our mock
-        return generator
+def anthropic_class(_patched_anthropic):
+    """The session-patched Anthropic class, reset for the current test
+
+    Tests point it at their client mock with `anthropic_class.return_value`.
+    """
+    _patched_anthropic.reset_mock(return_value=True, side_effect=True)
+    return _patched_anthropic
+
+
+@pytest.fixture(scope="session")
+def _session_generator(_ai_generator_module, _patched_anthropic):
+    """AIGenerator built once per session, with a snapshot of its fresh state"""
+    generator = _ai_generator_module.AIGenerator(
+        api_key="test-key", model="claude-sonnet-4-20250514"
+    )
+    return generator, dict(vars(generator))
 
 
 @pytest.fixture
-def tool_manager_with_search_tool(course_search_tool):
-    """ToolManager with registered CourseSearchTool"""
+def shared_generator(_session_generator):
+    """The session AIGenerator restored to its fresh state
+
+    Tests point it at their client mock by assigning `shared_generator.client`.
+    """
+    generator, initial_state = _session_generator
+    vars(generator).clear()
+    vars(generator).update(initial_state)
+    return generator
+
+
+@pytest.fixture
+def ai_generator_with_mock_client(shared_generator, mock_anthropic_client):
+    """AIGenerator with mocked Anthropic client"""
+    shared_generator.client = mock_anthropic_client
+    return shared_generator
+
+
+@pytest.fixture(scope="session")
+def _session_tool_manager(_session_course_search_tool):
+    """ToolManager built once per session with the shared CourseSearchTool"""
+    from search_tools import ToolManager
+
     manager = ToolManager()
-    manager.register_tool(course_search_tool)
+    manager.register_tool(_session_course_search_tool)
     return manager
 
 
-@pytest.fixture
-def test_config():
-    """Test configuration"""
-    config = Config()
-    config.ANTHROPIC_API_KEY = "test-api-key"
-    config.CHROMA_PATH = "./test_chroma_db"
-    config.MAX_RESULTS = 3
-    return config
+@pytest.fixture(scope="session")
+def tool_definitions(_session_tool_manager):
+    """Tool definitions of the shared ToolManager, fetched once per session"""
+    return _session_tool_manager.get_tool_definitions()
 
 
 @pytest.fixture
-def mock_rag_system(test_config):
-    """Mock RAG system for integration testing"""
+def tool_manager_with_search_tool(course_search_tool):
+    """ToolManager with registered CourseSearchTool, built fresh per test
+
+    Tests may stub methods on it (e.g. execute_tool), so it is never shared.
+    """
+    from search_tools import ToolManager
+
+    manager = ToolManager()
+    manager.register_tool(course_search_tool)
+    return manager
+
+
+@dataclass(frozen=True, slots=True)
+class _TestConfig:
+    """Only the settings RAGSystem reads, with no env or dotenv lookup"""
+
+    CHROMA_PATH: str
+    ANTHROPIC_API_KEY: str = "test-api-key"
+    ANTHROPIC_MODEL: str = "claude-sonnet-4-20250514"
+    EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"
+    CHUNK_SIZE: int = 800
+    CHUNK_OVERLAP: int = 100
+    MAX_RESULTS: int = 3
+    MAX_HISTORY: int = 2
+    MAX_QUERY_LENGTH: int = 2000
+    SEMANTIC_CACHE_THRESHOLD: float = 0.92
+    SEMANTIC_CACHE_SIZE: int = 1000
+    RESPONSE_CACHE_TTL: int = 3600
+    RESPONSE_CACHE_SIZE: int = 500
+
+
+@pytest.fixture(scope="session")
+def test_config(tmp_path_factory):
+    """Test configuration, frozen and shared across the session
+
+    The ChromaDB path is unique per xdist worker so parallel runs never share
+    a database.
+    """
+    return _TestConfig(CHROMA_PATH=str(tmp_path_factory.mktemp("chroma")))
+
+
+@pytest.fixture(scope="session")
+def _session_rag_system(test_config):
+    """RAG system with mocked components, built once per session
+
+    "Session" means per xdist worker: each worker is a separate process that
+    builds its own copy, so tests on different workers never share it.
+    """
+    from ai_generator import AIGenerator
+    from rag_system import RAGSystem
+    from session_manager import SessionManager
+    from vector_store import VectorStore
+
+    # The patches only need to cover construction: RAGSystem keeps references
+    # to the mock instances it was built with
     with (
         patch("rag_system.DocumentProcessor"),
         patch("rag_system.VectorStore") as mock_vector_store_class,
@@ -197,161 +506,167 @@ def mock_rag_system(test_config):
     ):
 
         # Set up the mock vector store
-        mock_vector_store = Mock()
+        mock_vector_store = Mock(spec=VectorStore)
+        # Instance attributes are not part of the class spec
+        mock_vector_store.embedding_function = Mock()
+        mock_vector_store.generation = 0
         mock_vector_store_class.return_value = mock_vector_store
 
         # Set up the mock AI generator
-        mock_ai_generator = Mock()
-        mock_ai_generator.generate_response.return_value = (
-            "This is a test response about MCP."
-        )
+        mock_ai_generator = Mock(spec=AIGenerator)
         mock_ai_generator_class.return_value = mock_ai_generator
 
         # Set up the mock session manager
-        mock_session_manager = Mock()
-        mock_session_manager.get_conversation_history.return_value = None
+        mock_session_manager = Mock(spec=SessionManager)
         mock_session_manager_class.return_value = mock_session_manager
 
         # Create RAG system instance
         rag_system = RAGSystem(test_config)
 
-        # Store mocks for test access
-        rag_system.mock_vector_store = mock_vector_store
-        rag_system.mock_ai_generator = mock_ai_generator
-        rag_system.mock_session_manager = mock_session_manager
+    # Store mocks for test access
+    rag_system.mock_vector_store = mock_vector_store
+    rag_system.mock_ai_generator = mock_ai_generator
+    rag_system.mock_session_manager = mock_session_manager
 
-        # Mock the tool_manager methods that are called in the query method
-        rag_system.tool_manager.get_last_sources = Mock(return_value=[])
-        rag_system.tool_manager.reset_sources = Mock()
-        rag_system.tool_manager.get_tool_definitions = Mock(return_value=[])
+    # Stub the tool_manager methods that the query method calls; spec'ing each
+    # on the real method limits it to that method's attributes and signature
+    tool_manager = rag_system.tool_manager
+    for name in ("get_last_sources", "reset_sources", "get_tool_definitions"):
+        setattr(tool_manager, name, Mock(spec=getattr(tool_manager, name)))
 
-        return rag_system
+    return rag_system
 
 
-# Search result fixtures for different scenarios
 @pytest.fixture
+def mock_rag_system(_session_rag_system):
+    """Mock RAG system for integration testing, reset before each test"""
+    rag_system = _session_rag_system
+    tool_manager = rag_system.tool_manager
+
+    # Drop return values, side effects and calls left by the previous test
+    rag_system.mock_vector_store.reset_mock(return_value=True, side_effect=True)
+    rag_system.mock_ai_generator.reset_mock(return_value=True, side_effect=True)
+    rag_system.mock_session_manager.reset_mock(return_value=True, side_effect=True)
+    for stub in (
+        tool_manager.get_last_sources,
+        tool_manager.reset_sources,
+        tool_manager.get_tool_definitions,
+    ):
+        stub.reset_mock(return_value=True, side_effect=True)
+
+    # The shared system must not answer from an earlier test's cache
+    rag_system.response_cache.clear()
+
+    # Default stubs
+    rag_system.mock_ai_generator.generate_response_sequential.return_value = (
+        "This is a test response about MCP."
+    )
+    rag_system.mock_session_manager.get_conversation_history.return_value = None
+    tool_manager.get_last_sources.return_value = []
+    tool_manager.get_tool_definitions.return_value = _CANONICAL_TOOL_DEFS
+
+    return rag_system
+
+
+@pytest.fixture(scope="session")
+def canonical_tool_defs():
+    """Tool definitions returned by mock_rag_system's tool manager"""
+    return _CANONICAL_TOOL_DEFS
+
+
+# Search result fixtures for different scenarios; session-scoped, so tests
+# must treat them as read-only
+@pytest.fixture(scope="session")
 def successful_search_results():
     """Successful search results with multiple matches"""
-    return SearchResults(
-        documents=[
-            "MCP (Model Context Protocol) is a standardized way for applications to provide context to AI models.",
-            "The MCP architecture consists of three main components: hosts, clients, and servers.",
-        ],
-        metadata=[
-            {"course_title": "Introduction to MCP", "lesson_number": 1},
-            {"course_title": "Introduction to MCP", "lesson_number": 2},
-        ],
-        distances=[0.2, 0.3],
-        error=None,
-    )
+    return _make_results("success")
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def empty_search_results():
     """Empty search results"""
-    return SearchResults(documents=[], metadata=[], distances=[], error=None)
+    return _make_results("empty")
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def error_search_results():
     """Search results with error"""
-    return SearchResults(
-        documents=[],
-        metadata=[],
-        distances=[],
-        error="Database connection failed"
-    )
+    return _make_results("error")
 
 
-# API Testing Fixtures
-@pytest.fixture
-def test_app():
-    """Create test FastAPI app without static file mounting to avoid import issues"""
-    from fastapi import FastAPI, HTTPException
-    from fastapi.middleware.cors import CORSMiddleware
-    from fastapi.middleware.trustedhost import TrustedHostMiddleware
-    from pydantic import BaseModel
-    from typing import List, Optional
-    
+async def get_rag_system():
+    """Stand-in for app.get_rag_system; each test app overrides it with a mock"""
+    raise RuntimeError("Test app has no RAG system override")
+
+
+def _build_test_app(with_middleware: bool = False):
+    """Create test FastAPI app without static file mounting to avoid import issues
+
+    The production middleware is wildcard-configured and only matters to the
+    middleware tests, so it is left out unless asked for.
+    """
+    from fastapi import Depends, FastAPI, HTTPException
+
     # Create test app
     app = FastAPI(title="Course Materials RAG System", root_path="")
-    
-    # Add middleware (same as production)
-    app.add_middleware(
-        TrustedHostMiddleware,
-        allowed_hosts=["*"]
-    )
-    
-    app.add_middleware(
-        CORSMiddleware,
-        allow_origins=["*"],
-        allow_credentials=True,
-        allow_methods=["*"],
-        allow_headers=["*"],
-        expose_headers=["*"],
-    )
-    
-    # Define Pydantic models (same as production)
-    class QueryRequest(BaseModel):
-        query: str
-        session_id: Optional[str] = None
-
-    class NewChatRequest(BaseModel):
-        session_id: Optional[str] = None
-
-    class SourceItem(BaseModel):
-        text: str
-        link: Optional[str] = None
-
-    class QueryResponse(BaseModel):
-        answer: str
-        sources: List[SourceItem]
-        session_id: str
-
-    class CourseStats(BaseModel):
-        total_courses: int
-        course_titles: List[str]
-    
+
+    if with_middleware:
+        from fastapi.middleware.cors import CORSMiddleware
+        from fastapi.middleware.trustedhost import TrustedHostMiddleware
+
+        # Add middleware (same as production)
+        app.add_middleware(TrustedHostMiddleware, allowed_hosts=["*"])
+
+        app.add_middleware(
+            CORSMiddleware,
+            allow_origins=["*"],
+            allow_credentials=True,
+            allow_methods=["*"],
+            allow_headers=["*"],
+            expose_headers=["*"],
+        )
+
     # Mock RAG system for testing
     mock_rag_system = Mock()
-    
+    mock_rag_system.aquery = AsyncMock()
+
     # Define endpoints inline to avoid import issues
     @app.post("/api/query", response_model=QueryResponse)
-    async def query_documents(request: QueryRequest):
+    async def query_documents(
+        request: QueryRequest, mock_rag_system=Depends(get_rag_system)
+    ):
         try:
             session_id = request.session_id or "test_session_id"
-            
+
             # Mock response based on query
             if "error" in request.query.lower():
                 raise Exception("Test error")
-            
-            answer, sources = mock_rag_system.query(request.query, session_id)
-            
-            return QueryResponse(
-                answer=answer,
-                sources=sources,
-                session_id=session_id
-            )
+
+            answer, sources = await mock_rag_system.aquery(request.query, session_id)
+
+            return QueryResponse(answer=answer, sources=sources, session_id=session_id)
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
     @app.get("/api/courses", response_model=CourseStats)
-    async def get_course_stats():
+    async def get_course_stats(mock_rag_system=Depends(get_rag_system)):
         try:
             analytics = mock_rag_system.get_course_analytics()
             return CourseStats(
                 total_courses=analytics["total_courses"],
-                course_titles=analytics["course_titles"]
+                course_titles=analytics["course_titles"],
             )
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
     @app.post("/api/new-chat")
-    async def new_chat(request: NewChatRequest):
+    async def new_chat(
+        request: NewChatRequest, mock_rag_system=Depends(get_rag_system)
+    ):
         try:
             if request.session_id:
                 mock_rag_system.session_manager.clear_session(request.session_id)
-            
+
             return {"status": "success", "message": "Session cleared"}
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
@@ -359,56 +674,128 @@ def test_app():
     @app.get("/")
     async def root():
         return {"message": "Course Materials RAG System"}
-    
+
+    # Serve the mock through the same dependency the production endpoints use
+    async def override_rag_system():
+        return mock_rag_system
+
+    app.dependency_overrides[get_rag_system] = override_rag_system
+
     # Store mock for test access
     app.state.mock_rag_system = mock_rag_system
-    
+
     return app
 
 
-@pytest.fixture
+# API Testing Fixtures
+@pytest.fixture(scope="session")
+def test_app():
+    """Test FastAPI app without middleware
+
+    Built once per session; mock_rag_for_api resets its mock RAG system per test.
+    """
+    app = _build_test_app()
+    yield app
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture(scope="session")
+def test_app_with_middleware():
+    """Test FastAPI app with the production CORS/trusted-host middleware"""
+    app = _build_test_app(with_middleware=True)
+    yield app
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture(scope="session")
 def api_client(test_app):
-    """Create test client for API testing"""
+    """Create test client for API testing
+
+    Entered once per session so the ASGI lifespan startup runs only once.
+    """
     from fastapi.testclient import TestClient
-    return TestClient(test_app)
+
+    with TestClient(test_app) as client:
+        yield client
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    """Run anyio-marked tests on asyncio, sharing one backend per session"""
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+async def async_client(test_app, anyio_backend):
+    """Async client calling the test app in-process over ASGI
+
+    Requests are awaited on the test's own event loop, skipping the blocking
+    portal thread TestClient starts for each call. ASGITransport does not run
+    lifespan events, so tests that need them keep using api_client.
+    """
+    import httpx
+
+    transport = httpx.ASGITransport(app=test_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
 
 
 @pytest.fixture
+def fresh_api_client(test_app):
+    """Test client with its own ASGI lifespan, for tests that need a fresh one"""
+    from fastapi.testclient import TestClient
+
+    with TestClient(test_app) as client:
+        yield client
+
+
+@pytest.fixture(scope="session")
 def mock_rag_for_api(test_app):
-    """Get the mock RAG system from test app for setup in API tests"""
+    """Get the mock RAG system from test app for setup in API tests
+
+    Shared like the app itself; _reset_mock_rag_for_api clears it per test.
+    Each xdist worker is its own process with its own app and mock, so the API
+    tests need no xdist_group and can spread freely across workers.
+    """
     return test_app.state.mock_rag_system
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
+def mock_session_manager(mock_rag_for_api):
+    """Session manager of the shared mock RAG system
+
+    A child of mock_rag_for_api, so _reset_mock_rag_for_api resets it as well.
+    """
+    return mock_rag_for_api.session_manager
+
+
+@pytest.fixture(autouse=True)
+def _reset_mock_rag_for_api(request):
+    """Drop stubs and calls the previous API test left on the shared mock RAG
+
+    Runs for every api-marked test, including those that only hit the client,
+    so none of them sees a stale return value. Other tests never build the app.
+    """
+    if request.node.get_closest_marker("api") is None:
+        return
+    mock_rag_system = request.getfixturevalue("mock_rag_for_api")
+    mock_rag_system.reset_mock(return_value=True, side_effect=True)
+
+
+# Sample API payloads; session-scoped and read-only (see the constants above)
+@pytest.fixture(scope="session")
 def sample_query_request():
     """Sample query request for API testing"""
-    return {
-        "query": "What is MCP?",
-        "session_id": "test_session_123"
-    }
+    return _SAMPLE_QUERY_REQUEST
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_query_response():
     """Sample query response for API testing"""
-    return {
-        "answer": "MCP stands for Model Context Protocol.",
-        "sources": [
-            {"text": "Introduction to MCP - Lesson 1", "link": "https://example.com/lesson1"}
-        ],
-        "session_id": "test_session_123"
-    }
+    return _SAMPLE_QUERY_RESPONSE
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_course_analytics():
     """Sample course analytics for API testing"""
-    return {
-        "total_courses": 3,
-        "course_titles": [
-            "Introduction to MCP",
-            "Advanced Python",
-            "API Design"
-        ]
-    }
->>>>>>> quality_feature
+    return _SAMPLE_COURSE_ANALYTICS
@@ -1,9 +1,93 @@
 """Tests for AIGenerator integration with CourseSearchTool"""
 
+import copy
+import re
+import threading
+from dataclasses import dataclass
+from types import SimpleNamespace
 from unittest.mock import MagicMock, Mock, patch
 
+import anthropic
+import httpx
 import pytest
-from ai_generator import AIGenerator
+from ai_generator import AIGenerator, FallbackResponse
+from anthropic import Anthropic
+from anthropic.lib.streaming import MessageStreamManager
+from anthropic.resources.messages import Messages
+from search_tools import CourseSearchTool
+from semantic_cache import SemanticCache
+
+# Keep the module on one xdist worker (and its session fixtures warm) under
+# the default --dist=loadgroup, which otherwise spreads tests individually
+pytestmark = pytest.mark.xdist_group(name="ai_generator")
+
+
+@dataclass(frozen=True, slots=True)
+class _TextBlock:
+    """Minimal stand-in for an Anthropic text content block"""
+
+    text: str
+    type: str = "text"
+
+
+# Immutable tool-use reply, returned unchanged by every call that reuses it
+_ALWAYS_TOOL_USE_RESPONSE = SimpleNamespace(
+    stop_reason="tool_use",
+    content=(
+        SimpleNamespace(
+            type="tool_use",
+            name="search_course_content",
+            id="tool_123",
+            input={"query": "test"},
+        ),
+    ),
+)
+
+
+# Definitions as the shared ToolManager returns them, built at import time for
+# tests that only pass them through (the definition never touches the store)
+_TOOL_DEFS = [CourseSearchTool(None).get_tool_definition()]
+
+
+# Key phrases the system prompt must keep, matched together in one pass
+_SYSTEM_PROMPT_PHRASES = (
+    "search_course_content",
+    "get_course_outline",
+    "Tool Usage Guidelines",
+    "Sequential tool usage allowed",
+    "Maximum 2 rounds of tool usage per user query",
+    "Brief, Concise and focused",
+)
+_SYSTEM_PROMPT_PHRASES_RE = re.compile("|".join(map(re.escape, _SYSTEM_PROMPT_PHRASES)))
+
+
+def _client_mock():
+    """Anthropic client mock limited to the SDK's real attributes"""
+    client = Mock(spec=Anthropic)
+    client.messages = Mock(spec=Messages)
+    return client
+
+
+def _record_create_calls(create):
+    """Snapshot each create() call's kwargs as sent
+
+    The generator extends one messages list between calls, so call_args would
+    show every call with the final conversation.
+    """
+    calls = []
+    responses = create.side_effect
+
+    def record(**kwargs):
+        calls.append(copy.deepcopy(kwargs))
+        return next(responses)
+
+    create.side_effect = record
+    return calls
+
+
+def _system_text(call_kwargs):
+    """Join the system prompt blocks sent with a Claude API call"""
+    return "\n\n".join(block["text"] for block in call_kwargs["system"])
 
 
 class TestAIGeneratorBasic:
@@ -42,7 +126,7 @@ class TestAIGeneratorBasic:
         # Verify
         mock_anthropic_client.messages.create.assert_called_once()
         call_args = mock_anthropic_client.messages.create.call_args
-        system_content = call_args[1]["system"]
+        system_content = _system_text(call_args[1])
         assert "Previous conversation:" in system_content
         assert history in system_content
 
@@ -58,28 +142,91 @@ class TestAIGeneratorBasic:
         assert call_args["max_tokens"] == 800
 
 
+class TestAIGeneratorClientReuse:
+    """Test sharing Anthropic clients between generator instances"""
+
+    def test_instances_share_client_per_api_key(self, anthropic_class):
+        """Test that one client and connection pool serves each API key"""
+        anthropic_class.side_effect = lambda **kwargs: Mock()
+        first = AIGenerator(api_key="key-a", model="claude-sonnet-4-20250514")
+        second = AIGenerator(api_key="key-a", model="claude-sonnet-4-20250514")
+        other = AIGenerator(api_key="key-b", model="claude-sonnet-4-20250514")
+
+        assert first.client is second.client
+        assert other.client is not first.client
+        assert anthropic_class.call_count == 2
+        assert anthropic_class.call_args[1]["max_retries"] == 0
+
+
+class TestAIGeneratorHistoryBudget:
+    """Test trimming conversation history to the token budget"""
+
+    def test_oldest_history_dropped_over_budget(
+        self, ai_generator_with_mock_client, mock_anthropic_client
+    ):
+        """Test that the oldest lines are dropped until history fits"""
+        ai_generator_with_mock_client.max_history_tokens = 10
+        history = "User: " + "a" * 30 + "\nAssistant: short answer"
+
+        ai_generator_with_mock_client.generate_response(
+            query="Next question", conversation_history=history
+        )
+
+        system_content = _system_text(
+            mock_anthropic_client.messages.create.call_args[1]
+        )
+        assert system_content.endswith(
+            "Previous conversation:\nAssistant: short answer"
+        )
+
+    def test_history_within_budget_unchanged(
+        self, ai_generator_with_mock_client, mock_anthropic_client
+    ):
+        """Test that short histories are sent as-is"""
+        history = "User: Hi\nAssistant: Hello"
+
+        ai_generator_with_mock_client.generate_response(
+            query="Next question", conversation_history=history
+        )
+
+        system_content = _system_text(
+            mock_anthropic_client.messages.create.call_args[1]
+        )
+        assert system_content.endswith(f"Previous conversation:\n{history}")
+
+    def test_single_oversized_line_keeps_recent_text(
+        self, ai_generator_with_mock_client
+    ):
+        """Test that one huge line is cut down to its most recent characters"""
+        ai_generator_with_mock_client.max_history_tokens = 2
+
+        assert ai_generator_with_mock_client._trim_history("x" * 20 + "12345678") == (
+            "12345678"
+        )
+
+
 class TestAIGeneratorToolIntegration:
     """Test AIGenerator integration with CourseSearchTool"""
 
     def test_generate_response_with_tools_no_tool_use(
-        self, mock_anthropic_client, tool_manager_with_search_tool
+        self,
+        shared_generator,
+        mock_anthropic_client,
+        tool_manager_with_search_tool,
     ):
         """Test response generation with tools available but no tool use"""
         # Setup - AI decides not to use tools
         mock_anthropic_client.messages.create.return_value.stop_reason = "end_turn"
 
-        with patch("ai_generator.anthropic.Anthropic") as mock_anthropic_class:
-            mock_anthropic_class.return_value = mock_anthropic_client
-            generator = AIGenerator(
-                api_key="test-key", model="claude-sonnet-4-20250514"
-            )
+        generator = shared_generator
+        generator.client = mock_anthropic_client
 
-            # Execute
-            response = generator.generate_response(
-                query="What is machine learning?",
-                tools=tool_manager_with_search_tool.get_tool_definitions(),
-                tool_manager=tool_manager_with_search_tool,
-            )
+        # Execute
+        response = generator.generate_response(
+            query="What is machine learning?",
+            tools=_TOOL_DEFS,
+            tool_manager=tool_manager_with_search_tool,
+        )
 
         # Verify
         assert response == "This is a sample response about MCP."
@@ -87,22 +234,37 @@ class TestAIGeneratorToolIntegration:
         assert "tools" in call_args
         assert call_args["tool_choice"] == {"type": "auto"}
 
-    def test_generate_response_with_tool_use_success(
-        self, mock_anthropic_client_with_tool_use, tool_manager_with_search_tool
+    @pytest.mark.parametrize(
+        "method, follow_up_has_tools",
+        [
+            # Single round: the follow-up only asks for the final answer
+            ("generate_response", False),
+            # Sequential: tools stay available for a possible second round
+            ("generate_response_sequential", True),
+        ],
+    )
+    def test_tool_use_round_trip(
+        self,
+        method,
+        follow_up_has_tools,
+        shared_generator,
+        mock_anthropic_client_with_tool_use,
+        tool_manager_with_search_tool,
+        tool_definitions,
     ):
-        """Test successful tool use flow"""
-        with patch("ai_generator.anthropic.Anthropic") as mock_anthropic_class:
-            mock_anthropic_class.return_value = mock_anthropic_client_with_tool_use
-            generator = AIGenerator(
-                api_key="test-key", model="claude-sonnet-4-20250514"
-            )
+        """Test the tool call, its execution and the follow-up message flow"""
+        generator = shared_generator
+        generator.client = mock_anthropic_client_with_tool_use
+        calls = _record_create_calls(
+            mock_anthropic_client_with_tool_use.messages.create
+        )
 
-            # Execute
-            response = generator.generate_response(
-                query="What is MCP?",
-                tools=tool_manager_with_search_tool.get_tool_definitions(),
-                tool_manager=tool_manager_with_search_tool,
-            )
+        # Execute
+        response = getattr(generator, method)(
+            query="What is MCP?",
+            tools=tool_definitions,
+            tool_manager=tool_manager_with_search_tool,
+        )
 
         # Verify
         assert (
@@ -118,76 +280,58 @@ class TestAIGeneratorToolIntegration:
         )
 
         # Verify two API calls were made (initial + follow-up)
-        assert mock_anthropic_client_with_tool_use.messages.create.call_count == 2
-
-    def test_tool_execution_flow_messages(
-        self, mock_anthropic_client_with_tool_use, tool_manager_with_search_tool
-    ):
-        """Test that tool execution creates proper message flow"""
-        with patch("ai_generator.anthropic.Anthropic") as mock_anthropic_class:
-            mock_anthropic_class.return_value = mock_anthropic_client_with_tool_use
-            generator = AIGenerator(
-                api_key="test-key", model="claude-sonnet-4-20250514"
-            )
-
-            # Execute
-            generator.generate_response(
-                query="What is MCP?",
-                tools=tool_manager_with_search_tool.get_tool_definitions(),
-                tool_manager=tool_manager_with_search_tool,
-            )
-
-        # Verify message flow
-        calls = mock_anthropic_client_with_tool_use.messages.create.call_args_list
+        assert len(calls) == 2
 
         # First call (initial request with tools)
-        first_call_args = calls[0][1]
+        first_call_args = calls[0]
         assert len(first_call_args["messages"]) == 1
         assert first_call_args["messages"][0]["role"] == "user"
         assert "tools" in first_call_args
 
         # Second call (after tool execution)
-        second_call_args = calls[1][1]
+        second_call_args = calls[1]
         assert len(second_call_args["messages"]) == 3
         assert second_call_args["messages"][0]["role"] == "user"  # Original query
         assert second_call_args["messages"][1]["role"] == "assistant"  # Tool use
         assert second_call_args["messages"][2]["role"] == "user"  # Tool results
-        assert "tools" not in second_call_args  # No tools in follow-up call
+        assert ("tools" in second_call_args) == follow_up_has_tools
 
-    def test_tool_execution_with_multiple_tools(self):
+    def test_tool_execution_with_multiple_tools(self, shared_generator):
         """Test tool execution when multiple tool calls are made"""
         # Setup mock client for multiple tool use
-        mock_client = Mock()
+        mock_client = _client_mock()
 
         # Mock initial response with multiple tool uses
-        initial_response = Mock()
-        initial_response.stop_reason = "tool_use"
-
-        tool_use_1 = Mock()
-        tool_use_1.type = "tool_use"
-        tool_use_1.name = "search_course_content"
-        tool_use_1.id = "tool_123"
-        tool_use_1.input = {"query": "What is MCP?"}
-
-        tool_use_2 = Mock()
-        tool_use_2.type = "tool_use"
-        tool_use_2.name = "search_course_content"
-        tool_use_2.id = "tool_456"
-        tool_use_2.input = {
-            "query": "MCP architecture",
-            "course_name": "Introduction to MCP",
-        }
+        initial_response = SimpleNamespace(stop_reason="tool_use")
+
+        tool_use_1 = SimpleNamespace(
+            type="tool_use",
+            name="search_course_content",
+            id="tool_123",
+            input={"query": "What is MCP?"},
+        )
+
+        tool_use_2 = SimpleNamespace(
+            type="tool_use",
+            name="search_course_content",
+            id="tool_456",
+            input={
+                "query": "MCP architecture",
+                "course_name": "Introduction to MCP",
+            },
+        )
 
         initial_response.content = [tool_use_1, tool_use_2]
 
         # Mock final response
-        final_response = Mock()
-        final_response.stop_reason = "end_turn"
-        final_response.content = [
-            Mock(text="Combined response from multiple tool calls.")
-        ]
+        final_response = SimpleNamespace(
+            stop_reason="end_turn",
+            content=[_TextBlock(text="Combined response from multiple tool calls.")],
+        )
 
-        mock_client.messages.create.side_effect = [initial_response, final_response]
+        mock_client.messages.create.side_effect = iter(
+            (initial_response, final_response)
+        )
 
         # Setup tool manager with mock tools
         tool_manager = Mock()
@@ -196,18 +340,15 @@ class TestAIGeneratorToolIntegration:
             "Result from second search",
         ]
 
-        with patch("ai_generator.anthropic.Anthropic") as mock_anthropic_class:
-            mock_anthropic_class.return_value = mock_client
-            generator = AIGenerator(
-                api_key="test-key", model="claude-sonnet-4-20250514"
-            )
+        generator = shared_generator
+        generator.client = mock_client
 
-            # Execute
-            response = generator.generate_response(
-                query="Tell me about MCP",
-                tools=[{"name": "search_course_content"}],
-                tool_manager=tool_manager,
-            )
+        # Execute
+        response = generator.generate_response(
+            query="Tell me about MCP",
+            tools=[{"name": "search_course_content"}],
+            tool_manager=tool_manager,
+        )
 
         # Verify
         assert response == "Combined response from multiple tool calls."
@@ -223,80 +364,84 @@ class TestAIGeneratorToolIntegration:
             course_name="Introduction to MCP",
         )
 
-    def test_tool_execution_error_handling(self, tool_manager_with_search_tool):
+    def test_tool_execution_error_handling(
+        self, shared_generator, tool_manager_with_search_tool, tool_definitions
+    ):
         """Test handling of errors during tool execution"""
         # Setup mock client for tool use
-        mock_client = Mock()
+        mock_client = _client_mock()
 
-        initial_response = Mock()
-        initial_response.stop_reason = "tool_use"
+        initial_response = SimpleNamespace(stop_reason="tool_use")
 
-        tool_use_block = Mock()
-        tool_use_block.type = "tool_use"
-        tool_use_block.name = "search_course_content"
-        tool_use_block.id = "tool_123"
-        tool_use_block.input = {"query": "test query"}
+        tool_use_block = SimpleNamespace(
+            type="tool_use",
+            name="search_course_content",
+            id="tool_123",
+            input={"query": "test query"},
+        )
 
         initial_response.content = [tool_use_block]
 
-        final_response = Mock()
-        final_response.stop_reason = "end_turn"
-        final_response.content = [Mock(text="I encountered an error while searching.")]
-
-        mock_client.messages.create.side_effect = [initial_response, final_response]
+        final_response = SimpleNamespace(
+            stop_reason="end_turn",
+            content=[_TextBlock(text="I encountered an error while searching.")],
+        )
 
-        # Setup tool manager to return error
-        tool_manager_with_search_tool.execute_tool = Mock(
-            return_value="Search failed: Database error"
+        mock_client.messages.create.side_effect = iter(
+            (initial_response, final_response)
         )
 
-        with patch("ai_generator.anthropic.Anthropic") as mock_anthropic_class:
-            mock_anthropic_class.return_value = mock_client
-            generator = AIGenerator(
-                api_key="test-key", model="claude-sonnet-4-20250514"
-            )
+        generator = shared_generator
+        generator.client = mock_client
 
+        # Setup tool manager to return error; patch.object restores it on exit
+        with patch.object(
+            tool_manager_with_search_tool,
+            "execute_tool",
+            return_value="Search failed: Database error",
+        ) as execute_tool:
             # Execute - should not crash even if tool returns error
             response = generator.generate_response(
                 query="What is MCP?",
-                tools=tool_manager_with_search_tool.get_tool_definitions(),
+                tools=tool_definitions,
                 tool_manager=tool_manager_with_search_tool,
             )
 
         # Verify
         assert response == "I encountered an error while searching."
-        tool_manager_with_search_tool.execute_tool.assert_called_once()
+        execute_tool.assert_called_once()
 
     def test_conversation_history_with_tool_use(
-        self, mock_anthropic_client_with_tool_use, tool_manager_with_search_tool
+        self,
+        shared_generator,
+        mock_anthropic_client_with_tool_use,
+        tool_manager_with_search_tool,
+        tool_definitions,
     ):
         """Test that conversation history is preserved during tool use"""
         history = "User: Hello\nAssistant: Hi there!"
 
-        with patch("ai_generator.anthropic.Anthropic") as mock_anthropic_class:
-            mock_anthropic_class.return_value = mock_anthropic_client_with_tool_use
-            generator = AIGenerator(
-                api_key="test-key", model="claude-sonnet-4-20250514"
-            )
+        generator = shared_generator
+        generator.client = mock_anthropic_client_with_tool_use
 
-            # Execute
-            response = generator.generate_response(
-                query="What is MCP?",
-                conversation_history=history,
-                tools=tool_manager_with_search_tool.get_tool_definitions(),
-                tool_manager=tool_manager_with_search_tool,
-            )
+        # Execute
+        response = generator.generate_response(
+            query="What is MCP?",
+            conversation_history=history,
+            tools=tool_definitions,
+            tool_manager=tool_manager_with_search_tool,
+        )
 
         # Verify history is included in both API calls
         calls = mock_anthropic_client_with_tool_use.messages.create.call_args_list
 
         # Check first call has history
-        first_system = calls[0][1]["system"]
+        first_system = _system_text(calls[0][1])
         assert "Previous conversation:" in first_system
         assert history in first_system
 
         # Check second call has history
-        second_system = calls[1][1]["system"]
+        second_system = _system_text(calls[1][1])
         assert "Previous conversation:" in second_system
         assert history in second_system
 
@@ -304,66 +449,68 @@ class TestAIGeneratorToolIntegration:
 class TestAIGeneratorToolManager:
     """Test AIGenerator interaction with ToolManager"""
 
-    def test_no_tool_manager_with_tool_use(self, mock_anthropic_client_with_tool_use):
+    def test_no_tool_manager_with_tool_use(
+        self, shared_generator, mock_anthropic_client_with_tool_use
+    ):
         """Test behavior when tools are available but no tool_manager is provided"""
         # Modify the mock to not have tool use since no tool manager
-        mock_client = Mock()
-        mock_response = Mock()
-        mock_response.stop_reason = "end_turn"
-        mock_response.content = [Mock(text="I can't use tools without a tool manager.")]
+        mock_client = _client_mock()
+        mock_response = SimpleNamespace(
+            stop_reason="end_turn",
+            content=[_TextBlock(text="I can't use tools without a tool manager.")],
+        )
         mock_client.messages.create.return_value = mock_response
 
-        with patch("ai_generator.anthropic.Anthropic") as mock_anthropic_class:
-            mock_anthropic_class.return_value = mock_client
-            generator = AIGenerator(
-                api_key="test-key", model="claude-sonnet-4-20250514"
-            )
+        generator = shared_generator
+        generator.client = mock_client
 
-            # Execute - should fall back to direct response when no tool_manager
-            response = generator.generate_response(
-                query="What is MCP?",
-                tools=[{"name": "search_course_content"}],
-                tool_manager=None,
-            )
+        # Execute - should fall back to direct response when no tool_manager
+        response = generator.generate_response(
+            query="What is MCP?",
+            tools=[{"name": "search_course_content"}],
+            tool_manager=None,
+        )
 
         # Should return string response and not crash
         assert isinstance(response, str)
         assert response == "I can't use tools without a tool manager."
 
-    def test_tool_not_found_in_manager(self, tool_manager_with_search_tool):
+    def test_tool_not_found_in_manager(
+        self, shared_generator, tool_manager_with_search_tool
+    ):
         """Test behavior when tool is not found in manager"""
         # Setup mock client for tool use with non-existent tool
-        mock_client = Mock()
+        mock_client = _client_mock()
 
-        initial_response = Mock()
-        initial_response.stop_reason = "tool_use"
+        initial_response = SimpleNamespace(stop_reason="tool_use")
 
-        tool_use_block = Mock()
-        tool_use_block.type = "tool_use"
-        tool_use_block.name = "non_existent_tool"
-        tool_use_block.id = "tool_123"
-        tool_use_block.input = {"query": "test"}
+        tool_use_block = SimpleNamespace(
+            type="tool_use",
+            name="non_existent_tool",
+            id="tool_123",
+            input={"query": "test"},
+        )
 
         initial_response.content = [tool_use_block]
 
-        final_response = Mock()
-        final_response.stop_reason = "end_turn"
-        final_response.content = [Mock(text="Tool not found response.")]
+        final_response = SimpleNamespace(
+            stop_reason="end_turn",
+            content=[_TextBlock(text="Tool not found response.")],
+        )
 
-        mock_client.messages.create.side_effect = [initial_response, final_response]
+        mock_client.messages.create.side_effect = iter(
+            (initial_response, final_response)
+        )
 
-        with patch("ai_generator.anthropic.Anthropic") as mock_anthropic_class:
-            mock_anthropic_class.return_value = mock_client
-            generator = AIGenerator(
-                api_key="test-key", model="claude-sonnet-4-20250514"
-            )
+        generator = shared_generator
+        generator.client = mock_client
 
-            # Execute
-            response = generator.generate_response(
-                query="test query",
-                tools=[{"name": "non_existent_tool"}],
-                tool_manager=tool_manager_with_search_tool,
-            )
+        # Execute
+        response = generator.generate_response(
+            query="test query",
+            tools=[{"name": "non_existent_tool"}],
+            tool_manager=tool_manager_with_search_tool,
+        )
 
         # Verify
         assert response == "Tool not found response."
@@ -377,20 +524,45 @@ class TestAIGeneratorToolManager:
 
         # Verify system prompt content
         call_args = mock_anthropic_client.messages.create.call_args[1]
-        system_content = call_args["system"]
+        system_content = _system_text(call_args)
 
-        # Check for key system prompt elements
-        assert "search_course_content" in system_content
-        assert "get_course_outline" in system_content
-        assert "Tool Usage Guidelines" in system_content
-        assert "Sequential tool usage allowed" in system_content
-        assert "Maximum 2 rounds of tool usage per user query" in system_content
-        assert "Brief, Concise and focused" in system_content
+        # Check for key system prompt elements in a single scan
+        found = set(_SYSTEM_PROMPT_PHRASES_RE.findall(system_content))
+        assert found == set(_SYSTEM_PROMPT_PHRASES)
+
+    def test_static_prefix_marked_for_prompt_caching(
+        self, ai_generator_with_mock_client, mock_anthropic_client
+    ):
+        """Test that the system prompt and tools are cache breakpoints"""
+        tools = [{"name": "search_course_content"}, {"name": "get_course_outline"}]
+
+        ai_generator_with_mock_client.generate_response(
+            query="test",
+            conversation_history="User: Hi\nAssistant: Hello!",
+            tools=tools,
+        )
+
+        call_args = mock_anthropic_client.messages.create.call_args[1]
+        system_blocks = call_args["system"]
+        assert system_blocks[0]["text"] == AIGenerator.SYSTEM_PROMPT
+        assert system_blocks[0]["cache_control"] == {"type": "ephemeral"}
+        # History changes per turn, so it must stay out of the cached prefix
+        assert "cache_control" not in system_blocks[1]
+        assert call_args["tools"][-1]["cache_control"] == {"type": "ephemeral"}
+        assert "cache_control" not in call_args["tools"][0]
+        # Caller's tool definitions are left untouched
+        assert tools[-1] == {"name": "get_course_outline"}
 
 
 class TestAIGeneratorSequentialTooling:
     """Test sequential tool calling functionality"""
 
+    @pytest.fixture
+    def sequential_rig(self, shared_generator, mock_anthropic_client_with_tool_use):
+        """Shared generator wired to the tool-use client mock"""
+        shared_generator.client = mock_anthropic_client_with_tool_use
+        return shared_generator, mock_anthropic_client_with_tool_use
+
     def test_sequential_fallback_without_tools(
         self, ai_generator_with_mock_client, mock_anthropic_client
     ):
@@ -405,24 +577,24 @@ class TestAIGeneratorSequentialTooling:
         mock_anthropic_client.messages.create.assert_called_once()
 
     def test_sequential_single_round_no_tool_use(
-        self, mock_anthropic_client, tool_manager_with_search_tool
+        self,
+        shared_generator,
+        mock_anthropic_client,
+        tool_manager_with_search_tool,
     ):
         """Test sequential method with single round when Claude doesn't use tools"""
         # Setup - AI decides not to use tools
         mock_anthropic_client.messages.create.return_value.stop_reason = "end_turn"
 
-        with patch("ai_generator.anthropic.Anthropic") as mock_anthropic_class:
-            mock_anthropic_class.return_value = mock_anthropic_client
-            generator = AIGenerator(
-                api_key="test-key", model="claude-sonnet-4-20250514"
-            )
+        generator = shared_generator
+        generator.client = mock_anthropic_client
 
-            # Execute
-            response = generator.generate_response_sequential(
-                query="What is machine learning?",
-                tools=tool_manager_with_search_tool.get_tool_definitions(),
-                tool_manager=tool_manager_with_search_tool,
-            )
+        # Execute
+        response = generator.generate_response_sequential(
+            query="What is machine learning?",
+            tools=_TOOL_DEFS,
+            tool_manager=tool_manager_with_search_tool,
+        )
 
         # Verify
         assert response == "This is a sample response about MCP."
@@ -432,201 +604,790 @@ class TestAIGeneratorSequentialTooling:
         assert "tools" in call_args
         assert call_args["tool_choice"] == {"type": "auto"}
 
-    def test_sequential_single_round_with_tool_use(
-        self, mock_anthropic_client_with_tool_use, tool_manager_with_search_tool
-    ):
-        """Test sequential method with single round of tool use"""
-        with patch("ai_generator.anthropic.Anthropic") as mock_anthropic_class:
-            mock_anthropic_class.return_value = mock_anthropic_client_with_tool_use
-            generator = AIGenerator(
-                api_key="test-key", model="claude-sonnet-4-20250514"
-            )
-
-            # Execute
-            response = generator.generate_response_sequential(
-                query="What is MCP?",
-                tools=tool_manager_with_search_tool.get_tool_definitions(),
-                tool_manager=tool_manager_with_search_tool,
-            )
-
-        # Verify
-        assert (
-            response
-            == "Based on the course content, MCP stands for Model Context Protocol."
-        )
-
-        # Verify tool was executed
-        tool_manager_with_search_tool.tools[
-            "search_course_content"
-        ].store.search.assert_called_once()
-
-        # Verify two API calls were made (first with tool use, second for final response)
-        assert mock_anthropic_client_with_tool_use.messages.create.call_count == 2
-
-    def test_sequential_max_rounds_termination(self):
+    def test_sequential_max_rounds_termination(self, sequential_rig):
         """Test sequential method terminates at max rounds"""
         # Setup mock client that always returns tool_use responses
-        mock_client = Mock()
+        generator, mock_client = sequential_rig
 
-        # Create responses that always want to use tools
-        tool_use_response = Mock()
-        tool_use_response.stop_reason = "tool_use"
-        tool_use_block = Mock()
-        tool_use_block.type = "tool_use"
-        tool_use_block.name = "search_course_content"
-        tool_use_block.id = "tool_123"
-        tool_use_block.input = {"query": "test"}
-        tool_use_response.content = [tool_use_block]
-
-        # Mock client returns tool_use response twice
-        mock_client.messages.create.return_value = tool_use_response
+        # Mock client asks for a tool on every call
+        mock_client.messages.create.side_effect = None
+        mock_client.messages.create.return_value = _ALWAYS_TOOL_USE_RESPONSE
 
         # Setup tool manager
         tool_manager = Mock()
         tool_manager.execute_tool.return_value = "Tool result"
 
-        with patch("ai_generator.anthropic.Anthropic") as mock_anthropic_class:
-            mock_anthropic_class.return_value = mock_client
-            generator = AIGenerator(
-                api_key="test-key", model="claude-sonnet-4-20250514"
-            )
-
-            # Execute with max_rounds=2
-            response = generator.generate_response_sequential(
-                query="Test query",
-                tools=[{"name": "search_course_content"}],
-                tool_manager=tool_manager,
-                max_rounds=2,
-            )
+        # Execute
+        max_rounds = 2
+        response = generator.generate_response_sequential(
+            query="Test query",
+            tools=[{"name": "search_course_content"}],
+            tool_manager=tool_manager,
+            max_rounds=max_rounds,
+        )
 
-        # Verify
-        # Should stop after 2 rounds due to max_rounds limit
-        # With max_rounds=2, we expect: round 1 -> tool use -> round 2 -> tool use -> terminate
-        # That's 3 API calls total (2 tool rounds + 1 termination check)
-        assert mock_client.messages.create.call_count == 3
-        assert tool_manager.execute_tool.call_count == 2
-        assert "maximum number of tool usage rounds" in response or response is not None
+        # Verify: one call per tool round, then the call whose tool request
+        # exceeds the limit and ends the loop without running the tool
+        assert mock_client.messages.create.call_count == max_rounds + 1
+        assert tool_manager.execute_tool.call_count == max_rounds
+        # The last tool-use response has no text, so the canned message is used
+        assert isinstance(response, FallbackResponse)
+        assert response == (
+            "I've reached the maximum number of tool usage rounds. "
+            "Please refine your query."
+        )
 
-    def test_sequential_tool_execution_error_handling(self):
+    def test_sequential_tool_execution_error_handling(self, sequential_rig):
         """Test sequential method handles tool execution errors gracefully"""
         # Setup mock client for tool use
-        mock_client = Mock()
+        generator, mock_client = sequential_rig
 
-        initial_response = Mock()
-        initial_response.stop_reason = "tool_use"
+        initial_response = SimpleNamespace(stop_reason="tool_use")
 
-        tool_use_block = Mock()
-        tool_use_block.type = "tool_use"
-        tool_use_block.name = "search_course_content"
-        tool_use_block.id = "tool_123"
-        tool_use_block.input = {"query": "test query"}
+        tool_use_block = SimpleNamespace(
+            type="tool_use",
+            name="search_course_content",
+            id="tool_123",
+            input={"query": "test query"},
+        )
 
         initial_response.content = [tool_use_block]
 
         # Mock a fallback response for error handling
-        fallback_response = Mock()
-        fallback_response.stop_reason = "end_turn"
-        fallback_response.content = [Mock(text="Fallback response after tool error.")]
+        fallback_response = SimpleNamespace(
+            stop_reason="end_turn",
+            content=[_TextBlock(text="Fallback response after tool error.")],
+        )
 
-        mock_client.messages.create.side_effect = [initial_response, fallback_response]
+        mock_client.messages.create.side_effect = iter(
+            (initial_response, fallback_response)
+        )
 
         # Setup tool manager to raise error
         tool_manager = Mock()
         tool_manager.execute_tool.side_effect = Exception("Tool execution failed")
 
-        with patch("ai_generator.anthropic.Anthropic") as mock_anthropic_class:
-            mock_anthropic_class.return_value = mock_client
-            generator = AIGenerator(
-                api_key="test-key", model="claude-sonnet-4-20250514"
-            )
-
-            # Execute - should not crash even if tool fails
-            response = generator.generate_response_sequential(
-                query="What is MCP?",
-                tools=[{"name": "search_course_content"}],
-                tool_manager=tool_manager,
-            )
+        # Execute - should not crash even if tool fails
+        response = generator.generate_response_sequential(
+            query="What is MCP?",
+            tools=[{"name": "search_course_content"}],
+            tool_manager=tool_manager,
+        )
 
         # Verify
         assert response == "Fallback response after tool error."
         tool_manager.execute_tool.assert_called_once()
         # Should make initial call and then fallback call
         assert mock_client.messages.create.call_count == 2
+        fallback_messages = mock_client.messages.create.call_args[1]["messages"]
+        assert fallback_messages == [{"role": "user", "content": "What is MCP?"}]
 
-    def test_sequential_conversation_history_preserved(self):
+    def test_sequential_conversation_history_preserved(self, sequential_rig):
         """Test that conversation history is preserved in sequential calls"""
-        mock_client = Mock()
+        generator, mock_client = sequential_rig
 
         # Setup response that doesn't use tools (single round)
-        response = Mock()
-        response.stop_reason = "end_turn"
-        response.content = [Mock(text="Response with history context.")]
+        response = SimpleNamespace(
+            stop_reason="end_turn",
+            content=[_TextBlock(text="Response with history context.")],
+        )
+        mock_client.messages.create.side_effect = None
         mock_client.messages.create.return_value = response
 
         history = "User: Hello\\nAssistant: Hi there!"
 
-        with patch("ai_generator.anthropic.Anthropic") as mock_anthropic_class:
-            mock_anthropic_class.return_value = mock_client
-            generator = AIGenerator(
-                api_key="test-key", model="claude-sonnet-4-20250514"
-            )
-
-            # Execute
-            generator.generate_response_sequential(
-                query="What is MCP?",
-                conversation_history=history,
-                tools=[{"name": "search_course_content"}],
-                tool_manager=Mock(),
-            )
+        # Execute
+        generator.generate_response_sequential(
+            query="What is MCP?",
+            conversation_history=history,
+            tools=[{"name": "search_course_content"}],
+            tool_manager=Mock(),
+        )
 
         # Verify history is included in system prompt
         call_args = mock_client.messages.create.call_args[1]
-        system_content = call_args["system"]
+        system_content = _system_text(call_args)
         assert "Previous conversation:" in system_content
         assert history in system_content
 
-    def test_sequential_message_flow_two_rounds(self):
-        """Test proper message flow across two rounds of tool usage"""
-        mock_client = Mock()
+    def test_sequential_parallel_tool_calls_keep_order(self, sequential_rig):
+        """Test that different tools in one round run concurrently, in order"""
+        generator, mock_client = sequential_rig
+        # Each call waits for the other, so this only passes if they overlap
+        barrier = threading.Barrier(2, timeout=5)
+
+        def execute_tool(name, **kwargs):
+            barrier.wait()
+            return f"Result for {name}"
+
         tool_manager = Mock()
-        tool_manager.execute_tool.return_value = "Search result"
-
-        # Round 1: Tool use response
-        first_response = Mock()
-        first_response.stop_reason = "tool_use"
-        first_tool_block = Mock()
-        first_tool_block.type = "tool_use"
-        first_tool_block.name = "search_course_content"
-        first_tool_block.id = "tool_123"
-        first_tool_block.input = {"query": "test"}
-        first_response.content = [first_tool_block]
-
-        # Round 2: Final response (no tool use)
-        second_response = Mock()
-        second_response.stop_reason = "end_turn"
-        second_response.content = [Mock(text="Final response after tool use.")]
-
-        mock_client.messages.create.side_effect = [first_response, second_response]
-
-        with patch("ai_generator.anthropic.Anthropic") as mock_anthropic_class:
-            mock_anthropic_class.return_value = mock_client
-            generator = AIGenerator(
-                api_key="test-key", model="claude-sonnet-4-20250514"
+        tool_manager.execute_tool.side_effect = execute_tool
+
+        tool_blocks = [
+            SimpleNamespace(
+                type="tool_use",
+                name="search_course_content",
+                id="tool_1",
+                input={"query": "first"},
+            ),
+            SimpleNamespace(
+                type="tool_use",
+                name="get_course_outline",
+                id="tool_2",
+                input={"course_title": "second"},
+            ),
+        ]
+        first_response = SimpleNamespace(stop_reason="tool_use", content=tool_blocks)
+        second_response = SimpleNamespace(
+            stop_reason="end_turn", content=[_TextBlock(text="Done")]
+        )
+        mock_client.messages.create.side_effect = iter(
+            (first_response, second_response)
+        )
+
+        response = generator.generate_response_sequential(
+            query="Test query",
+            tools=[{"name": "search_course_content"}],
+            tool_manager=tool_manager,
+        )
+
+        assert response == "Done"
+        tool_results = mock_client.messages.create.call_args[1]["messages"][2]
+        assert tool_results["content"] == [
+            {
+                "type": "tool_result",
+                "tool_use_id": "tool_1",
+                "content": "Result for search_course_content",
+            },
+            {
+                "type": "tool_result",
+                "tool_use_id": "tool_2",
+                "content": "Result for get_course_outline",
+            },
+        ]
+
+    def test_sequential_same_tool_calls_run_serially(self, sequential_rig):
+        """Test that calls to one tool run one at a time in block order"""
+        generator, mock_client = sequential_rig
+        # A tool keeps only its latest call's sources, so order must be fixed
+        calls = []
+
+        def execute_tool(name, query):
+            calls.append(query)
+            return f"Result for {query}"
+
+        tool_manager = Mock()
+        tool_manager.execute_tool.side_effect = execute_tool
+
+        tool_blocks = [
+            SimpleNamespace(
+                type="tool_use",
+                name="search_course_content",
+                id=f"tool_{query}",
+                input={"query": query},
+            )
+            for query in ("first", "second", "third")
+        ]
+        mock_client.messages.create.side_effect = iter(
+            (
+                SimpleNamespace(stop_reason="tool_use", content=tool_blocks),
+                SimpleNamespace(stop_reason="end_turn", content=[_TextBlock("Done")]),
             )
+        )
 
-            # Execute
-            response = generator.generate_response_sequential(
-                query="Test query",
-                tools=[{"name": "search_course_content"}],
-                tool_manager=tool_manager,
+        generator.generate_response_sequential(
+            query="Test query",
+            tools=[{"name": "search_course_content"}],
+            tool_manager=tool_manager,
+        )
+
+        assert calls == ["first", "second", "third"]
+
+    def test_tool_result_content_flattened_to_string(self, sequential_rig):
+        """Test that non-string tool output is sent as a plain string"""
+        tool_manager = Mock()
+        tool_manager.execute_tool.return_value = {"lessons": 3}
+
+        generator, mock_client = sequential_rig
+        generator.generate_response_sequential(
+            query="Test query",
+            tools=[{"name": "search_course_content"}],
+            tool_manager=tool_manager,
+        )
+
+        messages = mock_client.messages.create.call_args[1]["messages"]
+        assert messages[2]["content"] == [
+            {
+                "type": "tool_result",
+                "tool_use_id": "tool_123",
+                "content": "{'lessons': 3}",
+            }
+        ]
+
+    def test_sequential_one_failed_tool_still_runs_the_others(self, sequential_rig):
+        """Test that a failing tool call does not stop its siblings from running"""
+        generator, mock_client = sequential_rig
+        tool_manager = Mock()
+        tool_manager.execute_tool.side_effect = lambda name, query: (
+            "ok" if query == "good" else 1 / 0
+        )
+
+        tool_blocks = []
+        for tool_id, query in [("tool_1", "bad"), ("tool_2", "good")]:
+            block = SimpleNamespace(
+                type="tool_use",
+                name="search_course_content",
+                id=tool_id,
+                input={"query": query},
             )
+            tool_blocks.append(block)
+        first_response = SimpleNamespace(stop_reason="tool_use", content=tool_blocks)
+        fallback_response = SimpleNamespace(
+            stop_reason="end_turn", content=[_TextBlock(text="Fallback response.")]
+        )
+        mock_client.messages.create.side_effect = iter(
+            (first_response, fallback_response)
+        )
 
-        # Verify
-        assert response == "Final response after tool use."
-        assert mock_client.messages.create.call_count == 2
-        assert tool_manager.execute_tool.call_count == 1
+        response = generator.generate_response_sequential(
+            query="Test query",
+            tools=[{"name": "search_course_content"}],
+            tool_manager=tool_manager,
+        )
+
+        assert response == "Fallback response."
+        assert tool_manager.execute_tool.call_count == 2
+
+
+def _fake_embedding_function(texts):
+    """Embed paraphrases of the same question in nearly the same direction"""
+    vectors = {
+        "What is MCP?": [1.0, 0.0, 0.0],
+        "what's MCP?": [0.99, 0.05, 0.0],
+        "What is Python?": [0.0, 1.0, 0.0],
+    }
+    return [vectors[text] for text in texts]
+
+
+class TestAIGeneratorSemanticCache:
+    """Test semantic response caching in front of the Claude API"""
+
+    def test_paraphrased_query_served_from_cache(
+        self, ai_generator_with_mock_client, mock_anthropic_client
+    ):
+        """Test that a paraphrased repeat question skips the API call"""
+        ai_generator_with_mock_client.response_cache = SemanticCache(
+            _fake_embedding_function
+        )
+
+        first = ai_generator_with_mock_client.generate_response(query="What is MCP?")
+        second = ai_generator_with_mock_client.generate_response(query="what's MCP?")
+
+        assert first == second == "This is a sample response about MCP."
+        mock_anthropic_client.messages.create.assert_called_once()
+
+    def test_dissimilar_query_misses_cache(
+        self, ai_generator_with_mock_client, mock_anthropic_client
+    ):
+        """Test that an unrelated question still reaches the API"""
+        ai_generator_with_mock_client.response_cache = SemanticCache(
+            _fake_embedding_function
+        )
+
+        ai_generator_with_mock_client.generate_response(query="What is MCP?")
+        ai_generator_with_mock_client.generate_response(query="What is Python?")
+
+        assert mock_anthropic_client.messages.create.call_count == 2
+
+    def test_different_tool_set_misses_cache(
+        self, ai_generator_with_mock_client, mock_anthropic_client
+    ):
+        """Test that the same question with different tools is not reused"""
+        ai_generator_with_mock_client.response_cache = SemanticCache(
+            _fake_embedding_function
+        )
+
+        ai_generator_with_mock_client.generate_response(
+            query="What is MCP?", tools=[{"name": "search_course_content"}]
+        )
+        ai_generator_with_mock_client.generate_response(
+            query="What is MCP?", tools=[{"name": "get_course_outline"}]
+        )
+
+        assert mock_anthropic_client.messages.create.call_count == 2
+
+    def test_prompt_prefix_left_out_of_embedding(self):
+        """Test that only the user's question is embedded, not the instructions"""
+        embed = Mock(side_effect=_fake_embedding_function)
+        cache = SemanticCache(embed, prompt_prefix="Answer this: ")
+
+        cache.store("Answer this: What is MCP?", "MCP is a protocol.")
+
+        assert cache.lookup("Answer this: what's MCP?") == "MCP is a protocol."
+        assert [call.args[0] for call in embed.call_args_list] == [
+            ["What is MCP?"],
+            ["what's MCP?"],
+        ]
+
+    def test_oldest_entry_evicted_when_full(self):
+        """Test that a full cache overwrites its oldest entry first"""
+        cache = SemanticCache(_fake_embedding_function, max_size=2)
+
+        cache.store("What is MCP?", "MCP answer")
+        cache.store("What is Python?", "Python answer")
+        cache.store("what's MCP?", "Newer MCP answer")
+
+        assert cache.lookup("What is MCP?") == "Newer MCP answer"
+        assert cache.lookup("What is Python?") == "Python answer"
+
+    def test_tool_answers_not_cached(
+        self,
+        shared_generator,
+        mock_anthropic_client_with_tool_use,
+        tool_manager_with_search_tool,
+        tool_definitions,
+    ):
+        """Test that answers built from tool results are never cached"""
+        generator = shared_generator
+        generator.client = mock_anthropic_client_with_tool_use
+        generator.response_cache = SemanticCache(_fake_embedding_function)
+
+        generator.generate_response_sequential(
+            query="What is MCP?",
+            tools=tool_definitions,
+            tool_manager=tool_manager_with_search_tool,
+        )
+
+        assert (
+            generator.response_cache.lookup(
+                "What is MCP?",
+                tools=tool_definitions,
+            )
+            is None
+        )
 
-        # Verify that tools are available in both API calls
-        calls = mock_client.messages.create.call_args_list
-        assert "tools" in calls[0][1]  # First call has tools
-        assert "tools" in calls[1][1]  # Second call also has tools
+
+def _mock_stream(chunks):
+    """Build a messages.stream() mock yielding the given text chunks"""
+    # Needs context-manager dunders; spec= limits them to what the SDK has
+    stream = MagicMock(spec=MessageStreamManager)
+    stream.__enter__.return_value.text_stream = iter(chunks)
+    return stream
+
+
+class TestAIGeneratorStreaming:
+    """Test streaming responses as text chunks"""
+
+    def test_stream_without_tools(
+        self, ai_generator_with_mock_client, mock_anthropic_client
+    ):
+        """Test that a plain answer is streamed chunk by chunk"""
+        mock_anthropic_client.messages.stream.return_value = _mock_stream(
+            ["MCP is ", "a protocol."]
+        )
+
+        chunks = list(
+            ai_generator_with_mock_client.generate_response_stream(query="What is MCP?")
+        )
+
+        assert chunks == ["MCP is ", "a protocol."]
+        mock_anthropic_client.messages.create.assert_not_called()
+        stream_kwargs = mock_anthropic_client.messages.stream.call_args[1]
+        assert stream_kwargs["messages"][0]["content"] == "What is MCP?"
+
+    def test_stream_follow_up_after_tool_use(
+        self,
+        shared_generator,
+        mock_anthropic_client_with_tool_use,
+        tool_manager_with_search_tool,
+        tool_definitions,
+    ):
+        """Test that tool use runs unstreamed and only the final answer streams"""
+        mock_client = mock_anthropic_client_with_tool_use
+        # Stub the client's own stream() rather than replacing it, so nothing
+        # outlives this test on the session-shared client
+        mock_client.messages.stream.return_value = _mock_stream(
+            ["MCP stands for ", "Model Context Protocol."]
+        )
+
+        generator = shared_generator
+        generator.client = mock_client
+
+        chunks = list(
+            generator.generate_response_stream(
+                query="What is MCP?",
+                tools=tool_definitions,
+                tool_manager=tool_manager_with_search_tool,
+            )
+        )
+
+        assert "".join(chunks) == "MCP stands for Model Context Protocol."
+        mock_client.messages.create.assert_called_once()
+        stream_kwargs = mock_client.messages.stream.call_args[1]
+        assert stream_kwargs["messages"][2]["content"][0]["type"] == "tool_result"
+        assert "tools" not in stream_kwargs
+
+    def test_stream_caches_complete_answer(
+        self, ai_generator_with_mock_client, mock_anthropic_client
+    ):
+        """Test that the joined streamed answer is cached for repeat questions"""
+        ai_generator_with_mock_client.response_cache = SemanticCache(
+            _fake_embedding_function
+        )
+        mock_anthropic_client.messages.stream.return_value = _mock_stream(
+            ["MCP is ", "a protocol."]
+        )
+
+        list(ai_generator_with_mock_client.generate_response_stream("What is MCP?"))
+        repeat = list(
+            ai_generator_with_mock_client.generate_response_stream("what's MCP?")
+        )
+
+        assert repeat == ["MCP is a protocol."]
+        mock_anthropic_client.messages.stream.assert_called_once()
+
+
+def _batch_entry(custom_id, message=None, result_type="succeeded"):
+    """Build one line of a Message Batches results stream"""
+    return SimpleNamespace(
+        custom_id=custom_id,
+        result=SimpleNamespace(type=result_type, message=message),
+    )
+
+
+class TestAIGeneratorBatch:
+    """Test answering several queries through the Message Batches API"""
+
+    def test_batch_results_mapped_back_in_query_order(
+        self, ai_generator_with_mock_client, mock_anthropic_client
+    ):
+        """Test that results arriving out of order map back to their queries"""
+        batches = mock_anthropic_client.messages.batches
+        batches.create.return_value = SimpleNamespace(
+            id="batch-1", processing_status="ended"
+        )
+        batches.results.return_value = [
+            _batch_entry(
+                "query-1",
+                SimpleNamespace(
+                    stop_reason="end_turn", content=[_TextBlock(text="Answer two")]
+                ),
+            ),
+            _batch_entry(
+                "query-0",
+                SimpleNamespace(
+                    stop_reason="end_turn", content=[_TextBlock(text="Answer one")]
+                ),
+            ),
+        ]
+
+        responses = ai_generator_with_mock_client.generate_responses_batch(
+            ["First question", "Second question"]
+        )
+
+        assert responses == ["Answer one", "Answer two"]
+        requests = batches.create.call_args[1]["requests"]
+        assert [request["custom_id"] for request in requests] == [
+            "query-0",
+            "query-1",
+        ]
+        assert requests[1]["params"]["messages"][0]["content"] == "Second question"
+        mock_anthropic_client.messages.create.assert_not_called()
+
+    def test_batch_polls_with_exponential_backoff(
+        self, ai_generator_with_mock_client, mock_anthropic_client
+    ):
+        """Test that status polling backs off until the batch has ended"""
+        batches = mock_anthropic_client.messages.batches
+        batches.create.return_value = SimpleNamespace(
+            id="batch-1", processing_status="in_progress"
+        )
+        batches.retrieve.side_effect = [
+            SimpleNamespace(id="batch-1", processing_status="in_progress"),
+            SimpleNamespace(id="batch-1", processing_status="ended"),
+        ]
+        batches.results.return_value = [
+            _batch_entry(
+                "query-0",
+                SimpleNamespace(
+                    stop_reason="end_turn", content=[_TextBlock(text="Done")]
+                ),
+            )
+        ]
+
+        with patch("ai_generator.time.sleep") as mock_sleep:
+            responses = ai_generator_with_mock_client.generate_responses_batch(
+                ["Question"], poll_interval=1.0
+            )
+
+        assert responses == ["Done"]
+        assert [call.args[0] for call in mock_sleep.call_args_list] == [1.0, 2.0]
+        batches.results.assert_called_once_with("batch-1")
+
+    def test_batch_poll_retries_transient_errors(
+        self, ai_generator_with_mock_client, mock_anthropic_client
+    ):
+        """Test that a rate limit while polling is retried, not fatal"""
+        batches = mock_anthropic_client.messages.batches
+        batches.create.return_value = SimpleNamespace(
+            id="batch-1", processing_status="in_progress"
+        )
+        batches.retrieve.side_effect = iter(
+            (
+                _api_error(anthropic.RateLimitError, 429),
+                SimpleNamespace(id="batch-1", processing_status="ended"),
+            )
+        )
+        batches.results.return_value = [
+            _batch_entry(
+                "query-0",
+                SimpleNamespace(
+                    stop_reason="end_turn", content=[_TextBlock(text="Done")]
+                ),
+            )
+        ]
+
+        with patch("ai_generator.time.sleep"):
+            responses = ai_generator_with_mock_client.generate_responses_batch(
+                ["Question"]
+            )
+
+        assert responses == ["Done"]
+        assert batches.retrieve.call_count == 2
+
+    def test_batch_tool_use_falls_back_to_serial_execution(
+        self, ai_generator_with_mock_client, mock_anthropic_client
+    ):
+        """Test that tool-use results finish through a synchronous second turn"""
+        mock_tool_manager = Mock()
+        mock_tool_manager.execute_tool.return_value = "MCP course content"
+        tool_block = SimpleNamespace(
+            type="tool_use",
+            name="search_course_content",
+            id="tool_1",
+            input={"query": "MCP"},
+        )
+        batches = mock_anthropic_client.messages.batches
+        batches.create.return_value = SimpleNamespace(
+            id="batch-1", processing_status="ended"
+        )
+        batches.results.return_value = [
+            _batch_entry(
+                "query-0", SimpleNamespace(stop_reason="tool_use", content=[tool_block])
+            ),
+            _batch_entry("query-1", result_type="errored"),
+        ]
+
+        responses = ai_generator_with_mock_client.generate_responses_batch(
+            ["What is MCP?", "Broken question"],
+            tools=[{"name": "search_course_content"}],
+            tool_manager=mock_tool_manager,
+        )
+
+        assert responses[0] == "This is a sample response about MCP."
+        assert "errored" in responses[1]
+        mock_tool_manager.execute_tool.assert_called_once_with(
+            "search_course_content", query="MCP"
+        )
+        follow_up = mock_anthropic_client.messages.create.call_args[1]
+        assert follow_up["messages"][0]["content"] == "What is MCP?"
+
+    def test_batch_tool_follow_up_failure_keeps_other_results(
+        self, ai_generator_with_mock_client, mock_anthropic_client
+    ):
+        """Test that one failed tool follow-up doesn't discard the batch"""
+        mock_tool_manager = Mock()
+        mock_tool_manager.execute_tool.side_effect = Exception("Search failed")
+        tool_block = SimpleNamespace(
+            type="tool_use",
+            name="search_course_content",
+            id="tool_1",
+            input={"query": "MCP"},
+        )
+        batches = mock_anthropic_client.messages.batches
+        batches.create.return_value = SimpleNamespace(
+            id="batch-1", processing_status="ended"
+        )
+        batches.results.return_value = [
+            _batch_entry(
+                "query-0", SimpleNamespace(stop_reason="tool_use", content=[tool_block])
+            ),
+            _batch_entry(
+                "query-1",
+                SimpleNamespace(
+                    stop_reason="end_turn", content=[_TextBlock(text="Answer two")]
+                ),
+            ),
+        ]
+
+        responses = ai_generator_with_mock_client.generate_responses_batch(
+            ["What is MCP?", "Second question"],
+            tools=[{"name": "search_course_content"}],
+            tool_manager=mock_tool_manager,
+        )
+
+        assert isinstance(responses[0], FallbackResponse)
+        assert "Search failed" in responses[0]
+        assert responses[1] == "Answer two"
+
+    def test_batch_skips_cached_queries(
+        self, ai_generator_with_mock_client, mock_anthropic_client
+    ):
+        """Test that cached answers are not resubmitted"""
+        ai_generator_with_mock_client.response_cache = SemanticCache(
+            _fake_embedding_function
+        )
+        ai_generator_with_mock_client.response_cache.store("What is MCP?", "Cached")
+
+        responses = ai_generator_with_mock_client.generate_responses_batch(
+            ["what's MCP?"]
+        )
+
+        assert responses == ["Cached"]
+        mock_anthropic_client.messages.batches.create.assert_not_called()
+
+
+def _api_error(error_class, status_code, headers=None):
+    """Build an Anthropic API status error with the given HTTP response"""
+    request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+    response = httpx.Response(status_code, headers=headers, request=request)
+    return error_class("API error", response=response, body=None)
+
+
+class TestAIGeneratorRetry:
+    """Test retrying rate-limited and transient API failures"""
+
+    def test_rate_limit_retried_with_backoff(
+        self, ai_generator_with_mock_client, mock_anthropic_client
+    ):
+        """Test that 429 and 5xx errors are retried with growing delays"""
+        success = mock_anthropic_client.messages.create.return_value
+        mock_anthropic_client.messages.create.side_effect = iter(
+            (
+                _api_error(anthropic.RateLimitError, 429),
+                _api_error(anthropic.InternalServerError, 529),
+                success,
+            )
+        )
+
+        with (
+            patch("ai_generator.time.sleep") as mock_sleep,
+            patch("ai_generator.random.random", return_value=0.5),
+        ):
+            response = ai_generator_with_mock_client.generate_response(query="test")
+
+        assert response == "This is a sample response about MCP."
+        assert mock_anthropic_client.messages.create.call_count == 3
+        assert [call.args[0] for call in mock_sleep.call_args_list] == [1.5, 2.5]
+
+    def test_connection_errors_retried(
+        self, ai_generator_with_mock_client, mock_anthropic_client
+    ):
+        """Test that dropped connections and timeouts are retried too"""
+        request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+        success = mock_anthropic_client.messages.create.return_value
+        mock_anthropic_client.messages.create.side_effect = iter(
+            (
+                anthropic.APIConnectionError(request=request),
+                anthropic.APITimeoutError(request=request),
+                success,
+            )
+        )
+
+        with (
+            patch("ai_generator.time.sleep") as mock_sleep,
+            patch("ai_generator.random.random", return_value=0.5),
+        ):
+            response = ai_generator_with_mock_client.generate_response(query="test")
+
+        assert response == "This is a sample response about MCP."
+        assert [call.args[0] for call in mock_sleep.call_args_list] == [1.5, 2.5]
+
+    def test_retry_after_header_respected(
+        self, ai_generator_with_mock_client, mock_anthropic_client
+    ):
+        """Test that the server's Retry-After delay is used when present"""
+        success = mock_anthropic_client.messages.create.return_value
+        mock_anthropic_client.messages.create.side_effect = iter(
+            (
+                _api_error(anthropic.RateLimitError, 429, {"retry-after": "7"}),
+                success,
+            )
+        )
+
+        with patch("ai_generator.time.sleep") as mock_sleep:
+            ai_generator_with_mock_client.generate_response(query="test")
+
+        mock_sleep.assert_called_once_with(7.0)
+
+    def test_retry_after_capped_at_max_backoff(
+        self, ai_generator_with_mock_client, mock_anthropic_client
+    ):
+        """Test that a long Retry-After doesn't stall the request past the cap"""
+        success = mock_anthropic_client.messages.create.return_value
+        mock_anthropic_client.messages.create.side_effect = iter(
+            (
+                _api_error(anthropic.RateLimitError, 429, {"retry-after": "3600"}),
+                success,
+            )
+        )
+
+        with patch("ai_generator.time.sleep") as mock_sleep:
+            ai_generator_with_mock_client.generate_response(query="test")
+
+        mock_sleep.assert_called_once_with(AIGenerator.MAX_BACKOFF_SECONDS)
+
+    def test_stream_open_retried(
+        self, ai_generator_with_mock_client, mock_anthropic_client
+    ):
+        """Test that a stream rejected before any text arrives is reopened"""
+        rejected = _mock_stream([])
+        rejected.__enter__.side_effect = _api_error(anthropic.RateLimitError, 429)
+        mock_anthropic_client.messages.stream.side_effect = iter(
+            (rejected, _mock_stream(["MCP is ", "a protocol."]))
+        )
+
+        with patch("ai_generator.time.sleep") as mock_sleep:
+            chunks = list(
+                ai_generator_with_mock_client.generate_response_stream("What is MCP?")
+            )
+
+        assert chunks == ["MCP is ", "a protocol."]
+        mock_sleep.assert_called_once()
+        rejected.__exit__.assert_not_called()
+
+    def test_client_errors_not_retried(
+        self, ai_generator_with_mock_client, mock_anthropic_client
+    ):
+        """Test that non-transient 4xx errors fail immediately"""
+        mock_anthropic_client.messages.create.side_effect = _api_error(
+            anthropic.BadRequestError, 400
+        )
+
+        with patch("ai_generator.time.sleep") as mock_sleep:
+            with pytest.raises(anthropic.BadRequestError):
+                ai_generator_with_mock_client.generate_response(query="test")
+
+        mock_sleep.assert_not_called()
+        mock_anthropic_client.messages.create.assert_called_once()
+
+    def test_gives_up_after_max_attempts(
+        self, ai_generator_with_mock_client, mock_anthropic_client
+    ):
+        """Test that persistent rate limits surface after the last attempt"""
+        mock_anthropic_client.messages.create.side_effect = _api_error(
+            anthropic.RateLimitError, 429
+        )
+
+        with patch("ai_generator.time.sleep"):
+            response = ai_generator_with_mock_client.generate_response_sequential(
+                query="test",
+                tools=[{"name": "search_course_content"}],
+                tool_manager=Mock(),
+            )
+
+        assert isinstance(response, FallbackResponse)
+        assert response.startswith("I encountered an error")
+        assert (
+            mock_anthropic_client.messages.create.call_count == AIGenerator.MAX_ATTEMPTS
+        )
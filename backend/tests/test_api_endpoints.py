@@ -1,8 +1,11 @@
 """Tests for FastAPI endpoints in the RAG system"""
 
+from unittest.mock import call
+
 import pytest
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.testclient import TestClient
-from unittest.mock import Mock
 
 
 @pytest.mark.api
@@ -12,13 +15,13 @@ class TestQueryEndpoint:
     def test_query_endpoint_success(self, api_client, mock_rag_for_api, sample_query_request, sample_query_response):
         """Test successful query processing"""
         # Setup mock response
-        mock_rag_for_api.query.return_value = (
+        mock_rag_for_api.aquery.return_value = (
             sample_query_response["answer"],
             sample_query_response["sources"]
         )
         
         # Make request
-        response = api_client.post("/api/query", json=sample_query_request)
+        response = api_client.post("/api/query", json=dict(sample_query_request))
         
         # Verify response
         assert response.status_code == 200
@@ -29,7 +32,7 @@ class TestQueryEndpoint:
         assert data["session_id"] == sample_query_request["session_id"]
         
         # Verify mock was called correctly
-        mock_rag_for_api.query.assert_called_once_with(
+        mock_rag_for_api.aquery.assert_called_once_with(
             sample_query_request["query"],
             sample_query_request["session_id"]
         )
@@ -38,7 +41,7 @@ class TestQueryEndpoint:
         """Test query endpoint without session ID (should generate one)"""
         # Setup
         request_data = {"query": "What is machine learning?"}
-        mock_rag_for_api.query.return_value = (
+        mock_rag_for_api.aquery.return_value = (
             "Machine learning is a subset of AI",
             [{"text": "ML Course", "link": "https://example.com/ml"}]
         )
@@ -55,7 +58,7 @@ class TestQueryEndpoint:
         assert data["session_id"] == "test_session_id"  # Default from test fixture
         
         # Verify mock was called with generated session ID
-        mock_rag_for_api.query.assert_called_once_with(
+        mock_rag_for_api.aquery.assert_called_once_with(
             "What is machine learning?",
             "test_session_id"
         )
@@ -63,7 +66,7 @@ class TestQueryEndpoint:
     def test_query_endpoint_error_handling(self, api_client, mock_rag_for_api):
         """Test query endpoint error handling"""
         # Setup mock to raise exception
-        mock_rag_for_api.query.side_effect = Exception("RAG system error")
+        mock_rag_for_api.aquery.side_effect = Exception("RAG system error")
         
         # Make request
         request_data = {"query": "test query", "session_id": "test_session"}
@@ -74,20 +77,10 @@ class TestQueryEndpoint:
         data = response.json()
         assert "RAG system error" in data["detail"]
 
-    def test_query_endpoint_malformed_request(self, api_client):
-        """Test query endpoint with malformed request"""
-        # Missing required 'query' field
-        response = api_client.post("/api/query", json={"session_id": "test"})
-        
-        # Verify validation error
-        assert response.status_code == 422
-        data = response.json()
-        assert "detail" in data
-
     def test_query_endpoint_empty_query(self, api_client, mock_rag_for_api):
         """Test query endpoint with empty query string"""
         # Setup
-        mock_rag_for_api.query.return_value = ("Please provide a question", [])
+        mock_rag_for_api.aquery.return_value = ("Please provide a question", [])
         
         # Make request with empty query
         request_data = {"query": "", "session_id": "test_session"}
@@ -112,16 +105,17 @@ class TestQueryEndpoint:
 
 
 @pytest.mark.api
+@pytest.mark.anyio
 class TestCoursesEndpoint:
     """Test /api/courses endpoint functionality"""
 
-    def test_courses_endpoint_success(self, api_client, mock_rag_for_api, sample_course_analytics):
+    async def test_courses_endpoint_success(self, async_client, mock_rag_for_api, sample_course_analytics):
         """Test successful course statistics retrieval"""
         # Setup mock response
         mock_rag_for_api.get_course_analytics.return_value = sample_course_analytics
         
         # Make request
-        response = api_client.get("/api/courses")
+        response = await async_client.get("/api/courses")
         
         # Verify response
         assert response.status_code == 200
@@ -133,7 +127,7 @@ class TestCoursesEndpoint:
         # Verify mock was called
         mock_rag_for_api.get_course_analytics.assert_called_once()
 
-    def test_courses_endpoint_empty_analytics(self, api_client, mock_rag_for_api):
+    async def test_courses_endpoint_empty_analytics(self, async_client, mock_rag_for_api):
         """Test courses endpoint with no courses available"""
         # Setup mock response
         mock_rag_for_api.get_course_analytics.return_value = {
@@ -142,7 +136,7 @@ class TestCoursesEndpoint:
         }
         
         # Make request
-        response = api_client.get("/api/courses")
+        response = await async_client.get("/api/courses")
         
         # Verify response
         assert response.status_code == 200
@@ -151,13 +145,13 @@ class TestCoursesEndpoint:
         assert data["total_courses"] == 0
         assert data["course_titles"] == []
 
-    def test_courses_endpoint_error_handling(self, api_client, mock_rag_for_api):
+    async def test_courses_endpoint_error_handling(self, async_client, mock_rag_for_api):
         """Test courses endpoint error handling"""
         # Setup mock to raise exception
         mock_rag_for_api.get_course_analytics.side_effect = Exception("Analytics error")
         
         # Make request
-        response = api_client.get("/api/courses")
+        response = await async_client.get("/api/courses")
         
         # Verify error response
         assert response.status_code == 500
@@ -166,38 +160,19 @@ class TestCoursesEndpoint:
 
 
 @pytest.mark.api
+@pytest.mark.anyio
 class TestNewChatEndpoint:
     """Test /api/new-chat endpoint functionality"""
 
-    def test_new_chat_endpoint_with_session_id(self, api_client, mock_rag_for_api):
-        """Test new chat endpoint with session ID"""
-        # Setup
-        mock_session_manager = Mock()
-        mock_rag_for_api.session_manager = mock_session_manager
-        
+    @pytest.mark.parametrize("request_data, cleared_session", [
+        ({"session_id": "test_session_123"}, "test_session_123"),
+        ({}, None),  # session_id omitted
+        ({"session_id": None}, None),  # explicit null
+    ], ids=["with_session_id", "without_session_id", "none_session_id"])
+    async def test_new_chat_endpoint_session_ids(self, async_client, mock_session_manager, request_data, cleared_session):
+        """Test new chat endpoint clears only a session ID that was given"""
         # Make request
-        request_data = {"session_id": "test_session_123"}
-        response = api_client.post("/api/new-chat", json=request_data)
-        
-        # Verify response
-        assert response.status_code == 200
-        data = response.json()
-        
-        assert data["status"] == "success"
-        assert data["message"] == "Session cleared"
-        
-        # Verify session manager was called
-        mock_session_manager.clear_session.assert_called_once_with("test_session_123")
-
-    def test_new_chat_endpoint_without_session_id(self, api_client, mock_rag_for_api):
-        """Test new chat endpoint without session ID"""
-        # Setup
-        mock_session_manager = Mock()
-        mock_rag_for_api.session_manager = mock_session_manager
-        
-        # Make request without session_id
-        request_data = {}
-        response = api_client.post("/api/new-chat", json=request_data)
+        response = await async_client.post("/api/new-chat", json=request_data)
         
         # Verify response
         assert response.status_code == 200
@@ -206,38 +181,20 @@ class TestNewChatEndpoint:
         assert data["status"] == "success"
         assert data["message"] == "Session cleared"
         
-        # Verify session manager was not called (no session ID provided)
-        mock_session_manager.clear_session.assert_not_called()
+        # Verify session manager was called only for a real session ID
+        if cleared_session is None:
+            mock_session_manager.clear_session.assert_not_called()
+        else:
+            mock_session_manager.clear_session.assert_called_once_with(cleared_session)
 
-    def test_new_chat_endpoint_with_none_session_id(self, api_client, mock_rag_for_api):
-        """Test new chat endpoint with null session ID"""
-        # Setup
-        mock_session_manager = Mock()
-        mock_rag_for_api.session_manager = mock_session_manager
-        
-        # Make request with null session_id
-        request_data = {"session_id": None}
-        response = api_client.post("/api/new-chat", json=request_data)
-        
-        # Verify response
-        assert response.status_code == 200
-        data = response.json()
-        
-        assert data["status"] == "success"
-        
-        # Verify session manager was not called (session ID is None)
-        mock_session_manager.clear_session.assert_not_called()
-
-    def test_new_chat_endpoint_error_handling(self, api_client, mock_rag_for_api):
+    async def test_new_chat_endpoint_error_handling(self, async_client, mock_session_manager):
         """Test new chat endpoint error handling"""
         # Setup mock to raise exception
-        mock_session_manager = Mock()
         mock_session_manager.clear_session.side_effect = Exception("Session error")
-        mock_rag_for_api.session_manager = mock_session_manager
         
         # Make request
         request_data = {"session_id": "test_session"}
-        response = api_client.post("/api/new-chat", json=request_data)
+        response = await async_client.post("/api/new-chat", json=request_data)
         
         # Verify error response
         assert response.status_code == 500
@@ -246,12 +203,13 @@ class TestNewChatEndpoint:
 
 
 @pytest.mark.api
+@pytest.mark.anyio
 class TestRootEndpoint:
     """Test root endpoint functionality"""
 
-    def test_root_endpoint(self, api_client):
+    async def test_root_endpoint(self, async_client):
         """Test root endpoint returns welcome message"""
-        response = api_client.get("/")
+        response = await async_client.get("/")
         
         # Verify response
         assert response.status_code == 200
@@ -261,45 +219,36 @@ class TestRootEndpoint:
 
 @pytest.mark.api
 class TestMiddlewareAndCORS:
-    """Test middleware functionality"""
+    """Test middleware configuration"""
 
-    def test_cors_headers_present(self, api_client):
-        """Test that CORS headers are properly set"""
-        response = api_client.get("/", headers={"Origin": "http://localhost:3000"})
+    def test_production_middleware_installed(self, test_app_with_middleware):
+        """Test that the CORS and trusted-host middleware are registered"""
+        # Inspect the stack directly; a TestClient round-trip adds nothing here
+        middleware = {m.cls: m.kwargs for m in test_app_with_middleware.user_middleware}
         
-        assert response.status_code == 200
-        # Note: TestClient doesn't fully simulate CORS, but we can verify the endpoint works
-
-    def test_options_request(self, api_client):
-        """Test OPTIONS request for CORS preflight"""
-        response = api_client.options("/api/query")
-        
-        # Should not return error (exact status depends on FastAPI CORS implementation)
-        assert response.status_code in [200, 405]  # 405 is also acceptable for OPTIONS
+        assert middleware[CORSMiddleware]["allow_origins"] == ["*"]
+        assert middleware[CORSMiddleware]["allow_methods"] == ["*"]
+        assert middleware[TrustedHostMiddleware]["allowed_hosts"] == ["*"]
 
 
 @pytest.mark.api
 class TestRequestValidation:
     """Test request validation and response models"""
 
-    def test_query_request_validation(self, api_client):
+    @pytest.mark.parametrize("payload, expected_code", [
+        ({"query": 123, "session_id": "test"}, 422),  # integer instead of string
+        ({"session_id": "test"}, 422),  # missing required query
+        ({"query": "test", "session_id": "test", "extra_field": "should_be_ignored"}, 200),  # extra fields allowed
+    ], ids=["wrong_type", "missing_query", "extra_field"])
+    def test_query_request_validation(self, api_client, mock_rag_for_api, payload, expected_code):
         """Test query request validation with various inputs"""
-        # Test with integer instead of string
-        response = api_client.post("/api/query", json={"query": 123, "session_id": "test"})
-        assert response.status_code == 422
+        mock_rag_for_api.aquery.return_value = ("Answer", [])
         
-        # Test with missing query
-        response = api_client.post("/api/query", json={"session_id": "test"})
-        assert response.status_code == 422
+        response = api_client.post("/api/query", json=payload)
         
-        # Test with extra fields (should be allowed)
-        response = api_client.post("/api/query", json={
-            "query": "test",
-            "session_id": "test",
-            "extra_field": "should_be_ignored"
-        })
-        # Should not return validation error
-        assert response.status_code != 422
+        assert response.status_code == expected_code
+        if expected_code == 422:
+            assert "detail" in response.json()
 
     def test_new_chat_request_validation(self, api_client):
         """Test new chat request validation"""
@@ -319,7 +268,7 @@ class TestResponseModels:
     def test_query_response_structure(self, api_client, mock_rag_for_api):
         """Test query response follows correct structure"""
         # Setup
-        mock_rag_for_api.query.return_value = (
+        mock_rag_for_api.aquery.return_value = (
             "Test answer",
             [
                 {"text": "Source 1", "link": "https://example.com/1"},
@@ -374,18 +323,13 @@ class TestEndpointIntegration:
     """Integration tests for API endpoints"""
 
     def test_full_query_workflow(self, api_client, mock_rag_for_api):
-        """Test complete query workflow"""
+        """Test that a query's session ID is the one a new chat clears"""
         # Setup mock responses
-        mock_rag_for_api.query.return_value = (
+        mock_rag_for_api.aquery.return_value = (
             "MCP stands for Model Context Protocol",
             [{"text": "MCP Course - Lesson 1", "link": "https://example.com/mcp/lesson1"}]
         )
         
-        mock_rag_for_api.get_course_analytics.return_value = {
-            "total_courses": 3,
-            "course_titles": ["Introduction to MCP", "Advanced Python", "API Design"]
-        }
-        
         # Step 1: Make initial query
         query_response = api_client.post("/api/query", json={
             "query": "What is MCP?",
@@ -398,17 +342,18 @@ class TestEndpointIntegration:
         assert len(query_data["sources"]) == 1
         session_id = query_data["session_id"]
         
-        # Step 2: Check course stats
-        stats_response = api_client.get("/api/courses")
-        assert stats_response.status_code == 200
-        
-        # Step 3: Clear session
+        # Step 2: Clear session (course stats are covered by TestCoursesEndpoint)
         clear_response = api_client.post("/api/new-chat", json={
             "session_id": session_id
         })
         assert clear_response.status_code == 200
-        clear_data = clear_response.json()
-        assert clear_data["status"] == "success"
+        assert clear_response.json()["status"] == "success"
+        
+        # The RAG system saw both steps, in order, for the same session
+        assert mock_rag_for_api.mock_calls == [
+            call.aquery("What is MCP?", "integration_test_session"),
+            call.session_manager.clear_session("integration_test_session"),
+        ]
 
     def test_error_recovery_workflow(self, api_client, mock_rag_for_api):
         """Test error scenarios and recovery"""
@@ -420,7 +365,7 @@ class TestEndpointIntegration:
         assert error_response.status_code == 500
         
         # Step 2: Make a successful request after error
-        mock_rag_for_api.query.return_value = (
+        mock_rag_for_api.aquery.return_value = (
             "Successful recovery response",
             [{"text": "Recovery Source", "link": "https://example.com/recovery"}]
         )
@@ -431,4 +376,9 @@ class TestEndpointIntegration:
         })
         assert success_response.status_code == 200
         success_data = success_response.json()
-        assert "Successful recovery" in success_data["answer"]
\ No newline at end of file
+        assert "Successful recovery" in success_data["answer"]
+        
+        # Only the successful request reached the RAG system
+        assert mock_rag_for_api.mock_calls == [
+            call.aquery("What is machine learning?", "error_test_session"),
+        ]
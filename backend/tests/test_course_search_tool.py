@@ -3,336 +3,446 @@
 from unittest.mock import Mock, patch
 
 import pytest
-from search_tools import CourseSearchTool
+from search_tools import CourseOutlineTool, CourseSearchTool, ToolManager
 from vector_store import SearchResults
 
 
 class TestCourseSearchToolExecute:
     """Test suite for CourseSearchTool.execute() method"""
 
-    def test_execute_query_only_success(
-        self, course_search_tool, mock_vector_store, successful_search_results
+    @pytest.mark.parametrize(
+        "filters",
+        [
+            {},
+            {"course_name": "MCP"},
+            {"lesson_number": 1},
+            {"course_name": "Introduction to MCP", "lesson_number": 1},
+        ],
+        ids=["query_only", "course_name", "lesson_number", "both_filters"],
+    )
+    def test_execute_success(
+        self, filters, course_search_tool, mock_vector_store, successful_search_results
     ):
-        """Test execute with query only - successful results"""
+        """Test execute passes each filter combination through to the store"""
         # Setup
         mock_vector_store.search.return_value = successful_search_results
 
         # Execute
-        result = course_search_tool.execute(query="What is MCP?")
+        result = course_search_tool.execute(query="What is MCP?", **filters)
 
         # Verify
         mock_vector_store.search.assert_called_once_with(
-            query="What is MCP?", course_name=None, lesson_number=None
+            query="What is MCP?",
+            course_name=filters.get("course_name"),
+            lesson_number=filters.get("lesson_number"),
         )
         assert "[Introduction to MCP - Lesson 1]" in result
         assert "[Introduction to MCP - Lesson 2]" in result
         assert "MCP (Model Context Protocol)" in result
         assert "three main components" in result
 
-    def test_execute_with_course_name_success(
-        self, course_search_tool, mock_vector_store, successful_search_results
+    @pytest.mark.parametrize(
+        "course_name, lesson_number, expected",
+        [
+            (None, None, "No relevant content found."),
+            ("Test Course", None, "No relevant content found in course 'Test Course'."),
+            (None, 5, "No relevant content found in lesson 5."),
+            (
+                "Test Course",
+                5,
+                "No relevant content found in course 'Test Course' in lesson 5.",
+            ),
+        ],
+        ids=["no_filters", "course_filter", "lesson_filter", "both_filters"],
+    )
+    def test_execute_empty_results(
+        self,
+        course_name,
+        lesson_number,
+        expected,
+        course_search_tool,
+        mock_vector_store,
+        empty_search_results,
     ):
-        """Test execute with course name filter - successful results"""
+        """Test execute with empty results names the filters that were applied"""
         # Setup
-        mock_vector_store.search.return_value = successful_search_results
+        mock_vector_store.search.return_value = empty_search_results
 
         # Execute
-        result = course_search_tool.execute(query="What is MCP?", course_name="MCP")
+        result = course_search_tool.execute(
+            query="non-existent topic",
+            course_name=course_name,
+            lesson_number=lesson_number,
+        )
 
         # Verify
-        mock_vector_store.search.assert_called_once_with(
-            query="What is MCP?", course_name="MCP", lesson_number=None
-        )
-        assert "[Introduction to MCP - Lesson 1]" in result
-        assert "MCP (Model Context Protocol)" in result
+        assert result == expected
 
-    def test_execute_with_lesson_number_success(
-        self, course_search_tool, mock_vector_store, successful_search_results
+    def test_execute_search_error(
+        self, course_search_tool, mock_vector_store, error_search_results
     ):
-        """Test execute with lesson number filter - successful results"""
+        """Test execute when search returns an error"""
         # Setup
-        mock_vector_store.search.return_value = successful_search_results
+        mock_vector_store.search.return_value = error_search_results
 
         # Execute
-        result = course_search_tool.execute(query="What is MCP?", lesson_number=1)
+        result = course_search_tool.execute(query="What is MCP?")
 
         # Verify
-        mock_vector_store.search.assert_called_once_with(
-            query="What is MCP?", course_name=None, lesson_number=1
-        )
-        assert "[Introduction to MCP - Lesson 1]" in result
+        assert result == "Database connection failed"
 
-    def test_execute_with_both_filters_success(
-        self, course_search_tool, mock_vector_store, successful_search_results
+    @pytest.mark.parametrize(
+        "rows, lesson_links, expected_result, expected_sources",
+        [
+            pytest.param(
+                [
+                    ("First piece of content about MCP.", "Introduction to MCP", 1),
+                    (
+                        "Second piece of content about architecture.",
+                        "Introduction to MCP",
+                        2,
+                    ),
+                ],
+                None,  # keep the fixture's default link stub
+                "[Introduction to MCP - Lesson 1]\nFirst piece of content about MCP."
+                "\n\n[Introduction to MCP - Lesson 2]"
+                "\nSecond piece of content about architecture.",
+                [
+                    {
+                        "text": "Introduction to MCP - Lesson 1",
+                        "link": "https://example.com/mcp-intro/lesson1",
+                    },
+                    {
+                        "text": "Introduction to MCP - Lesson 2",
+                        "link": "https://example.com/mcp-intro/lesson1",
+                    },
+                ],
+                id="result_formatting",
+            ),
+            pytest.param(
+                [("Test content", "Introduction to MCP", 1)],
+                {("Introduction to MCP", 1): "https://example.com/lesson1"},
+                "[Introduction to MCP - Lesson 1]\nTest content",
+                [
+                    {
+                        "text": "Introduction to MCP - Lesson 1",
+                        "link": "https://example.com/lesson1",
+                    }
+                ],
+                id="with_lesson_links",
+            ),
+            pytest.param(
+                [("Test content", "Introduction to MCP", None)],
+                None,
+                "[Introduction to MCP]\nTest content",
+                [{"text": "Introduction to MCP", "link": None}],
+                id="without_lesson_links",
+            ),
+            pytest.param(
+                [("Test content", "Introduction to MCP", 1)],
+                Exception("Link retrieval failed"),  # must not break the search
+                "[Introduction to MCP - Lesson 1]\nTest content",
+                [{"text": "Introduction to MCP - Lesson 1", "link": None}],
+                id="lesson_link_error",
+            ),
+            pytest.param(
+                [("Test content", "unknown", None)],
+                None,
+                "[unknown]\nTest content",
+                [{"text": "unknown", "link": None}],
+                id="unknown_course",
+            ),
+            pytest.param(
+                [("Content 1", "Course A", 1), ("Content 2", "Course B", 2)],
+                {
+                    ("Course A", 1): "https://example.com/a/lesson1",
+                    ("Course B", 2): "https://example.com/b/lesson2",
+                },
+                "[Course A - Lesson 1]\nContent 1\n\n[Course B - Lesson 2]\nContent 2",
+                [
+                    {
+                        "text": "Course A - Lesson 1",
+                        "link": "https://example.com/a/lesson1",
+                    },
+                    {
+                        "text": "Course B - Lesson 2",
+                        "link": "https://example.com/b/lesson2",
+                    },
+                ],
+                id="multiple_results",
+            ),
+        ],
+    )
+    def test_execute_source_tracking(
+        self,
+        rows,
+        lesson_links,
+        expected_result,
+        expected_sources,
+        course_search_tool,
+        mock_vector_store,
     ):
-        """Test execute with both course name and lesson number filters"""
+        """Test result formatting and the sources tracked for the UI"""
         # Setup
-        mock_vector_store.search.return_value = successful_search_results
+        documents, titles, lessons = zip(*rows)
+        mock_vector_store.search.return_value = SearchResults(
+            documents=list(documents),
+            metadata=[
+                {"course_title": title, "lesson_number": lesson}
+                for title, lesson in zip(titles, lessons)
+            ],
+            distances=[0.1] * len(rows),
+            error=None,
+        )
+        links_stub = mock_vector_store.get_lesson_links_batch
+        if isinstance(lesson_links, Exception):
+            links_stub.side_effect = lesson_links
+        elif lesson_links is not None:
+            links_stub.side_effect = None
+            links_stub.return_value = lesson_links
 
         # Execute
-        result = course_search_tool.execute(
-            query="What is MCP?", course_name="Introduction to MCP", lesson_number=1
-        )
+        result = course_search_tool.execute(query="test query")
 
         # Verify
-        mock_vector_store.search.assert_called_once_with(
-            query="What is MCP?", course_name="Introduction to MCP", lesson_number=1
-        )
-        assert "[Introduction to MCP - Lesson 1]" in result
+        assert result == expected_result
+        assert course_search_tool.last_sources == expected_sources
+        # Links for all lessons come from a single store call
+        pairs = [(title, lesson) for _, title, lesson in rows if lesson is not None]
+        if pairs:
+            links_stub.assert_called_once_with(pairs)
+        else:
+            links_stub.assert_not_called()
 
-    def test_execute_empty_results_no_filters(
-        self, course_search_tool, mock_vector_store, empty_search_results
-    ):
-        """Test execute with empty results and no filters"""
-        # Setup
-        mock_vector_store.search.return_value = empty_search_results
 
-        # Execute
-        result = course_search_tool.execute(query="non-existent topic")
+@pytest.fixture(scope="module")
+def definition(_session_course_search_tool):
+    """Tool definition, built once for the read-only checks below"""
+    return _session_course_search_tool.get_tool_definition()
 
-        # Verify
-        assert result == "No relevant content found."
 
-    def test_execute_empty_results_with_course_filter(
-        self, course_search_tool, mock_vector_store, empty_search_results
-    ):
-        """Test execute with empty results and course filter"""
-        # Setup
-        mock_vector_store.search.return_value = empty_search_results
+class TestCourseSearchToolToolDefinition:
+    """Test CourseSearchTool tool definition"""
 
-        # Execute
-        result = course_search_tool.execute(
-            query="non-existent topic", course_name="Test Course"
-        )
+    def test_get_tool_definition(self, definition):
+        """Test that tool definition is correctly structured"""
 
-        # Verify
-        assert result == "No relevant content found in course 'Test Course'."
+        # Verify structure
+        assert definition["name"] == "search_course_content"
+        assert "description" in definition
+        assert "input_schema" in definition
 
-    def test_execute_empty_results_with_lesson_filter(
-        self, course_search_tool, mock_vector_store, empty_search_results
-    ):
-        """Test execute with empty results and lesson filter"""
-        # Setup
-        mock_vector_store.search.return_value = empty_search_results
+        # Verify schema
+        schema = definition["input_schema"]
+        assert schema["type"] == "object"
+        assert "query" in schema["properties"]
+        assert "course_name" in schema["properties"]
+        assert "lesson_number" in schema["properties"]
+        assert schema["required"] == ["query"]
 
-        # Execute
-        result = course_search_tool.execute(query="non-existent topic", lesson_number=5)
+    def test_tool_definition_parameter_types(self, definition):
+        """Test that tool definition parameter types are correct"""
+        properties = definition["input_schema"]["properties"]
 
-        # Verify
-        assert result == "No relevant content found in lesson 5."
+        assert properties["query"]["type"] == "string"
+        assert properties["course_name"]["type"] == "string"
+        assert properties["lesson_number"]["type"] == "integer"
 
-    def test_execute_empty_results_with_both_filters(
-        self, course_search_tool, mock_vector_store, empty_search_results
-    ):
-        """Test execute with empty results and both filters"""
-        # Setup
-        mock_vector_store.search.return_value = empty_search_results
 
-        # Execute
-        result = course_search_tool.execute(
-            query="non-existent topic", course_name="Test Course", lesson_number=5
-        )
+class TestCourseOutlineToolCaching:
+    """Test CourseOutlineTool outline memoization"""
 
-        # Verify
-        assert (
-            result == "No relevant content found in course 'Test Course' in lesson 5."
-        )
+    @pytest.fixture
+    def outline_tool(self, mock_vector_store):
+        """CourseOutlineTool with course metadata available"""
+        mock_vector_store.get_all_courses_metadata.return_value = [
+            {
+                "title": "Introduction to MCP",
+                "course_link": "https://example.com/mcp-intro",
+                "instructor": "John Doe",
+                "lessons": [{"lesson_number": 1, "lesson_title": "What is MCP?"}],
+            }
+        ]
+        return CourseOutlineTool(mock_vector_store)
 
-    def test_execute_search_error(
-        self, course_search_tool, mock_vector_store, error_search_results
-    ):
-        """Test execute when search returns an error"""
-        # Setup
-        mock_vector_store.search.return_value = error_search_results
+    def test_repeated_outline_uses_cache(self, outline_tool, mock_vector_store):
+        """Test that identical titles are resolved and scanned only once"""
+        first = outline_tool.execute(course_title="MCP")
+        second = outline_tool.execute(course_title="MCP")
 
-        # Execute
-        result = course_search_tool.execute(query="What is MCP?")
+        assert first == second
+        assert "- Lesson 1: What is MCP?" in first
+        mock_vector_store._resolve_course_name.assert_called_once_with("MCP")
+        mock_vector_store.get_all_courses_metadata.assert_called_once()
 
-        # Verify
-        assert result == "Database connection failed"
+    def test_cache_hit_still_tracks_sources(self, outline_tool):
+        """Test that sources are tracked even when the outline is cached"""
+        outline_tool.execute(course_title="MCP")
+        outline_tool.last_sources = []
 
-    def test_execute_result_formatting(self, course_search_tool, mock_vector_store):
-        """Test proper formatting of search results"""
-        # Setup - custom search results for formatting test
-        search_results = SearchResults(
-            documents=[
-                "First piece of content about MCP.",
-                "Second piece of content about architecture.",
-            ],
-            metadata=[
-                {"course_title": "Introduction to MCP", "lesson_number": 1},
-                {"course_title": "Introduction to MCP", "lesson_number": 2},
-            ],
-            distances=[0.1, 0.2],
-            error=None,
-        )
-        mock_vector_store.search.return_value = search_results
+        outline_tool.execute(course_title="MCP")
 
-        # Execute
-        result = course_search_tool.execute(query="test query")
+        assert outline_tool.last_sources == [
+            {"text": "Introduction to MCP", "link": "https://example.com/mcp-intro"}
+        ]
 
-        # Verify formatting
-        lines = result.split("\n\n")
-        assert len(lines) == 2  # Two results separated by double newlines
-        assert lines[0].startswith("[Introduction to MCP - Lesson 1]")
-        assert lines[1].startswith("[Introduction to MCP - Lesson 2]")
-        assert "First piece of content about MCP." in lines[0]
-        assert "Second piece of content about architecture." in lines[1]
+    def test_request_views_share_cached_outlines(self, outline_tool, mock_vector_store):
+        """Test that per-request views reuse one tool's outline cache"""
+        manager = ToolManager()
+        manager.register_tool(outline_tool)
+        first, second = manager.for_request(), manager.for_request()
 
-    def test_execute_source_tracking_with_lesson_links(
-        self, course_search_tool, mock_vector_store
-    ):
-        """Test that sources are properly tracked with lesson links"""
-        # Setup
-        search_results = SearchResults(
-            documents=["Test content"],
-            metadata=[{"course_title": "Introduction to MCP", "lesson_number": 1}],
-            distances=[0.1],
-            error=None,
+        first.execute_tool("get_course_outline", course_title="MCP")
+        second.execute_tool("get_course_outline", course_title="MCP")
+
+        mock_vector_store._resolve_course_name.assert_called_once_with("MCP")
+        assert (
+            first.get_last_sources()
+            == second.get_last_sources()
+            == [
+                {"text": "Introduction to MCP", "link": "https://example.com/mcp-intro"}
+            ]
         )
-        mock_vector_store.search.return_value = search_results
-        mock_vector_store.get_lesson_link.return_value = "https://example.com/lesson1"
 
-        # Execute
-        course_search_tool.execute(query="test query")
+    def test_store_error_is_not_cached(self, outline_tool, mock_vector_store):
+        """Test that an outline is retried after the store raises once"""
+        mock_vector_store._resolve_course_name.side_effect = [
+            Exception("Chroma unavailable"),
+            "Introduction to MCP",
+        ]
 
-        # Verify sources are tracked
-        assert len(course_search_tool.last_sources) == 1
-        source = course_search_tool.last_sources[0]
-        assert source["text"] == "Introduction to MCP - Lesson 1"
-        assert source["link"] == "https://example.com/lesson1"
+        first = outline_tool.execute(course_title="MCP")
+        second = outline_tool.execute(course_title="MCP")
 
-    def test_execute_source_tracking_without_lesson_links(
-        self, course_search_tool, mock_vector_store
+        assert first == "Error retrieving course outline: Chroma unavailable"
+        assert "- Lesson 1: What is MCP?" in second
+
+    def test_swallowed_store_errors_are_not_cached(
+        self, outline_tool, mock_vector_store
     ):
-        """Test that sources are properly tracked without lesson links"""
-        # Setup
-        search_results = SearchResults(
-            documents=["Test content"],
-            metadata=[{"course_title": "Introduction to MCP", "lesson_number": None}],
-            distances=[0.1],
-            error=None,
-        )
-        mock_vector_store.search.return_value = search_results
+        """Test that misses caused by a failed store read are retried"""
+        # The store reports its own errors as no match and no metadata
+        mock_vector_store._resolve_course_name.side_effect = [
+            None,
+            "Introduction to MCP",
+            "Introduction to MCP",
+        ]
+        courses = mock_vector_store.get_all_courses_metadata.return_value
+        mock_vector_store.get_all_courses_metadata.side_effect = [[], courses]
+
+        no_course = outline_tool.execute(course_title="MCP")
+        no_metadata = outline_tool.execute(course_title="MCP")
+        outline = outline_tool.execute(course_title="MCP")
+
+        assert no_course.startswith("No course found matching 'MCP'")
+        assert no_metadata == "Course metadata not found for 'Introduction to MCP'"
+        assert "- Lesson 1: What is MCP?" in outline
+        assert outline_tool.last_sources == [
+            {"text": "Introduction to MCP", "link": "https://example.com/mcp-intro"}
+        ]
 
-        # Execute
-        course_search_tool.execute(query="test query")
+    def test_metadata_miss_rereads_index(self, outline_tool, mock_vector_store):
+        """Test that a title missing from the index re-reads it once"""
+        outline_tool.execute(course_title="MCP")
+        mock_vector_store._resolve_course_name.return_value = "Advanced MCP"
+        mock_vector_store.get_all_courses_metadata.return_value = [
+            {"title": "Advanced MCP", "lessons": []}
+        ]
 
-        # Verify sources are tracked
-        assert len(course_search_tool.last_sources) == 1
-        source = course_search_tool.last_sources[0]
-        assert source["text"] == "Introduction to MCP"
-        assert source["link"] is None
+        outline = outline_tool.execute(course_title="Advanced")
 
-    def test_execute_source_tracking_error_handling(
-        self, course_search_tool, mock_vector_store
+        assert "**Course Title:** Advanced MCP" in outline
+        assert mock_vector_store.get_all_courses_metadata.call_count == 2
+
+    def test_store_generation_change_refetches_metadata(
+        self, outline_tool, mock_vector_store
     ):
-        """Test that source tracking handles errors gracefully"""
-        # Setup
-        search_results = SearchResults(
-            documents=["Test content"],
-            metadata=[{"course_title": "Introduction to MCP", "lesson_number": 1}],
-            distances=[0.1],
-            error=None,
-        )
-        mock_vector_store.search.return_value = search_results
-        mock_vector_store.get_lesson_link.side_effect = Exception(
-            "Link retrieval failed"
-        )
+        """Test that an ingest bumping the store generation drops cached outlines"""
+        outline_tool.execute(course_title="MCP")
+        outline_tool.execute(course_title="MCP")
+        mock_vector_store.generation += 1
+        outline_tool.execute(course_title="MCP")
 
-        # Execute - should not crash even if lesson link retrieval fails
-        result = course_search_tool.execute(query="test query")
+        assert mock_vector_store._resolve_course_name.call_count == 2
+        assert mock_vector_store.get_all_courses_metadata.call_count == 2
 
-        # Verify it still works and source is tracked without link
-        assert "[Introduction to MCP - Lesson 1]" in result
-        assert len(course_search_tool.last_sources) == 1
-        source = course_search_tool.last_sources[0]
-        assert source["text"] == "Introduction to MCP - Lesson 1"
-        assert source["link"] is None
 
-    def test_execute_unknown_course_metadata(
-        self, course_search_tool, mock_vector_store
-    ):
-        """Test handling of results with unknown course metadata"""
-        # Setup
-        search_results = SearchResults(
-            documents=["Test content"],
-            metadata=[{"course_title": "unknown", "lesson_number": None}],
-            distances=[0.1],
-            error=None,
-        )
-        mock_vector_store.search.return_value = search_results
+class TestToolManagerDefinitions:
+    """Test ToolManager tool definition caching"""
 
-        # Execute
-        result = course_search_tool.execute(query="test query")
+    def test_definitions_built_once_at_registration(self, course_search_tool):
+        """Test that repeated requests reuse the definitions from registration"""
+        manager = ToolManager()
+        manager.register_tool(course_search_tool)
 
-        # Verify
-        assert "[unknown]" in result
-        assert len(course_search_tool.last_sources) == 1
-        assert course_search_tool.last_sources[0]["text"] == "unknown"
+        with patch.object(
+            course_search_tool, "get_tool_definition"
+        ) as mock_get_definition:
+            first = manager.get_tool_definitions()
+            second = manager.get_tool_definitions()
+
+        assert first is second
+        assert [tool["name"] for tool in first] == ["search_course_content"]
+        mock_get_definition.assert_not_called()
 
-    def test_execute_multiple_results_source_tracking(
+    def test_definitions_follow_new_registrations(
         self, course_search_tool, mock_vector_store
     ):
-        """Test source tracking with multiple results"""
-        # Setup
-        search_results = SearchResults(
-            documents=["Content 1", "Content 2"],
-            metadata=[
-                {"course_title": "Course A", "lesson_number": 1},
-                {"course_title": "Course B", "lesson_number": 2},
-            ],
-            distances=[0.1, 0.2],
-            error=None,
-        )
-        mock_vector_store.search.return_value = search_results
-        mock_vector_store.get_lesson_link.side_effect = [
-            "https://example.com/a/lesson1",
-            "https://example.com/b/lesson2",
+        """Test that registering another tool refreshes the cached list"""
+        manager = ToolManager()
+        manager.register_tool(course_search_tool)
+        manager.get_tool_definitions()
+        manager.register_tool(CourseOutlineTool(mock_vector_store))
+
+        assert [tool["name"] for tool in manager.get_tool_definitions()] == [
+            "search_course_content",
+            "get_course_outline",
         ]
 
-        # Execute
-        result = course_search_tool.execute(query="test query")
 
-        # Verify multiple sources are tracked
-        assert len(course_search_tool.last_sources) == 2
-        assert course_search_tool.last_sources[0]["text"] == "Course A - Lesson 1"
-        assert (
-            course_search_tool.last_sources[0]["link"]
-            == "https://example.com/a/lesson1"
-        )
-        assert course_search_tool.last_sources[1]["text"] == "Course B - Lesson 2"
-        assert (
-            course_search_tool.last_sources[1]["link"]
-            == "https://example.com/b/lesson2"
-        )
+class TestToolManagerSources:
+    """Test ToolManager source tracking across registered tools"""
 
+    def test_only_source_providers_are_tracked(self, course_search_tool):
+        """Test that sources come from tools exposing last_sources"""
 
-class TestCourseSearchToolToolDefinition:
-    """Test CourseSearchTool tool definition"""
+        class PlainTool:
+            def get_tool_definition(self):
+                return {"name": "plain_tool"}
 
-    def test_get_tool_definition(self, course_search_tool):
-        """Test that tool definition is correctly structured"""
-        definition = course_search_tool.get_tool_definition()
+            def execute(self, **kwargs):
+                return "done"
 
-        # Verify structure
-        assert definition["name"] == "search_course_content"
-        assert "description" in definition
-        assert "input_schema" in definition
+        manager = ToolManager()
+        manager.register_tool(PlainTool())
+        manager.register_tool(course_search_tool)
+        course_search_tool.last_sources = [{"text": "Course A", "link": None}]
 
-        # Verify schema
-        schema = definition["input_schema"]
-        assert schema["type"] == "object"
-        assert "query" in schema["properties"]
-        assert "course_name" in schema["properties"]
-        assert "lesson_number" in schema["properties"]
-        assert schema["required"] == ["query"]
+        assert manager.get_last_sources() == [{"text": "Course A", "link": None}]
 
-    def test_tool_definition_parameter_types(self, course_search_tool):
-        """Test that tool definition parameter types are correct"""
-        definition = course_search_tool.get_tool_definition()
-        properties = definition["input_schema"]["properties"]
+        manager.reset_sources()
 
-        assert properties["query"]["type"] == "string"
-        assert properties["course_name"]["type"] == "string"
-        assert properties["lesson_number"]["type"] == "integer"
+        assert course_search_tool.last_sources == []
+        assert manager.get_last_sources() == []
+
+    def test_request_views_keep_their_own_sources(
+        self, course_search_tool, mock_vector_store
+    ):
+        """Test that each request sees only the sources its own calls found"""
+        mock_vector_store.search.side_effect = lambda query, **_: SearchResults(
+            documents=[query],
+            metadata=[{"course_title": query, "lesson_number": None}],
+            distances=[0.1],
+        )
+        manager = ToolManager()
+        manager.register_tool(course_search_tool)
+        first, second = manager.for_request(), manager.for_request()
+
+        first.execute_tool("search_course_content", query="Course A")
+        second.execute_tool("search_course_content", query="Course B")
+        first.reset_sources()
+
+        assert first.get_last_sources() == []
+        assert second.get_last_sources() == [{"text": "Course B", "link": None}]
+        # The shared tool's own sources are left alone
+        assert course_search_tool.last_sources == []
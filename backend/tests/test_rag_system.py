@@ -1,49 +1,131 @@
 """Tests for RAG system content-query handling"""
 
-from unittest.mock import MagicMock, Mock, patch
+import asyncio
+import hashlib
+import threading
+from operator import attrgetter
+from unittest.mock import ANY, DEFAULT, patch
 
 import pytest
-from rag_system import RAGSystem
+from ai_generator import FallbackResponse
+from rag_system import QUERY_PROMPT_PREFIX, RAGSystem
+from vector_store import SearchResults
+
+# Content queries of each kind: the answer and sources come back untouched
+_QUERY_CASES = [
+    pytest.param(
+        "What is MCP?",
+        "MCP stands for Model Context Protocol.",
+        [
+            {
+                "text": "Introduction to MCP - Lesson 1",
+                "link": "https://example.com/lesson1",
+            }
+        ],
+        id="basic_content_search",
+    ),
+    pytest.param(
+        "How do MCP servers work?",
+        "MCP servers handle data processing.",
+        [
+            {
+                "text": "Introduction to MCP - Lesson 2",
+                "link": "https://example.com/lesson2",
+            }
+        ],
+        id="specific_course_content",
+    ),
+    pytest.param(
+        "What lessons are in the MCP course?",
+        "**Course Title:** Introduction to MCP\n"
+        "**Instructor:** John Doe\n"
+        "**Lessons (2 total):**\n"
+        "- Lesson 1: What is MCP?\n"
+        "- Lesson 2: MCP Architecture",
+        [{"text": "Introduction to MCP", "link": "https://example.com/mcp-intro"}],
+        id="course_outline",
+    ),
+    pytest.param(
+        "What is machine learning?",
+        "Machine learning is a subset of AI.",
+        [],  # no course sources
+        id="general_knowledge",
+    ),
+    pytest.param(
+        "Compare MCP with REST APIs",
+        "Both MCP and REST APIs are communication protocols, but MCP is "
+        "specifically designed for AI contexts.",
+        [
+            {
+                "text": "Introduction to MCP - Lesson 1",
+                "link": "https://example.com/mcp/lesson1",
+            },
+            {
+                "text": "API Design Course - Lesson 3",
+                "link": "https://example.com/api/lesson3",
+            },
+        ],
+        id="multi_course",
+    ),
+    pytest.param(
+        "What is the difference between MCP and REST APIs?",
+        "Test response",
+        [],
+        id="prompt_formatting",
+    ),
+]
+
+
+def _generator_kwargs(rag_system):
+    """Keyword arguments of the single generate_response_sequential call"""
+    generate = rag_system.mock_ai_generator.generate_response_sequential
+    assert generate.call_count == 1
+    return generate.call_args.kwargs
 
 
 class TestRAGSystemQueryHandling:
     """Test RAG system query processing and content handling"""
 
-    def test_query_basic_content_search(self, mock_rag_system):
-        """Test basic content search query handling"""
+    @pytest.mark.parametrize("query, ai_response, expected_sources", _QUERY_CASES)
+    def test_content_query(
+        self, mock_rag_system, canonical_tool_defs, query, ai_response, expected_sources
+    ):
+        """Test that a query is prompted, answered and sourced correctly"""
         # Setup
-        mock_rag_system.mock_ai_generator.generate_response_sequential.return_value = (
-            "MCP stands for Model Context Protocol."
-        )
-        mock_rag_system.tool_manager.get_last_sources.return_value = [
-            {
-                "text": "Introduction to MCP - Lesson 1",
-                "link": "https://example.com/lesson1",
-            }
-        ]
+        generate = mock_rag_system.mock_ai_generator.generate_response_sequential
+        generate.return_value = ai_response
+        mock_rag_system.tool_manager.get_last_sources.return_value = expected_sources
 
         # Execute
-        response, sources = mock_rag_system.query("What is MCP?")
+        response, sources = mock_rag_system.query(query)
 
         # Verify
-        assert response == "MCP stands for Model Context Protocol."
-        assert len(sources) == 1
-        assert sources[0]["text"] == "Introduction to MCP - Lesson 1"
-        assert sources[0]["link"] == "https://example.com/lesson1"
+        assert response == ai_response
+        assert sources == expected_sources
 
         # Verify AI generator was called with correct parameters
-        mock_rag_system.mock_ai_generator.generate_response_sequential.assert_called_once()
-        call_args = (
-            mock_rag_system.mock_ai_generator.generate_response_sequential.call_args
-        )
-        assert (
-            "Answer this question about course materials: What is MCP?"
-            in call_args[1]["query"]
-        )
-        assert (
-            call_args[1]["tools"] == mock_rag_system.tool_manager.get_tool_definitions()
+        assert _generator_kwargs(mock_rag_system) == {
+            "query": QUERY_PROMPT_PREFIX + query,
+            "conversation_history": None,
+            "tools": canonical_tool_defs,
+            "tool_manager": mock_rag_system.tool_manager,
+            "max_rounds": 2,
+        }
+
+    def test_query_generator_contract(self, mock_rag_system, canonical_tool_defs):
+        """Test the full call RAGSystem makes into the AI generator"""
+        generate = mock_rag_system.mock_ai_generator.generate_response_sequential
+        generate.return_value = "Test response"
+
+        mock_rag_system.query("What is MCP?")
+
+        generate.assert_called_once_with(
+            query=QUERY_PROMPT_PREFIX + "What is MCP?",
+            conversation_history=None,
+            tools=canonical_tool_defs,
+            tool_manager=mock_rag_system.tool_manager,
+            max_rounds=2,
         )
-        assert call_args[1]["tool_manager"] == mock_rag_system.tool_manager
 
     def test_query_with_session_management(self, mock_rag_system):
         """Test query with session ID for conversation history"""
@@ -64,23 +146,24 @@ class TestRAGSystemQueryHandling:
         assert response == "MCP has three main components."
 
         # Verify session manager calls
-        mock_rag_system.session_manager.get_conversation_history.assert_called_once_with(
-            "test_session"
+        session_manager = mock_rag_system.session_manager
+        assert session_manager.get_conversation_history.call_count == 1
+        assert session_manager.get_conversation_history.call_args.args == (
+            "test_session",
         )
-        mock_rag_system.session_manager.add_exchange.assert_called_once_with(
+        assert session_manager.add_exchange.call_count == 1
+        assert session_manager.add_exchange.call_args.args == (
             "test_session",
             "Tell me more about MCP components",
             "MCP has three main components.",
         )
 
         # Verify history was passed to AI generator
-        call_args = (
-            mock_rag_system.mock_ai_generator.generate_response_sequential.call_args
-        )
-        assert (
-            call_args[1]["conversation_history"]
-            == "Previous: What is MCP?\nResponse: MCP is..."
+        kwargs = _generator_kwargs(mock_rag_system)
+        assert kwargs["conversation_history"] == (
+            "Previous: What is MCP?\nResponse: MCP is..."
         )
+        assert kwargs["tool_manager"] is mock_rag_system.tool_manager
 
     def test_query_without_session(self, mock_rag_system):
         """Test query without session ID"""
@@ -98,10 +181,7 @@ class TestRAGSystemQueryHandling:
         mock_rag_system.session_manager.add_exchange.assert_not_called()
 
         # Verify AI generator called without history
-        call_args = (
-            mock_rag_system.mock_ai_generator.generate_response_sequential.call_args
-        )
-        assert call_args[1]["conversation_history"] is None
+        assert _generator_kwargs(mock_rag_system)["conversation_history"] is None
 
     def test_query_source_handling_and_reset(self, mock_rag_system):
         """Test proper source handling and reset"""
@@ -125,43 +205,51 @@ class TestRAGSystemQueryHandling:
         mock_rag_system.tool_manager.get_last_sources.assert_called_once()
         mock_rag_system.tool_manager.reset_sources.assert_called_once()
 
-    def test_query_prompt_formatting(self, mock_rag_system):
-        """Test that queries are properly formatted for AI"""
+    def test_query_tool_definitions_passed(self, mock_rag_system, canonical_tool_defs):
+        """Test that the manager's tool definitions reach the AI unchanged"""
         # Setup
-        mock_rag_system.mock_ai_generator.generate_response_sequential.return_value = (
-            "Test response"
-        )
+        generate = mock_rag_system.mock_ai_generator.generate_response_sequential
+        generate.return_value = "Test response"
 
         # Execute
-        mock_rag_system.query("What is the difference between MCP and REST APIs?")
+        mock_rag_system.query("test query")
+        mock_rag_system.query("another query")
 
-        # Verify prompt formatting
-        call_args = (
-            mock_rag_system.mock_ai_generator.generate_response_sequential.call_args
-        )
-        expected_prompt = "Answer this question about course materials: What is the difference between MCP and REST APIs?"
-        assert call_args[1]["query"] == expected_prompt
+        # Verify: the same object every time keeps the tools prefix cacheable
+        for call in generate.call_args_list:
+            assert call.kwargs["tools"] is canonical_tool_defs
 
-    def test_query_tool_definitions_passed(self, mock_rag_system):
-        """Test that tool definitions are passed to AI generator"""
-        # Setup
-        expected_tools = [
-            {"name": "search_course_content"},
-            {"name": "get_course_outline"},
-        ]
-        mock_rag_system.tool_manager.get_tool_definitions.return_value = expected_tools
-        mock_rag_system.mock_ai_generator.generate_response_sequential.return_value = (
-            "Test response"
+    def test_query_uses_prompt_cache_key(self, mock_rag_system, canonical_tool_defs):
+        """Test that the cacheable prompt prefix is identical across queries"""
+        # Setup: same session context for both questions
+        generate = mock_rag_system.mock_ai_generator.generate_response_sequential
+        generate.return_value = "Test response"
+        mock_rag_system.session_manager.get_conversation_history.return_value = (
+            "User: What is MCP?\nAssistant: MCP is a protocol."
         )
 
-        # Execute
-        mock_rag_system.query("test query")
-
-        # Verify
-        call_args = (
-            mock_rag_system.mock_ai_generator.generate_response_sequential.call_args
+        # Execute: distinct questions, so the response cache can't answer
+        mock_rag_system.query("How do MCP servers work?", session_id="s")
+        mock_rag_system.query("How do MCP clients work?", session_id="s")
+
+        # Verify: tools, system prompt and history hash the same both times
+        prefix_keys = {
+            hashlib.sha256(
+                repr(
+                    (
+                        c.kwargs["tools"],
+                        c.kwargs.get("system"),
+                        c.kwargs["conversation_history"],
+                    )
+                ).encode()
+            ).hexdigest()
+            for c in generate.call_args_list
+        }
+        assert generate.call_count == 2
+        assert len(prefix_keys) == 1
+        assert all(
+            c.kwargs["tools"] is canonical_tool_defs for c in generate.call_args_list
         )
-        assert call_args[1]["tools"] == expected_tools
 
     def test_query_empty_sources(self, mock_rag_system):
         """Test handling when no sources are available"""
@@ -179,233 +267,247 @@ class TestRAGSystemQueryHandling:
         assert sources == []
 
 
-class TestRAGSystemErrorHandling:
-    """Test RAG system error handling"""
+class TestRAGSystemDirectResponses:
+    """Test queries answered without calling Claude"""
 
-    def test_query_ai_generator_error(self, mock_rag_system):
-        """Test handling of AI generator errors"""
-        # Setup
-        mock_rag_system.mock_ai_generator.generate_response_sequential.side_effect = (
-            Exception("API Error")
-        )
+    @pytest.mark.parametrize(
+        "query, expected",
+        [
+            ("", "Please enter a question."),
+            ("   \n", "Please enter a question."),
+            ("Hello!", "Hello! Ask me anything about the course materials."),
+            ("thanks", "You're welcome! Let me know if you have other questions."),
+        ],
+    )
+    def test_trivial_queries_skip_ai_generator(self, mock_rag_system, query, expected):
+        """Test that empty and canned queries are answered directly"""
+        response, sources = mock_rag_system.query(query, session_id="test_session")
 
-        # Execute and verify it raises the exception (or handle gracefully based on implementation)
-        with pytest.raises(Exception) as exc_info:
-            mock_rag_system.query("What is MCP?")
-
-        assert str(exc_info.value) == "API Error"
+        assert response == expected
+        assert sources == []
+        mock_rag_system.mock_ai_generator.generate_response_sequential.assert_not_called()
+        mock_rag_system.mock_session_manager.add_exchange.assert_not_called()
 
-    def test_query_session_manager_error(self, mock_rag_system):
-        """Test handling of session manager errors"""
-        # Setup
-        mock_rag_system.session_manager.get_conversation_history.side_effect = (
-            Exception("Session Error")
+    def test_overlong_query_rejected(self, mock_rag_system, test_config):
+        """Test that queries over the configured length are rejected"""
+        response, sources = mock_rag_system.query(
+            "x" * (test_config.MAX_QUERY_LENGTH + 1)
         )
+
+        assert "too long" in response
+        assert sources == []
+        mock_rag_system.mock_ai_generator.generate_response_sequential.assert_not_called()
+
+    def test_greeting_inside_question_reaches_ai_generator(self, mock_rag_system):
+        """Test that only whole-message greetings get canned replies"""
         mock_rag_system.mock_ai_generator.generate_response_sequential.return_value = (
-            "Test response"
+            "MCP stands for Model Context Protocol."
         )
 
-        # Execute - should handle gracefully or raise
-        with pytest.raises(Exception) as exc_info:
-            mock_rag_system.query("test query", session_id="test_session")
+        response, _ = mock_rag_system.query("Hello, what is MCP?")
+
+        assert response == "MCP stands for Model Context Protocol."
+        mock_rag_system.mock_ai_generator.generate_response_sequential.assert_called_once()
+
 
-        assert str(exc_info.value) == "Session Error"
+class TestRAGSystemErrorHandling:
+    """Test RAG system error handling"""
 
-    def test_query_source_handling_error(self, mock_rag_system):
-        """Test handling of source retrieval errors"""
+    @pytest.mark.parametrize(
+        "attr, msg",
+        [
+            ("mock_ai_generator.generate_response_sequential", "API Error"),
+            ("session_manager.get_conversation_history", "Session Error"),
+            ("tool_manager.get_last_sources", "Source Error"),
+        ],
+        ids=["ai_generator", "session_manager", "source_handling"],
+    )
+    def test_query_dependency_error_propagates(self, mock_rag_system, attr, msg):
+        """Test that a failing dependency's error reaches the caller unchanged"""
         # Setup
-        mock_rag_system.tool_manager.get_last_sources.side_effect = Exception(
-            "Source Error"
-        )
         mock_rag_system.mock_ai_generator.generate_response_sequential.return_value = (
             "Test response"
         )
+        attrgetter(attr)(mock_rag_system).side_effect = RuntimeError(msg)
 
-        # Execute - should handle gracefully or raise
-        with pytest.raises(Exception) as exc_info:
-            mock_rag_system.query("test query")
+        # Execute and verify
+        with pytest.raises(RuntimeError, match=msg):
+            mock_rag_system.query("test query", session_id="test_session")
 
-        assert str(exc_info.value) == "Source Error"
 
+class TestRAGSystemIntegration:
+    """Test RAG system end-to-end integration"""
 
-class TestRAGSystemContentTypes:
-    """Test RAG system handling different types of content queries"""
+    @pytest.fixture
+    def patched_rag_deps(self):
+        """RAGSystem's heavy dependencies, patched together and pre-configured"""
+        with patch.multiple(
+            "rag_system",
+            DocumentProcessor=DEFAULT,
+            VectorStore=DEFAULT,
+            AIGenerator=DEFAULT,
+            SessionManager=DEFAULT,
+        ) as mocks:
+            ai_generator = mocks["AIGenerator"].return_value
+            ai_generator.generate_response_sequential.return_value = "Test AI response"
+            session_manager = mocks["SessionManager"].return_value
+            session_manager.get_conversation_history.return_value = None
+            yield mocks
+
+    @pytest.mark.integration
+    def test_full_workflow_with_real_components(self, test_config, patched_rag_deps):
+        """Test full workflow with minimal mocking"""
+        # Create RAG system
+        rag_system = RAGSystem(test_config)
 
-    def test_specific_course_content_query(self, mock_rag_system):
-        """Test query about specific course content"""
-        # Setup
-        mock_rag_system.mock_ai_generator.generate_response_sequential.return_value = (
-            "MCP servers handle data processing."
-        )
-        mock_rag_system.tool_manager.get_last_sources.return_value = [
-            {
-                "text": "Introduction to MCP - Lesson 2",
-                "link": "https://example.com/lesson2",
-            }
-        ]
+        # Execute query
+        response, sources = rag_system.query("What is MCP?", session_id="test_session")
 
-        # Execute
-        response, sources = mock_rag_system.query("How do MCP servers work?")
+        # Verify tools were registered
+        assert len(rag_system.tool_manager.tools) == 2
+        assert "search_course_content" in rag_system.tool_manager.tools
+        assert "get_course_outline" in rag_system.tool_manager.tools
 
-        # Verify
-        assert "MCP servers handle data processing" in response
-        assert len(sources) == 1
-        assert "Lesson 2" in sources[0]["text"]
-
-    def test_course_outline_query(self, mock_rag_system):
-        """Test query requesting course structure/outline"""
-        # Setup - AI should use outline tool for this type of query
-        mock_rag_system.mock_ai_generator.generate_response_sequential.return_value = """**Course Title:** Introduction to MCP
-**Instructor:** John Doe
-**Lessons (2 total):**
-- Lesson 1: What is MCP?
-- Lesson 2: MCP Architecture"""
+        # Verify response
+        assert response == "Test AI response"
 
-        mock_rag_system.tool_manager.get_last_sources.return_value = [
-            {"text": "Introduction to MCP", "link": "https://example.com/mcp-intro"}
-        ]
+    def test_tool_registration(self, mock_rag_system):
+        """Test that tools are properly registered with tool manager"""
+        # Verify both tools are registered in the tools dict
+        assert len(mock_rag_system.tool_manager.tools) >= 2
+        assert "search_course_content" in mock_rag_system.tool_manager.tools
+        assert "get_course_outline" in mock_rag_system.tool_manager.tools
 
-        # Execute
-        response, sources = mock_rag_system.query("What lessons are in the MCP course?")
+    @pytest.mark.integration
+    def test_configuration_usage(self, test_config, patched_rag_deps):
+        """Test that configuration values are properly used"""
+        # Create RAG system
+        RAGSystem(test_config)
 
-        # Verify
-        assert "Course Title" in response
-        assert "Lesson 1: What is MCP?" in response
-        assert "Lesson 2: MCP Architecture" in response
+        # Verify configuration was used correctly
+        patched_rag_deps["DocumentProcessor"].assert_called_once_with(
+            test_config.CHUNK_SIZE, test_config.CHUNK_OVERLAP
+        )
 
-    def test_general_knowledge_query(self, mock_rag_system):
-        """Test general knowledge query that might not need course search"""
-        # Setup - AI responds with general knowledge
-        mock_rag_system.mock_ai_generator.generate_response_sequential.return_value = (
-            "Machine learning is a subset of AI."
+        patched_rag_deps["VectorStore"].assert_called_once_with(
+            test_config.CHROMA_PATH,
+            test_config.EMBEDDING_MODEL,
+            test_config.MAX_RESULTS,
         )
-        mock_rag_system.tool_manager.get_last_sources.return_value = (
-            []
-        )  # No course sources
 
-        # Execute
-        response, sources = mock_rag_system.query("What is machine learning?")
+        patched_rag_deps["AIGenerator"].assert_called_once_with(
+            test_config.ANTHROPIC_API_KEY,
+            test_config.ANTHROPIC_MODEL,
+            response_cache=ANY,
+        )
 
-        # Verify
-        assert response == "Machine learning is a subset of AI."
-        assert sources == []
+        patched_rag_deps["SessionManager"].assert_called_once_with(
+            test_config.MAX_HISTORY
+        )
 
-    def test_complex_multi_course_query(self, mock_rag_system):
-        """Test complex query that might span multiple courses"""
+
+class TestRAGSystemResponseCache:
+    """Test exact-repeat answers served from the response cache"""
+
+    def test_query_cache_hit_skips_ai_generator(self, mock_rag_system):
+        """Test that a repeated query is answered without calling the AI"""
         # Setup
-        mock_rag_system.mock_ai_generator.generate_response_sequential.return_value = "Both MCP and REST APIs are communication protocols, but MCP is specifically designed for AI contexts."
+        generate = mock_rag_system.mock_ai_generator.generate_response_sequential
+        generate.return_value = "MCP stands for Model Context Protocol."
         mock_rag_system.tool_manager.get_last_sources.return_value = [
-            {
-                "text": "Introduction to MCP - Lesson 1",
-                "link": "https://example.com/mcp/lesson1",
-            },
-            {
-                "text": "API Design Course - Lesson 3",
-                "link": "https://example.com/api/lesson3",
-            },
+            {"text": "Introduction to MCP - Lesson 1", "link": None}
         ]
 
         # Execute
-        response, sources = mock_rag_system.query("Compare MCP with REST APIs")
+        first = mock_rag_system.query("What is MCP?")
+        second = mock_rag_system.query("  what is MCP?")
 
         # Verify
-        assert "communication protocols" in response
-        assert len(sources) == 2
-        assert any("MCP" in source["text"] for source in sources)
-        assert any("API Design" in source["text"] for source in sources)
+        assert generate.call_count == 1
+        assert second == first
+
+    def test_history_change_misses_cache(self, mock_rag_system):
+        """Test that the same query under new conversation history is re-asked"""
+        generate = mock_rag_system.mock_ai_generator.generate_response_sequential
+        generate.return_value = "Test response"
+        history = mock_rag_system.session_manager.get_conversation_history
+        history.side_effect = ["User: Hi", "User: Hi\nUser: What is MCP?"]
+
+        mock_rag_system.query("What is MCP?", session_id="test_session")
+        mock_rag_system.query("What is MCP?", session_id="test_session")
+
+        assert generate.call_count == 2
+
+    def test_failed_answer_not_cached(self, mock_rag_system):
+        """Test that a fallback reply after an error is not served again"""
+        generate = mock_rag_system.mock_ai_generator.generate_response_sequential
+        generate.side_effect = iter(
+            (
+                FallbackResponse(
+                    "I encountered an error while processing your request: timeout"
+                ),
+                "MCP stands for Model Context Protocol.",
+            )
+        )
 
+        first, _ = mock_rag_system.query("What is MCP?")
+        second, _ = mock_rag_system.query("What is MCP?")
 
-class TestRAGSystemIntegration:
-    """Test RAG system end-to-end integration"""
+        assert first.startswith("I encountered an error")
+        assert second == "MCP stands for Model Context Protocol."
+        assert generate.call_count == 2
 
-    def test_full_workflow_with_real_components(self, test_config):
-        """Test full workflow with minimal mocking"""
-        # This test uses real components where possible
-        with (
-            patch("rag_system.DocumentProcessor") as mock_doc_processor,
-            patch("rag_system.VectorStore") as mock_vector_store_class,
-            patch("rag_system.AIGenerator") as mock_ai_generator_class,
-            patch("rag_system.SessionManager") as mock_session_manager_class,
-        ):
-
-            # Setup mocks
-            mock_vector_store = Mock()
-            mock_vector_store_class.return_value = mock_vector_store
-
-            mock_ai_generator = Mock()
-            mock_ai_generator.generate_response_sequential.return_value = (
-                "Test AI response"
-            )
-            mock_ai_generator_class.return_value = mock_ai_generator
+    def test_course_data_change_clears_cache(self, mock_rag_system):
+        """Test that new course data invalidates cached answers"""
+        generate = mock_rag_system.mock_ai_generator.generate_response_sequential
+        generate.return_value = "Test response"
 
-            mock_session_manager = Mock()
-            mock_session_manager.get_conversation_history.return_value = None
-            mock_session_manager_class.return_value = mock_session_manager
+        mock_rag_system.query("What is MCP?")
+        mock_rag_system.mock_vector_store.generation += 1
+        with patch.object(mock_rag_system.semantic_cache, "clear") as semantic_clear:
+            mock_rag_system.query("What is MCP?")
 
-            # Create RAG system
-            rag_system = RAGSystem(test_config)
+        assert generate.call_count == 2
+        semantic_clear.assert_called_once_with()
 
-            # Execute query
-            response, sources = rag_system.query(
-                "What is MCP?", session_id="test_session"
-            )
 
-            # Verify components were initialized
-            mock_doc_processor.assert_called_once_with(
-                test_config.CHUNK_SIZE, test_config.CHUNK_OVERLAP
-            )
-            mock_vector_store_class.assert_called_once_with(
-                test_config.CHROMA_PATH,
-                test_config.EMBEDDING_MODEL,
-                test_config.MAX_RESULTS,
-            )
-            mock_ai_generator_class.assert_called_once_with(
-                test_config.ANTHROPIC_API_KEY, test_config.ANTHROPIC_MODEL
-            )
+class TestRAGSystemAsyncQuery:
+    """Test concurrent queries through the async aquery path"""
 
-            # Verify tools were registered
-            assert len(rag_system.tool_manager.tools) == 2
-            assert "search_course_content" in rag_system.tool_manager.tools
-            assert "get_course_outline" in rag_system.tool_manager.tools
+    @pytest.mark.anyio
+    async def test_aquery_concurrent_batch(self, mock_rag_system):
+        """Test that gathered queries overlap and keep their own sources"""
 
-            # Verify response
-            assert response == "Test AI response"
+        # Setup: each answer searches for its own prompt, then waits for a
+        # partner call to be in flight too; run serially, the barrier breaks
+        overlap = threading.Barrier(2, timeout=5)
 
-    def test_tool_registration(self, mock_rag_system):
-        """Test that tools are properly registered with tool manager"""
-        # Verify both tools are registered in the tools dict
-        assert len(mock_rag_system.tool_manager.tools) >= 2
-        assert "search_course_content" in mock_rag_system.tool_manager.tools
-        assert "get_course_outline" in mock_rag_system.tool_manager.tools
+        def fake_generate(query, tool_manager, **_):
+            tool_manager.execute_tool("search_course_content", query=query)
+            overlap.wait()
+            return f"answer to {query}"
 
-    def test_configuration_usage(self, test_config):
-        """Test that configuration values are properly used"""
-        with (
-            patch("rag_system.DocumentProcessor") as mock_doc_processor,
-            patch("rag_system.VectorStore") as mock_vector_store_class,
-            patch("rag_system.AIGenerator") as mock_ai_generator_class,
-            patch("rag_system.SessionManager") as mock_session_manager_class,
-        ):
-
-            # Create RAG system
-            RAGSystem(test_config)
-
-            # Verify configuration was used correctly
-            mock_doc_processor.assert_called_once_with(
-                test_config.CHUNK_SIZE, test_config.CHUNK_OVERLAP
-            )
-
-            mock_vector_store_class.assert_called_once_with(
-                test_config.CHROMA_PATH,
-                test_config.EMBEDDING_MODEL,
-                test_config.MAX_RESULTS,
+        generate = mock_rag_system.mock_ai_generator.generate_response_sequential
+        generate.side_effect = fake_generate
+        mock_rag_system.mock_vector_store.search.side_effect = (
+            lambda query, **_: SearchResults(
+                documents=[query],
+                metadata=[{"course_title": query, "lesson_number": None}],
+                distances=[0.1],
             )
+        )
 
-            mock_ai_generator_class.assert_called_once_with(
-                test_config.ANTHROPIC_API_KEY, test_config.ANTHROPIC_MODEL
-            )
+        # Execute
+        results = await asyncio.gather(
+            *(mock_rag_system.aquery(f"q{i}") for i in range(8))
+        )
 
-            mock_session_manager_class.assert_called_once_with(test_config.MAX_HISTORY)
+        # Verify
+        assert generate.call_count == 8
+        for i, (response, sources) in enumerate(results):
+            prompt = f"{QUERY_PROMPT_PREFIX}q{i}"
+            assert response == f"answer to {prompt}"
+            assert sources == [{"text": prompt, "link": None}]
 
 
 class TestRAGSystemAnalytics:
@@ -0,0 +1,69 @@
+"""Tests for VectorStore query embedding reuse"""
+
+from unittest.mock import Mock, patch
+
+import pytest
+from vector_store import VectorStore
+
+
+@pytest.fixture
+def vector_store():
+    """VectorStore with mocked ChromaDB client and embedding model"""
+    with (
+        patch("vector_store.chromadb.PersistentClient"),
+        patch(
+            "vector_store.chromadb.utils.embedding_functions."
+            "SentenceTransformerEmbeddingFunction"
+        ) as mock_embedding_class,
+    ):
+        embedding_function = Mock(side_effect=lambda texts: [[0.1, 0.2, 0.3]])
+        mock_embedding_class.return_value = embedding_function
+        store = VectorStore("./test_chroma_db", "all-MiniLM-L6-v2", max_results=3)
+
+    store.course_content.query.return_value = {
+        "documents": [["MCP content"]],
+        "metadatas": [[{"course_title": "Introduction to MCP", "lesson_number": 1}]],
+        "distances": [[0.1]],
+    }
+    return store
+
+
+class TestVectorStoreQueryEmbeddings:
+    """Test caching of query embeddings across searches"""
+
+    def test_repeat_query_embedded_once(self, vector_store):
+        """Test that a repeated query reuses its cached embedding"""
+        vector_store.search("What is MCP?")
+        results = vector_store.search("What is MCP?")
+
+        assert results.documents == ["MCP content"]
+        vector_store.embedding_function.assert_called_once_with(["What is MCP?"])
+        call_kwargs = vector_store.course_content.query.call_args[1]
+        assert call_kwargs["query_embeddings"] == [[0.1, 0.2, 0.3]]
+        assert "query_texts" not in call_kwargs
+
+    def test_course_name_resolution_uses_cache(self, vector_store):
+        """Test that course name lookups share the embedding cache"""
+        vector_store.course_catalog.query.return_value = {
+            "documents": [["Introduction to MCP"]],
+            "metadatas": [[{"title": "Introduction to MCP"}]],
+        }
+
+        vector_store.search("What is MCP?", course_name="MCP")
+        vector_store.search("Lesson overview", course_name="MCP")
+
+        embedded = [call.args[0] for call in vector_store.embedding_function.mock_calls]
+        assert embedded == [["MCP"], ["What is MCP?"], ["Lesson overview"]]
+
+    def test_least_recently_used_embedding_evicted(self, vector_store):
+        """Test that the cache stays bounded by evicting the oldest query"""
+        vector_store.QUERY_EMBEDDING_CACHE_SIZE = 2
+
+        vector_store.search("first")
+        vector_store.search("second")
+        vector_store.search("first")
+        vector_store.search("third")
+        vector_store.search("first")
+        vector_store.search("second")
+
+        assert vector_store.embedding_function.call_count == 4
@@ -1,10 +1,11 @@
+import threading
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 import chromadb
 from chromadb.config import Settings
 from models import Course, CourseChunk
-from sentence_transformers import SentenceTransformer
 
 
 @dataclass
@@ -44,8 +45,13 @@ class SearchResults:
 class VectorStore:
     """Vector storage using ChromaDB for course content and metadata"""
 
+    # Number of recent query embeddings kept to skip repeat model inference
+    QUERY_EMBEDDING_CACHE_SIZE = 1024
+
     def __init__(self, chroma_path: str, embedding_model: str, max_results: int = 5):
         self.max_results = max_results
+        # Bumped on every write so readers can tell when cached data is stale
+        self.generation = 0
         # Initialize ChromaDB client
         self.client = chromadb.PersistentClient(
             path=chroma_path, settings=Settings(anonymized_telemetry=False)
@@ -58,6 +64,10 @@ class VectorStore:
             )
         )
 
+        # LRU of query text -> embedding; tools may search from several threads
+        self._query_embeddings: OrderedDict = OrderedDict()
+        self._query_embeddings_lock = threading.Lock()
+
         # Create collections for different types of data
         self.course_catalog = self._create_collection(
             "course_catalog"
@@ -107,7 +117,9 @@ class VectorStore:
 
         try:
             results = self.course_content.query(
-                query_texts=[query], n_results=search_limit, where=filter_dict
+                query_embeddings=[self._embed_query(query)],
+                n_results=search_limit,
+                where=filter_dict,
             )
             return SearchResults.from_chroma(results)
         except Exception as e:
@@ -116,7 +128,9 @@ class VectorStore:
     def _resolve_course_name(self, course_name: str) -> Optional[str]:
         """Use vector search to find best matching course by name"""
         try:
-            results = self.course_catalog.query(query_texts=[course_name], n_results=1)
+            results = self.course_catalog.query(
+                query_embeddings=[self._embed_query(course_name)], n_results=1
+            )
 
             if results["documents"][0] and results["metadatas"][0]:
                 # Return the title (which is now the ID)
@@ -126,6 +140,22 @@ class VectorStore:
 
         return None
 
+    def _embed_query(self, text: str):
+        """Embed a query, reusing the embedding of recently seen texts"""
+        with self._query_embeddings_lock:
+            embedding = self._query_embeddings.get(text)
+            if embedding is not None:
+                self._query_embeddings.move_to_end(text)
+                return embedding
+
+        embedding = self.embedding_function([text])[0]
+
+        with self._query_embeddings_lock:
+            self._query_embeddings[text] = embedding
+            if len(self._query_embeddings) > self.QUERY_EMBEDDING_CACHE_SIZE:
+                self._query_embeddings.popitem(last=False)
+        return embedding
+
     def _build_filter(
         self, course_title: Optional[str], lesson_number: Optional[int]
     ) -> Optional[Dict]:
@@ -179,6 +209,7 @@ class VectorStore:
             ],
             ids=[course.title],
         )
+        self.generation += 1
 
     def add_course_content(self, chunks: List[CourseChunk]):
         """Add course content chunks to the vector store"""
@@ -201,6 +232,7 @@ class VectorStore:
         ]
 
         self.course_content.add(documents=documents, metadatas=metadatas, ids=ids)
+        self.generation += 1
 
     def clear_all_data(self):
         """Clear all data from both collections"""
@@ -210,6 +242,7 @@ class VectorStore:
             # Recreate collections
             self.course_catalog = self._create_collection("course_catalog")
             self.course_content = self._create_collection("course_content")
+            self.generation += 1
         except Exception as e:
             print(f"Error clearing data: {e}")
 
@@ -291,3 +324,29 @@ class VectorStore:
             return None
         except Exception as e:
             print(f"Error getting lesson link: {e}")
+
+    def get_lesson_links_batch(
+        self, pairs: Iterable[Tuple[str, int]]
+    ) -> Dict[Tuple[str, int], Optional[str]]:
+        """Get lesson links for many (course title, lesson number) pairs at once"""
+        import json
+
+        links: Dict[Tuple[str, int], Optional[str]] = dict.fromkeys(pairs)
+        if not links:
+            return links
+
+        try:
+            # One catalog round trip for every course involved (title is the ID)
+            course_titles = list({course_title for course_title, _ in links})
+            results = self.course_catalog.get(ids=course_titles)
+            for metadata in results.get("metadatas") or []:
+                lessons_json = metadata.get("lessons_json")
+                if not lessons_json:
+                    continue
+                for lesson in json.loads(lessons_json):
+                    key = (metadata.get("title"), lesson.get("lesson_number"))
+                    if key in links:
+                        links[key] = lesson.get("lesson_link")
+        except Exception as e:
+            print(f"Error getting lesson links: {e}")
+        return links